@@ -0,0 +1,504 @@
+"""
+Numeric helpers shared by the analysis and comparison pages
+
+Everything here works on plain timestamp/steps dataframes and NumPy arrays and
+has no Dash dependencies, so it can be reused by any page and tested in
+isolation.
+"""
+import numpy as np
+import pandas as pd
+
+# Nominal sampling period of the logger, in minutes. Weighting each reading by
+# the time until the next one (capped at this value) keeps minute totals correct
+# when the spacing is not exactly 5 minutes — e.g. at the seam between two merged
+# datasets — and never counts an untracked gap as tracked time.
+SAMPLE_MINUTES = 5
+
+def interval_minutes(df):
+    """
+    Minutes attributable to each reading: the time until the next reading,
+    capped at SAMPLE_MINUTES and aligned to df's index. Reduces to a flat
+    SAMPLE_MINUTES for evenly-sampled data.
+    """
+    ordered = df.sort_values("timestamp")
+    mins = ordered["timestamp"].diff().shift(-1).dt.total_seconds().div(60)
+    mins = mins.clip(upper=SAMPLE_MINUTES).fillna(SAMPLE_MINUTES)
+    return mins.reindex(df.index)
+
+# ---------------------------------------------------------------------------
+# Rollups
+# ---------------------------------------------------------------------------
+
+# Resolution levels of the rollup pyramid and the pandas frequency of their bins.
+# Only the levels the views read are built: longer periods (weeks, months) are
+# grouped from the daily bins
+ROLLUP_LEVELS = {
+    "hour": "h",
+    "day": "D",
+}
+
+def _bin_grid(timestamps, level):
+    """Start of every bin of `level` from the first to the last reading, empty bins included."""
+    first, last = timestamps[0], timestamps[-1]
+    return pd.date_range(first.floor(ROLLUP_LEVELS[level]), last, freq=ROLLUP_LEVELS[level])
+
+def build_rollups(df):
+    """
+    Precompute the rollup pyramid of a dataset sorted by timestamp: for every
+    level in ROLLUP_LEVELS, the bin start times and the row position where each
+    bin begins, plus cumulative step and tracked-minute sums over the rows.
+    Any bin sum over any row range is then two lookups in the cumulative arrays
+    (see rollup), so range changes and tab switches never re-aggregate rows.
+
+    df: timestamp/steps dataframe sorted by timestamp
+    """
+    timestamps = df["timestamp"].to_numpy(dtype="datetime64[ns]")
+    steps = df["steps"].to_numpy(dtype=np.float64)
+    minutes = interval_minutes(df).to_numpy(dtype=np.float64)
+
+    pyramid = {
+        # Missing readings (NaN) add nothing, as in a resample sum
+        "cum_steps": np.concatenate(([0.0], np.nancumsum(steps))),
+        "cum_minutes": np.concatenate(([0.0], np.cumsum(minutes))),
+        "steps": steps,
+        "minutes": minutes,
+        "levels": {},
+    }
+    if len(df) == 0:
+        return pyramid
+
+    first_last = pd.DatetimeIndex([timestamps[0], timestamps[-1]])
+    for level in ROLLUP_LEVELS:
+        grid = _bin_grid(first_last, level)
+        edges = np.searchsorted(timestamps, grid.values, side="left")
+        pyramid["levels"][level] = {
+            "timestamp": grid.values,
+            "edges": np.append(edges, len(timestamps)),
+        }
+    return pyramid
+
+def rollup(pyramid, level, lo=0, hi=None, threshold=None):
+    """
+    Aggregated bins of `level` over the rows [lo, hi) of the dataset: columns
+    timestamp (bin start), steps (sum), count (readings) and minutes (tracked
+    minutes), plus active_minutes when a threshold is given. Bins with no
+    readings have NaN steps (device off / not worn) rather than 0, so they are
+    never mistaken for a genuine zero-step reading. Bins at the range edges
+    only include the selected rows, matching a resample of the selection.
+
+    pyramid: result of build_rollups
+    level: one of ROLLUP_LEVELS
+    lo, hi: row positions of the selected range
+    threshold: active step threshold for the active_minutes column
+    """
+    n = len(pyramid["steps"])
+    hi = n if hi is None else min(hi, n)
+    bins = pyramid["levels"].get(level)
+    if lo >= hi or bins is None:
+        # Nothing selected: an empty, typed set of bins
+        lo = hi = 0
+        first, last = 0, -1
+        bins = {"timestamp": np.array([], dtype="datetime64[ns]"), "edges": np.zeros(1, dtype=np.int64)}
+    else:
+        # Bins holding the first and the last selected row
+        first = np.searchsorted(bins["edges"], lo, side="right") - 1
+        last = np.searchsorted(bins["edges"], hi - 1, side="right") - 1
+    bounds = np.clip(bins["edges"][first:last + 2], lo, hi)
+    start, stop = bounds[:-1], bounds[1:]
+
+    count = stop - start
+    steps = pyramid["cum_steps"][stop] - pyramid["cum_steps"][start]
+    steps[count == 0] = np.nan
+    out = pd.DataFrame({
+        "timestamp": bins["timestamp"][first:last + 1],
+        "steps": steps,
+        "count": count,
+        "minutes": pyramid["cum_minutes"][stop] - pyramid["cum_minutes"][start],
+    })
+
+    if threshold is not None:
+        active = np.where(pyramid["steps"][lo:hi] >= threshold, pyramid["minutes"][lo:hi], 0.0)
+        cum_active = np.concatenate(([0.0], np.cumsum(active)))
+        out["active_minutes"] = cum_active[stop - lo] - cum_active[start - lo]
+    return out
+
+# ---------------------------------------------------------------------------
+# Summary metrics
+# ---------------------------------------------------------------------------
+
+# Highest step value threshold_index keeps a bin for, far above the thresholds
+# offered by the sliders (1-100); higher readings share its bin, so corrupt
+# values cannot blow up the histograms
+MAX_THRESHOLD_BIN = 10_000
+
+def threshold_index(steps, minutes):
+    """
+    Step and tracked-minute totals of the readings at or above every step
+    value 0..max (up to MAX_THRESHOLD_BIN), from one histogram pass over the
+    step counts. Active totals for any threshold are then a lookup (see
+    active_totals).
+
+    Readings are binned by their step count rounded down, the rule
+    active_totals also applies to the threshold, so for whole-number
+    thresholds the totals match steps >= threshold exactly. Missing (NaN) and negative readings are
+    left out.
+
+    steps: step count of each reading
+    minutes: tracked minutes of each reading (see interval_minutes)
+    """
+    steps = np.asarray(steps, dtype=np.float64)
+    minutes = np.asarray(minutes, dtype=np.float64)
+    valid = np.isfinite(steps) & (steps >= 0)
+    if not valid.all():
+        steps, minutes = steps[valid], minutes[valid]
+    values = np.minimum(np.floor(steps), MAX_THRESHOLD_BIN).astype(np.int64)
+    step_hist = np.bincount(values, weights=steps)
+    minute_hist = np.bincount(values, weights=minutes)
+    # Suffix sums, with a trailing zero for thresholds above the maximum
+    return {
+        "steps": np.append(step_hist[::-1].cumsum()[::-1], 0.0),
+        "minutes": np.append(minute_hist[::-1].cumsum()[::-1], 0.0),
+    }
+
+def active_totals(index, threshold):
+    """
+    (active steps, active minutes) of the readings with steps >= threshold
+    (the threshold is rounded down, see threshold_index; thresholds above
+    MAX_THRESHOLD_BIN count as MAX_THRESHOLD_BIN)
+
+    index: result of threshold_index
+    threshold: active step threshold (scalar or array)
+    """
+    position = np.clip(np.floor(threshold), 0, min(len(index["steps"]) - 1, MAX_THRESHOLD_BIN)).astype(np.int64)
+    return index["steps"][position], index["minutes"][position]
+
+def threshold_sweep(index, n_days, thresholds=range(1, 101)):
+    """
+    Active steps and minutes (total and per day with data) for every threshold
+
+    index: result of threshold_index
+    n_days: number of days with data, for the per-day rate
+    thresholds: active step thresholds to evaluate
+    """
+    thresholds = np.asarray(thresholds)
+    active_steps, active_minutes = active_totals(index, thresholds)
+    return pd.DataFrame({
+        "threshold": thresholds,
+        "active_steps": active_steps.astype(np.int64),
+        "active_minutes": active_minutes,
+        "active_min_per_day": active_minutes / max(n_days, 1),
+    })
+
+def summary_metrics(timestamps, steps, minutes):
+    """
+    The threshold-independent summary values of a selection, computed
+    together from its arrays: total steps and minutes (all tracked minutes and
+    those of valid readings), the maximum reading and
+    when it occurred, the mean reading, the first/last timestamps and the
+    selection's threshold_index (see active_metrics). Returns None for an
+    empty selection.
+
+    timestamps: datetime64 array of the readings, sorted
+    steps: step count of each reading
+    minutes: tracked minutes of each reading (see interval_minutes)
+    """
+    if len(steps) == 0:
+        return None
+
+    # Missing readings (NaN) are skipped, as by the pandas reductions
+    valid = ~np.isnan(steps)
+    n_valid = int(np.count_nonzero(valid))
+    total_steps = float(np.nansum(steps))
+    max_idx = int(np.nanargmax(steps)) if n_valid else 0
+
+    return {
+        "total_steps": int(total_steps),
+        "total_minutes": float(minutes.sum()),
+        "valid_minutes": float(minutes[valid].sum()),
+        "max_steps": int(steps[max_idx]) if n_valid else 0,
+        "max_timestamp": pd.Timestamp(timestamps[max_idx]),
+        "mean_steps": total_steps / n_valid if n_valid else 0.0,
+        "start": pd.Timestamp(timestamps[0]),
+        "end": pd.Timestamp(timestamps[-1]),
+        "threshold_index": threshold_index(steps, minutes),
+    }
+
+def active_metrics(summary, threshold):
+    """
+    Active and inactive steps and minutes at threshold, looked up from a
+    summary_metrics result
+
+    summary: result of summary_metrics
+    threshold: active step threshold
+    """
+    active_steps, active_minutes = active_totals(summary["threshold_index"], threshold)
+    return {
+        "active_steps": int(active_steps),
+        "inactive_steps": summary["total_steps"] - int(active_steps),
+        "active_minutes": float(active_minutes),
+        # Missing readings are neither active nor inactive
+        "inactive_minutes": summary["valid_minutes"] - float(active_minutes),
+    }
+
+# ---------------------------------------------------------------------------
+# Per-series metrics
+# ---------------------------------------------------------------------------
+
+def days_with_data(df):
+    """Number of distinct calendar days that actually have readings."""
+    return int(df["timestamp"].dt.floor("D").nunique())
+
+def span_days(df):
+    """Calendar span of a series, inclusive, in days."""
+    return int((df["timestamp"].max() - df["timestamp"].min()).days) + 1
+
+def series_metrics(df, threshold, index=None):
+    """
+    Per-series summary metrics (rate-normalised where relevant). Active
+    minutes are looked up in the series' threshold index (see
+    threshold_index), which is built here unless passed in.
+    """
+    n_days = days_with_data(df) or 1
+    total_steps = int(df["steps"].sum())
+    if index is None:
+        index = threshold_index(df["steps"].to_numpy(), interval_minutes(df).to_numpy())
+    _, active_min_total = active_totals(index, threshold)
+    return {
+        "span_days": span_days(df),
+        "days_with_data": days_with_data(df),
+        "total_steps": total_steps,
+        "steps_per_day": round(total_steps / n_days, 1),
+        "active_min_per_day": round(active_min_total / n_days, 1)
+    }
+
+# ---------------------------------------------------------------------------
+# Gap breaks
+# ---------------------------------------------------------------------------
+
+# Any gap between consecutive readings longer than this is treated as an
+# untracked period: the line breaks across it instead of bridging two
+# tracked stretches (e.g. the seam between two merged datasets).
+GAP_THRESHOLD = pd.Timedelta("10min")
+
+def break_gaps(df):
+    """
+    Insert a single NaN-valued point in the middle of each untracked gap so a
+    line plot breaks across it rather than drawing a straight line between the
+    last reading before the gap and the first reading after it.
+
+    df: timestamp/steps dataframe (sorted by timestamp unless it is not)
+    """
+    if not df["timestamp"].is_monotonic_increasing:
+        df = df.sort_values("timestamp", kind="stable")
+    timestamps = df["timestamp"].to_numpy(dtype="datetime64[ns]")
+    diffs = np.diff(timestamps)
+    gaps = np.flatnonzero(diffs > GAP_THRESHOLD.to_timedelta64()) + 1
+    if len(gaps) == 0:
+        return df.reset_index(drop=True)
+
+    # The midpoints fall between their neighbours, so inserting them in place keeps the order
+    midpoints = timestamps[gaps - 1] + diffs[gaps - 1] // 2
+    return pd.DataFrame({
+        "timestamp": np.insert(timestamps, gaps, midpoints),
+        "steps": np.insert(df["steps"].to_numpy(dtype=np.float64), gaps, np.nan),
+    })
+
+# ---------------------------------------------------------------------------
+# Plot decimation
+# ---------------------------------------------------------------------------
+
+# Most points drawn for one raw (5-minute) trace. Longer ranges are reduced to
+# the lowest and highest reading of equal-size buckets, which keeps every peak
+# visible; zooming in re-queries the window at full resolution.
+MAX_PLOT_POINTS = 4000
+
+def downsample_minmax(values, max_points=MAX_PLOT_POINTS):
+    """
+    Sorted positions of the readings to draw: the minimum and maximum of each
+    of max_points / 2 equal-size buckets, plus the first and last reading and
+    every NaN (the gap breaks inserted by break_gaps). Everything is kept when
+    there are at most max_points readings.
+
+    values: step counts in plotting order
+    max_points: point budget for the trace
+    """
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+
+    n_buckets = max(max_points // 2, 1)
+    size = -(-n // n_buckets)
+    pad = n_buckets * size - n
+    missing = np.isnan(values)
+    # NaNs must never win a bucket; padding fills the last bucket
+    low = np.concatenate((np.where(missing, np.inf, values), np.full(pad, np.inf))).reshape(n_buckets, size)
+    high = np.concatenate((np.where(missing, -np.inf, values), np.full(pad, -np.inf))).reshape(n_buckets, size)
+    offsets = np.arange(n_buckets) * size
+
+    picks = np.concatenate((
+        offsets + low.argmin(axis=1),
+        offsets + high.argmax(axis=1),
+        np.flatnonzero(missing),
+        [0, n - 1],
+    ))
+    return np.unique(picks[picks < n])
+
+def decimated_trace(df):
+    """
+    Raw trace of a timestamp/steps dataframe ready to plot: broken across
+    untracked gaps (see break_gaps) and reduced to MAX_PLOT_POINTS points
+
+    df: timestamp/steps dataframe
+    """
+    trace = break_gaps(df)
+    return trace.iloc[downsample_minmax(trace["steps"].to_numpy(dtype=float))]
+
+def relayout_x_range(relayout_data):
+    """
+    New x-axis window from a Plotly relayoutData event: (start, end) after a
+    zoom or pan, (None, None) when the axis was reset, or None when the event
+    did not change the x-axis
+
+    relayout_data: relayoutData property of a dcc.Graph
+    """
+    if not relayout_data:
+        return None
+    if "xaxis.range[0]" in relayout_data and "xaxis.range[1]" in relayout_data:
+        return pd.Timestamp(relayout_data["xaxis.range[0]"]), pd.Timestamp(relayout_data["xaxis.range[1]"])
+    if "xaxis.range" in relayout_data:
+        start, end = relayout_data["xaxis.range"]
+        return pd.Timestamp(start), pd.Timestamp(end)
+    if relayout_data.get("xaxis.autorange"):
+        return None, None
+    return None
+
+def window(df, start, end):
+    """
+    Rows of a timestamp-sorted dataframe between start and end, plus one
+    reading on either side so the line runs to the edges of the window
+
+    df: timestamp/steps dataframe sorted by timestamp
+    start, end: window bounds (None for the whole dataframe)
+    """
+    if start is None:
+        return df
+    timestamps = df["timestamp"].to_numpy()
+    lo = max(int(np.searchsorted(timestamps, np.datetime64(start), side="left")) - 1, 0)
+    hi = int(np.searchsorted(timestamps, np.datetime64(end), side="right")) + 1
+    return df.iloc[lo:hi]
+
+# ---------------------------------------------------------------------------
+# Per-series features
+# ---------------------------------------------------------------------------
+
+_NS_PER_DAY = 24 * 60 * 60 * 10**9
+_NS_PER_HOUR = 60 * 60 * 10**9
+
+def series_features(df):
+    """
+    Everything the comparison views need from one series, computed together
+    in a single pass so no view re-aggregates the readings: span and totals,
+    the threshold index (see threshold_index), hourly and daily step totals
+    (NaN for untracked bins), the hour-of-day and weekday profiles, the
+    decimated raw trace and the per-reading inputs of features_trajectory.
+
+    df: timestamp/steps dataframe sorted by timestamp
+    """
+    ns = df["timestamp"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    steps = df["steps"].to_numpy()
+    minutes = interval_minutes(df).to_numpy()
+    start = pd.Timestamp(ns[0])
+    # Missing readings (NaN) add nothing to the totals and profiles
+    step_weights = np.nan_to_num(steps.astype(np.float64), nan=0.0)
+
+    # Calendar day number of each reading, and the distinct days with data
+    day = ns // _NS_PER_DAY
+    days = np.unique(day)
+    n_days = len(days)
+
+    # Average steps in each hour of day on a recorded day
+    hour = (ns // _NS_PER_HOUR) % 24
+    hour_total = np.bincount(hour, weights=step_weights, minlength=24)
+    hour_profile = np.where(np.bincount(hour, minlength=24) > 0, hour_total / max(n_days, 1), np.nan)
+
+    # Average daily total on each weekday (day 0 of the epoch was a Thursday)
+    weekday = (day + 3) % 7
+    weekday_total = np.bincount(weekday, weights=step_weights, minlength=7)
+    weekday_days = np.bincount((days + 3) % 7, minlength=7)
+    weekday_profile = weekday_total / np.where(weekday_days > 0, weekday_days, np.nan)
+
+    pyramid = build_rollups(df)
+    hourly = rollup(pyramid, "hour")
+    daily = rollup(pyramid, "day")
+
+    return {
+        "start": start,
+        "end": pd.Timestamp(ns[-1]),
+        "span_days": int((ns[-1] - ns[0]) // _NS_PER_DAY) + 1,
+        "days_with_data": n_days,
+        "total_steps": int(step_weights.sum()),
+        "threshold_index": threshold_index(steps, minutes),
+        "hourly": pd.Series(hourly["steps"].to_numpy(), index=pd.DatetimeIndex(hourly["timestamp"])),
+        "daily": pd.Series(daily["steps"].to_numpy(), index=pd.DatetimeIndex(daily["timestamp"])),
+        "hour_of_day": pd.Series(hour_profile, index=range(24)),
+        "day_of_week": pd.Series(weekday_profile, index=range(7)),
+        "raw_trace": decimated_trace(df),
+        "trajectory": {
+            "elapsed_day": (ns - ns[0]) // _NS_PER_DAY,
+            "day": day,
+            "steps": steps,
+            "minutes": minutes,
+        },
+    }
+
+def features_metrics(features, threshold):
+    """
+    Per-series summary metrics (see series_metrics) from a series_features result
+
+    features: result of series_features
+    threshold: active step threshold
+    """
+    n_days = features["days_with_data"] or 1
+    _, active_min_total = active_totals(features["threshold_index"], threshold)
+    return {
+        "span_days": features["span_days"],
+        "days_with_data": features["days_with_data"],
+        "total_steps": features["total_steps"],
+        "steps_per_day": round(features["total_steps"] / n_days, 1),
+        "active_min_per_day": round(active_min_total / n_days, 1)
+    }
+
+def features_trajectory(features, threshold, align, freq_days=7):
+    """
+    Per-day average of the active minutes within fixed-width bins, from a
+    series_features result. Returns (x_values, y_values) for the bins that
+    have readings.
+
+    features: result of series_features
+    threshold: active step threshold
+    align: "calendar" -> x is the absolute date of each bin start
+           "elapsed"  -> x is days since this series' own start
+    freq_days: bin width in days
+    """
+    # Weight each interval by its actual duration in minutes (capped at the
+    # sampling period) when active, else 0, so the trajectory averages to
+    # active minutes per day within each bin — correct even across merge
+    # seams where the spacing is not exactly 5 minutes.
+    inputs = features["trajectory"]
+    bins = inputs["elapsed_day"] // freq_days
+    day = inputs["day"]
+    total = np.bincount(bins, weights=np.where(inputs["steps"] >= threshold, inputs["minutes"], 0.0))
+
+    # Distinct calendar days per bin: readings are sorted, so every new
+    # (bin, day) pair starts where either of them changes
+    new_pair = np.ones(len(bins), dtype=bool)
+    new_pair[1:] = (bins[1:] != bins[:-1]) | (day[1:] != day[:-1])
+    n_days = np.bincount(bins[new_pair], minlength=len(total))
+
+    present = np.flatnonzero(n_days)
+    rate = total[present] / n_days[present]
+    if align == "elapsed":
+        x = present * freq_days
+    else:
+        x = features["start"] + pd.to_timedelta(present * freq_days, unit="D")
+    return x, rate
@@ -9,6 +9,7 @@ import atexit
 import os
 import logging
 import json
+import multiprocessing
 from threading import Timer
 import webbrowser
 
@@ -21,8 +22,11 @@ import requests
 from app_instance import app, socketio, server
 from pages.data_analysis_page import data_analysis_layout
 from pages.data_comparison_page import data_comparison_layout
+from pages.device_station_page import device_station_layout
 from pages.index_page import index_layout, register_index_callbacks
 import arduino
+import device_manager
+import upload_store
 
 # Register all index page callbacks before app runs
 register_index_callbacks()
@@ -40,7 +44,6 @@ app.layout = html.Div([
         style={"cursor":"pointer"}
     ),
     dcc.Store(id="action-modal-open-state", data=json.dumps({"is_open": False})),
-    html.Div(id="action-modal-status"),
     html.Div(id="page-content")
 ])
 
@@ -51,6 +54,8 @@ def display_page(pathname):
         return data_analysis_layout
     elif pathname == "/data-comparison":
         return data_comparison_layout
+    elif pathname == "/device-station":
+        return device_station_layout
     else:
         return index_layout()
 
@@ -129,6 +134,37 @@ def log():
     logging.info(f"Client log: {data['message']}")
     return jsonify(success=True)
 
+@server.route("/upload", methods=["POST"])
+def upload_start():
+    """
+    Start a chunked upload of a data file (see upload_store)
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        status = upload_store.start_upload(data["filename"], data["size"])
+    except (KeyError, TypeError, ValueError):
+        return jsonify(error="Invalid upload"), 400
+    logging.info(f"Receiving {data['filename']} ({data['size']} bytes)")
+    return jsonify(status)
+
+@server.route("/upload/<upload_id>", methods=["GET", "PUT"])
+def upload_chunk(upload_id):
+    """
+    Receive the next piece of a chunked upload (PUT), or report how much of it
+    has arrived so an interrupted upload can resume (GET)
+    """
+    if request.method == "PUT":
+        try:
+            offset = int(request.args.get("offset", 0))
+        except ValueError:
+            return jsonify(error="Invalid offset"), 400
+        status = upload_store.append_chunk(upload_id, offset, request.stream)
+    else:
+        status = upload_store.upload_status(upload_id)
+    if status is None:
+        return jsonify(error="Unknown upload"), 404
+    return jsonify(status)
+
 def clean_up():
     """
     Clean up existing resources
@@ -137,6 +173,7 @@ def clean_up():
     if hasattr(arduino, "arduino_serial"):
         arduino.disconnect_arduino()
         print("Arduino serial connection closed")
+    device_manager.close_all()
 
 atexit.register(clean_up)
 
@@ -156,6 +193,8 @@ def shutdown(port):
         pass
 
 if __name__ == "__main__":
+    # Needed for the comparison worker processes in the frozen Windows build
+    multiprocessing.freeze_support()
     reset_heartbeat_timer()
     port = 8050
     Timer(1, open_browser, args=[port]).start()
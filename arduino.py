@@ -1,142 +1,569 @@
 """
 Import Libraries
 """
+import calendar
+import json
+import os
 import time
 import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import RLock, Thread
 import serial
 from serial.tools import list_ports
 
+# Serial speed used to talk to the logger. It must match the firmware; raise it
+# here only together with a firmware that is configured for the faster rate.
+BAUD_RATE = 115200
+# Marker the firmware sends after the last byte of a data transfer
+END_DATA_MARKER = b"BJI_END_DATA"
+# Largest block requested from the serial port in a single read during a download
+READ_CHUNK_SIZE = 64 * 1024
+# Seconds without any incoming data after which a download is considered dropped
+READ_IDLE_TIMEOUT = 30
+# Minimum seconds between progress reports during a download
+PROGRESS_INTERVAL = 0.25
+# Reply of the firmware to the "?" handshake
+HELLO_RESPONSE = b"BJI_Hello There!"
+# Seconds the board needs to restart after its port is opened (opening resets it)
+RESET_DELAY = 2
+# Seconds to wait for the handshake reply; ports that stay silent are given up quickly
+HANDSHAKE_TIMEOUT = 0.5
+# Read timeout of an established connection, in seconds
+SERIAL_TIMEOUT = 1
+# Seconds an unused device session stays open before its port is released
+SESSION_IDLE_TIMEOUT = 10 * 60
+# Attempts to (re)connect the session, and the delay before the first retry
+# (doubled after each failed attempt)
+RECONNECT_ATTEMPTS = 3
+RECONNECT_BACKOFF = 0.5
+# Seconds to wait for the session while another operation (e.g. a download) holds it
+SESSION_WAIT_TIMEOUT = 5
+# Transfers of the device session retried after a dropped link before giving up
+DOWNLOAD_RETRIES = 3
+# Seconds between two readings of the logger, one record each
+RECORD_SECONDS = 5 * 60
+# Size of a record of the binary (.RAW) transfer: "<Q" epoch seconds and "<H" steps
+RAW_RECORD_BYTES = 10
+# Bytes at the start of a transfer used to estimate its size (see estimate_log_size)
+ESTIMATE_HEAD_BYTES = 256
+# Suffixes of a download's partial file, its journal and its CRC32 sidecar
+PARTIAL_SUFFIX = ".part"
+JOURNAL_SUFFIX = ".journal"
+CHECKSUM_SUFFIX = ".crc32"
+
+# Connection of the device session (see device_session)
 arduino_serial = None
+_session_used = 0.0
+_session_lock = RLock()
+_reaper = None
+
+# Ports held open by the device station (see device_manager); never probed here
+busy_ports = set()
+
+# Port of the logger that answered the last search, its USB identity and the
+# port list at that time, so the next search tries it first (see search_for_arduino)
+_last_device = None
+
+def probe_port(port, baudrate=BAUD_RATE):
+    """
+    Open port and return the serial connection if a BJI logger answers the
+    handshake, otherwise None
+
+    port: serial port name (e.g. COM3 or /dev/ttyACM0)
+    baudrate: serial speed, which must match the firmware
+    """
+    try:
+        ser = serial.Serial(port, baudrate, timeout=HANDSHAKE_TIMEOUT)
+    except (serial.SerialException, OSError):
+        return None
+    try:
+        # Opening the port resets the board; give the firmware time to start
+        time.sleep(RESET_DELAY)
+        ser.write(b"?")
+        if ser.readline().strip() == HELLO_RESPONSE:
+            ser.timeout = SERIAL_TIMEOUT
+            return ser
+    except (serial.SerialException, OSError):
+        pass
+    ser.close()
+    return None
+
+def probe_ports(ports, baudrate=BAUD_RATE):
+    """
+    Probe every port at the same time, so the whole scan takes as long as a
+    single probe. Returns {port: serial} of the ports where a logger answered.
+
+    ports: serial port names
+    baudrate: serial speed, which must match the firmware
+    """
+    if not ports:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(ports)) as pool:
+        connections = list(pool.map(lambda port: probe_port(port, baudrate), ports))
+    return {port: ser for port, ser in zip(ports, connections) if ser is not None}
+
+def available_ports():
+    """Port infos of the serial ports not held by the device station."""
+    return [port for port in list_ports.comports() if port.device not in busy_ports]
+
+def find_devices(baudrate=BAUD_RATE):
+    """
+    Connections to every BJI logger plugged in, as {port: serial}
+
+    baudrate: serial speed, which must match the firmware
+    """
+    return probe_ports([port.device for port in available_ports()], baudrate)
+
+def read_status(ser):
+    """
+    Status line of the logger on ser (e.g. b"FIRST_POWERON" or b"DATA_FILE_EXISTS")
+
+    ser: open serial connection to the logger
+    """
+    ser.write(b"!")
+    return ser.readline().strip()
+
+def send_initialization(ser, epoch_time):
+    """
+    Initialize the logger on ser to start counting at epoch_time
+
+    ser: open serial connection to the logger
+    epoch_time: start time in seconds since the epoch (UTC)
+    """
+    ser.write(b"i")
+    print(ser.readline())
+    ser.write(struct.pack("<Q", epoch_time))
+
+def _port_snapshot(ports):
+    """Identity of the plugged-in serial devices, to notice hotplug events."""
+    return frozenset((port.device, port.vid, port.pid, port.serial_number) for port in ports)
+
+def _usb_id(port):
+    """USB VID:PID and serial number of a port's device (None for non-USB ports)."""
+    if port.vid is None:
+        return None
+    return (port.vid, port.pid, port.serial_number)
+
+def _remember_device(port, ports):
+    """Record the port that answered so the next search tries it first."""
+    global _last_device
+    info = next((p for p in ports if p.device == port), None)
+    _last_device = {
+        "port": port,
+        "usb_id": _usb_id(info) if info is not None else None,
+        "snapshot": _port_snapshot(ports),
+    }
+
+def _preferred_ports(ports):
+    """
+    Ports to try before a full scan: the one that answered last time, or,
+    when devices were plugged or unplugged since, wherever a device with the
+    same USB identity is now. The cache is dropped when that device is gone.
+    """
+    global _last_device
+    if _last_device is None:
+        return []
+    if _port_snapshot(ports) == _last_device["snapshot"]:
+        return [_last_device["port"]]
+    # Hotplug: follow the device to its (possibly renamed) port
+    preferred = [p.device for p in ports if _last_device["usb_id"] and _usb_id(p) == _last_device["usb_id"]]
+    if not preferred:
+        _last_device = None
+    return preferred
 
 # Search for Arduino and establish a serial connection
-def search_for_arduino():
+def search_for_arduino(baudrate=BAUD_RATE):
     """
     Search for arduino when making serial connection
+
+    The port that answered last time is tried first, so reconnecting to the
+    same device opens (and resets) only that port. Otherwise every port is
+    probed at the same time with a short handshake timeout.
+
+    baudrate: serial speed, which must match the firmware
     """
-    available_ports = [port.device for port in list_ports.comports()]
-    # print("Available COM ports:")
-    for port in reversed(available_ports):
-        try:
-            # print(port)
-            ser = serial.Serial(port, 115200, timeout=1)
-            time.sleep(2)
-            ser.write(b"?")
-            response = ser.readline().strip()
+    ports = available_ports()
+    preferred = _preferred_ports(ports)
+    for port in preferred:
+        ser = probe_port(port, baudrate)
+        if ser is not None:
+            _remember_device(port, ports)
+            return ser
 
-            if response == b"BJI_Hello There!":
-                return ser
+    others = [p.device for p in ports if p.device not in preferred]
+    found = probe_ports(others, baudrate)
+    if not found:
+        return None
+    # Several loggers: keep the last port in list order, as the sequential search did
+    port = [p for p in others if p in found][-1]
+    for other, ser in found.items():
+        if other != port:
+            ser.close()
+    _remember_device(port, ports)
+    return found[port]
 
-        except serial.SerialException as e:
+def _session_alive(ser):
+    """Whether the logger on an open session still answers the handshake."""
+    try:
+        ser.reset_input_buffer()
+        ser.timeout = HANDSHAKE_TIMEOUT
+        ser.write(b"?")
+        return ser.readline().strip() == HELLO_RESPONSE
+    except (serial.SerialException, OSError):
+        return False
+    finally:
+        try:
+            ser.timeout = SERIAL_TIMEOUT
+        except (serial.SerialException, OSError):
+            pass
+
+def _close_session():
+    """Close the session's connection and release its port. Call with _session_lock held."""
+    global arduino_serial
+    if arduino_serial is not None:
+        busy_ports.discard(arduino_serial.port)
+        try:
             arduino_serial.close()
-            raise serial.SerialException("")
+        except (serial.SerialException, OSError):
+            pass
+        arduino_serial = None
 
-    return None
+def _reap_idle_session():
+    """Background loop closing the session once it has been idle for SESSION_IDLE_TIMEOUT."""
+    while True:
+        time.sleep(min(SESSION_IDLE_TIMEOUT, 60))
+        if _session_lock.acquire(blocking=False):
+            try:
+                if arduino_serial is not None and time.time() - _session_used > SESSION_IDLE_TIMEOUT:
+                    _close_session()
+                    print("Idle Arduino session closed")
+            finally:
+                _session_lock.release()
+
+def _connect_session(baudrate):
+    """
+    Open the session, retrying with a growing delay while the port of the
+    logger that answered before is still plugged in (the board may still be
+    rebooting). When no known logger is plugged in, a single scan decides.
+    Call with _session_lock held.
+    """
+    global arduino_serial, _reaper
+    delay = RECONNECT_BACKOFF
+    for attempt in range(RECONNECT_ATTEMPTS):
+        if attempt:
+            time.sleep(delay)
+            delay *= 2
+        arduino_serial = search_for_arduino(baudrate)
+        if arduino_serial is not None:
+            # Keep the device station from probing (and resetting) the session's port
+            busy_ports.add(arduino_serial.port)
+            if _reaper is None:
+                _reaper = Thread(target=_reap_idle_session, daemon=True)
+                _reaper.start()
+            return arduino_serial
+        # The search forgets the last logger once its port is gone: nothing to wait for
+        if _last_device is None:
+            break
+    raise ConnectionError("Arduino device not found.")
+
+@contextmanager
+def device_session(baudrate=BAUD_RATE):
+    """
+    Long-lived connection to the docked logger, shared by the status,
+    initialize and download paths
+
+    The port is opened (which resets the board) only when there is no session
+    yet, it has been idle for SESSION_IDLE_TIMEOUT or the logger stopped
+    answering; otherwise the open connection is reused after a quick
+    handshake. Only one operation uses the session at a time. Any error
+    inside the block closes the session so the next operation reconnects.
+
+    baudrate: serial speed, which must match the firmware
+    """
+    global _session_used
+    if not _session_lock.acquire(timeout=SESSION_WAIT_TIMEOUT):
+        raise ConnectionError("The device is busy with another operation.")
+    try:
+        if arduino_serial is not None:
+            if time.time() - _session_used > SESSION_IDLE_TIMEOUT or not _session_alive(arduino_serial):
+                _close_session()
+        ser = arduino_serial if arduino_serial is not None else _connect_session(baudrate)
+        try:
+            yield ser
+        except Exception:
+            _close_session()
+            raise
+        finally:
+            _session_used = time.time()
+    finally:
+        _session_lock.release()
 
 def disconnect_arduino():
     """
     Disconnect Arduino
     """
-    global arduino_serial
-    if arduino_serial:
-        arduino_serial.close()
-        arduino_serial = None
-        print("Arduino disconnected successfully")
+    with _session_lock:
+        if arduino_serial:
+            _close_session()
+            print("Arduino disconnected successfully")
 
 def get_device_status():
     """
     Fetch Arduino"s status while connecting
     """
-    global arduino_serial
-    arduino_serial = search_for_arduino()
-    if arduino_serial is not None:
+    with device_session() as ser:
         try:
-            arduino_serial.write(b"!")
-            response = arduino_serial.readline().strip()
+            response = read_status(ser)
             print("Received data: ", response)
             return response
         except Exception as e:
             print(f"Error getting status: {e}")
             raise serial.SerialException()
-    else:
-        raise ConnectionError("Arduino device not found.")
 
 def initialize_arduino(epoch_time):
     """
-    Initialize Arduino based on the specified time
+    Initialize Arduino based on the specified time. The logger powers down
+    afterwards, so the session is closed: the next operation reconnects
+    straight away instead of waiting for a handshake that cannot succeed.
 
     epoch_time: specified time (Datetime)
     """
-    global arduino_serial
+    if not epoch_time:
+        raise ValueError("Time was not specified.")
 
     # Send initialization command to Arduino
-    if epoch_time and arduino_serial:
+    with device_session() as ser:
         try:
-            arduino_serial.write(b"i")
-            print(arduino_serial.readline())
-            packed_data = struct.pack("<Q", epoch_time)
-            arduino_serial.write(packed_data)
+            send_initialization(ser, epoch_time)
         except serial.SerialException as e:
-            arduino_serial.close()
             print(e)
             raise serial.SerialException()
-    else:
-        raise ValueError("Time was not specified or Arduino is not connected.")
+        _close_session()
 
-    arduino_serial.close()
+def _read_journal(file_path, command):
+    """Bytes already received by an interrupted transfer of command to file_path (0 if none)."""
+    try:
+        with open(file_path + PARTIAL_SUFFIX + JOURNAL_SUFFIX, "r", encoding="utf-8") as f:
+            journal = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if journal.get("command") != command.decode():
+        return 0
+    return int(journal.get("received", 0))
+
+def _write_journal(file_path, command, received):
+    """Record how many bytes of the partial file are valid."""
+    with open(file_path + PARTIAL_SUFFIX + JOURNAL_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump({"command": command.decode(), "received": received, "updated": time.time()}, f)
 
-def download_file(file_path, get_readable=False):
+def estimate_log_size(head, get_readable, now=None):
     """
-    Download the stored data from Arduino
+    Estimated size in bytes of a whole transfer from its first bytes, or None
+    while that is not possible. The firmware reports no file size, but it
+    writes one record every RECORD_SECONDS from the first timestamp until
+    now, so the record count follows from that timestamp; the readable
+    transfer is assumed to continue with lines as long as its first one
+    (after a header line, which is skipped).
 
-    file_path: location to store the data file
-    get_readable: download .RAW or .CSV format (boolean)
+    head: first bytes of the transfer
+    get_readable: readable (.CSV) or binary (.RAW) transfer
+    now: current time as the device's wall-clock epoch seconds (default: now)
     """
-    global arduino_serial
-    
-    try:
-        with open(file_path, "wb") as file:
-            # Send "r" to the Arduino to initiate readable file transfer, or "t" for binary.
-            if get_readable == True:
-                arduino_serial.write(b"r")
-            else:
-                arduino_serial.write(b"t")
-            end_data_marker = b"BJI_END_DATA"
-            marker_position = 0  # Tracks the position within the end data marker
+    if now is None:
+        # The device keeps local wall-clock time as if it were UTC
+        now = calendar.timegm(time.localtime())
+    header_bytes = 0
+    if get_readable:
+        newline = head.find(b"\n")
+        if newline >= 0 and not head[:1].isdigit():
+            # A header line (e.g. "timestamp,steps"): estimate from the first record
+            header_bytes = newline + 1
+            newline = head.find(b"\n", header_bytes)
+        if newline < 0:
+            return None
+        try:
+            first = time.strptime(bytes(head[header_bytes:newline]).split(b",")[0].strip().decode(),
+                                  "%Y-%m-%d %H:%M:%S")
+        except (ValueError, UnicodeDecodeError):
+            return None
+        start, record_bytes = calendar.timegm(first), newline + 1 - header_bytes
+    else:
+        if len(head) < RAW_RECORD_BYTES:
+            return None
+        start, record_bytes = struct.unpack_from("<Q", head)[0], RAW_RECORD_BYTES
+    if not 0 < start <= now:
+        return None
+    return header_bytes + ((now - start) // RECORD_SECONDS + 1) * record_bytes
 
-            # Wait for data to become available
-            while arduino_serial.in_waiting == 0:
-                pass
+def _transfer(file_path, get_readable, progress, ser, size_hint=None):
+    """
+    Run one transfer into the partial file of file_path, resuming an
+    interrupted one. Returns the result dict of download_file.
+    """
+    command = b"r" if get_readable else b"t"
+    part_path = file_path + PARTIAL_SUFFIX
+    marker_len = len(END_DATA_MARKER)
 
-            data_buffer = bytearray()  # Buffer to store data
-            data_in_buffer = False
+    # The firmware always sends the whole file, so the bytes kept from an
+    # interrupted transfer are compared with the new stream instead of
+    # requested again; from the first difference on, the file is rewritten.
+    verify_end = _read_journal(file_path, command) if os.path.exists(part_path) else 0
+    resumed = verify_end
+    position = 0
+    crc = 0
+    # First bytes of the stream, until the size estimate is made
+    head = bytearray() if size_hint else None
+
+    with open(part_path, "ab"):
+        pass
+    with open(part_path, "r+b") as file:
+        file.truncate(verify_end)
+
+        def consume(data):
+            """Verify or write the next bytes of the stream."""
+            nonlocal position, verify_end, crc, head
+            crc = zlib.crc32(data, crc)
+            if head is not None:
+                head += data[:ESTIMATE_HEAD_BYTES - len(head)]
+                expected = estimate_log_size(head, get_readable)
+                if expected is not None or len(head) >= ESTIMATE_HEAD_BYTES:
+                    head = None
+                    if expected is not None:
+                        size_hint(expected)
+            if position < verify_end:
+                n = min(len(data), verify_end - position)
+                if file.read(n) == data[:n]:
+                    position += n
+                    data = data[n:]
+                    if position == verify_end:
+                        # Everything kept is verified; new bytes go after it
+                        file.seek(position)
+                else:
+                    # The device's data differs from what was kept: rewrite from here
+                    file.seek(position)
+                    file.truncate()
+                    verify_end = position
+            if data:
+                file.write(data)
+                position += len(data)
+
+        try:
+            # Send "r" to the Arduino to initiate readable file transfer, or "t" for binary.
+            try:
+                ser.write(command)
+            except OSError as e:
+                raise serial.SerialException(e) from e
+
+            start_time = time.perf_counter()
+            last_data_time = start_time
+            last_report = start_time
+            pending = bytearray()  # Unwritten bytes; only ever a possible partial marker between reads
 
             # Continuously read the data until the end marker is found
             while True:
-                if arduino_serial.in_waiting > 0:
-                    data = arduino_serial.read(1024)
-                    print(f"Received data: {data}")
-                    for byte in data:
-                        # Check for the end of marker sequence
-                        if byte == end_data_marker[marker_position]:
-                            data_buffer.append(byte)
-                            data_in_buffer = True
-                            marker_position += 1
-                            if marker_position == len(end_data_marker):
-                                break
-                        else:
-                            marker_position = 0
-                            if data_in_buffer:
-                                file.write(data_buffer)
-                                data_in_buffer = False
-                                data_buffer.clear()
-                            file.write(bytes([byte]))
-
-                    if marker_position == len(end_data_marker):
-                        break
-
-        file.close()
-        print("File downloaded successfully!")
-
-    except Exception as e:
+                # Take everything already buffered; block (up to the port timeout) for at least one byte.
+                # OSErrors of the port are link failures, unlike those of the file.
+                try:
+                    data = ser.read(min(max(ser.in_waiting, 1), READ_CHUNK_SIZE))
+                except OSError as e:
+                    raise serial.SerialException(e) from e
+                now = time.perf_counter()
+                if not data:
+                    if now - last_data_time > READ_IDLE_TIMEOUT:
+                        raise ConnectionError("No data received from the device.")
+                    continue
+                last_data_time = now
+
+                # Only the held-back tail plus the new block has to be searched
+                pending += data
+                end = pending.find(END_DATA_MARKER)
+                if end >= 0:
+                    consume(memoryview(pending)[:end])
+                    break
+
+                # Write everything that cannot be the start of the marker
+                cut = max(0, len(pending) - marker_len + 1)
+                consume(memoryview(pending)[:cut])
+                del pending[:cut]
+
+                if progress and now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    file.flush()
+                    _write_journal(file_path, command, max(position, verify_end))
+                    progress(position, position / (now - start_time))
+        except Exception:
+            # Keep what is valid so the next attempt can resume from it
+            try:
+                file.flush()
+                _write_journal(file_path, command, max(position, verify_end))
+            except OSError as journal_error:
+                print(f"Could not record the partial download: {journal_error}")
+            raise
+
+        # A stream shorter than the kept bytes ends the file early
+        file.truncate(position)
+    resumed = min(resumed, verify_end, position)
+
+    os.replace(part_path, file_path)
+    try:
+        os.remove(part_path + JOURNAL_SUFFIX)
+    except OSError:
+        pass
+    checksum = f"{crc:08x}"
+    with open(file_path + CHECKSUM_SUFFIX, "w", encoding="utf-8") as f:
+        f.write(f"{checksum}  {os.path.basename(file_path)}\n")
+
+    elapsed = max(time.perf_counter() - start_time, 1e-9)
+    rate = position / elapsed
+    if progress:
+        progress(position, rate)
+    print(f"File downloaded successfully! {position} bytes in {elapsed:.1f}s ({rate / 1024:.1f} KiB/s), CRC32 {checksum}")
+    return {"bytes": position, "seconds": elapsed, "rate": rate, "crc32": checksum, "resumed": resumed}
+
+def download_file(file_path, get_readable=False, progress=None, ser=None, size_hint=None):
+    """
+    Download the stored data from Arduino
+
+    Reads whatever the port has buffered in large blocks, searches for the end
+    marker with bytes.find (keeping the last few bytes back in case the marker
+    is split across reads) and writes whole slices to a partial file, which
+    replaces file_path once the transfer is complete.
+
+    If the link drops, the partial file and a journal of its valid length are
+    kept; the next download to the same path (retried automatically up to
+    DOWNLOAD_RETRIES times on the device session) checks the kept bytes
+    against the new stream and carries on from there. Link failures raise
+    ConnectionError; local errors (e.g. a full disk or a file that cannot be
+    written) are raised unchanged and never retried. The CRC32 of the
+    received stream is written next to the file (file_path + CHECKSUM_SUFFIX).
+
+    file_path: location to store the data file
+    get_readable: download .RAW or .CSV format (boolean)
+    progress: optional function called as progress(bytes_received, bytes_per_second)
+              at most every PROGRESS_INTERVAL seconds and once when complete
+    ser: serial connection to download from (default: the device session)
+    size_hint: optional function called once as size_hint(estimated_bytes) when
+               the size of the transfer can be estimated (see estimate_log_size)
+    Returns a dict with the bytes received, elapsed seconds, throughput, the
+    CRC32 (hex) and the number of bytes verified from an interrupted transfer.
+    """
+    if ser is None:
+        delay = RECONNECT_BACKOFF
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            try:
+                with device_session() as session_serial:
+                    return download_file(file_path, get_readable, progress, session_serial, size_hint)
+            except ConnectionError:
+                if attempt == DOWNLOAD_RETRIES:
+                    raise
+                print(f"Download interrupted, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay *= 2
+
+    try:
+        return _transfer(file_path, get_readable, progress, ser, size_hint)
+    except (serial.SerialException, ConnectionError) as e:
         print(f"Error downloading file: {e}")
-        raise ConnectionError()
+        raise ConnectionError("Connection to the device was lost; download again to resume the transfer.") from e
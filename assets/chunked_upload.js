@@ -0,0 +1,120 @@
+// Send files dropped on or selected in a "chunked-upload" box to the server in
+// pieces instead of letting dcc.Upload base64-encode them into one message.
+//
+// Each file is streamed to the /upload routes (see upload_store.py) in
+// CHUNK_BYTES pieces; if a request fails, the upload resumes from the number
+// of bytes the server reports it already holds. Once every file has arrived
+// the upload component's contents are set to the short markers returned by
+// the server, so the page callbacks run exactly as for a normal upload and
+// read the data straight from the server's copy of the file.
+
+(function () {
+    var CHUNK_BYTES = 4 * 1024 * 1024;
+    var MAX_RETRIES = 5;
+    var RETRY_DELAY_MS = 1000;
+
+    function sleep(ms) {
+        return new Promise(function (resolve) { setTimeout(resolve, ms); });
+    }
+
+    async function requestJSON(method, url, body, headers) {
+        var response = await fetch(url, { method: method, body: body, headers: headers });
+        if (!response.ok) {
+            throw new Error(method + " " + url + " failed with status " + response.status);
+        }
+        return response.json();
+    }
+
+    async function sendFile(file, onProgress) {
+        var status = await requestJSON("POST", "/upload",
+            JSON.stringify({ filename: file.name, size: file.size }),
+            { "Content-Type": "application/json" });
+        var url = "/upload/" + status.upload_id;
+        var retries = 0;
+
+        while (!status.complete) {
+            var offset = status.received;
+            try {
+                status = await requestJSON("PUT", url + "?offset=" + offset,
+                    file.slice(offset, offset + CHUNK_BYTES));
+                retries = 0;
+            } catch (err) {
+                if (++retries > MAX_RETRIES) {
+                    throw err;
+                }
+                logToServer("Upload of " + file.name + " interrupted at " + offset + " bytes, retrying: " + err);
+                await sleep(RETRY_DELAY_MS * retries);
+                try {
+                    // Resume from whatever the server actually holds
+                    status = await requestJSON("GET", url);
+                } catch (ignored) {
+                    // Server still unreachable: try the same piece again
+                }
+            }
+            onProgress(status.received);
+        }
+        return status.marker;
+    }
+
+    async function uploadFiles(zone, uploadId, files, multiple) {
+        var total = files.reduce(function (sum, file) { return sum + file.size; }, 0);
+        var done = 0;
+        var markers = [];
+        zone.setAttribute("data-busy", "true");
+        try {
+            for (var i = 0; i < files.length; i++) {
+                var file = files[i];
+                markers.push(await sendFile(file, function (received) {
+                    var percent = total ? Math.floor(100 * (done + received) / total) : 100;
+                    zone.setAttribute("data-progress", "Uploading " + file.name + " (" + percent + "%)");
+                }));
+                done += file.size;
+            }
+            zone.removeAttribute("data-progress");
+            var names = files.map(function (file) { return file.name; });
+            var modified = files.map(function (file) { return file.lastModified / 1000; });
+            window.dash_clientside.set_props(uploadId, multiple
+                ? { contents: markers, filename: names, last_modified: modified }
+                : { contents: markers[0], filename: names[0], last_modified: modified[0] });
+        } catch (err) {
+            logToServer("Upload failed: " + err);
+            zone.setAttribute("data-progress", "Upload failed, please select the file again");
+        } finally {
+            zone.removeAttribute("data-busy");
+        }
+    }
+
+    function intercept(event, files) {
+        // Without set_props, leave the upload to dcc.Upload
+        if (!window.dash_clientside || !window.dash_clientside.set_props) {
+            return;
+        }
+        var zone = event.target.closest && event.target.closest(".chunked-upload");
+        if (!zone || !files || !files.length) {
+            return;
+        }
+        // Keep the event from dcc.Upload so it never reads the file itself
+        event.preventDefault();
+        event.stopPropagation();
+        if (zone.hasAttribute("data-busy")) {
+            return;
+        }
+        var input = zone.querySelector("input[type=file]");
+        var multiple = !!(input && input.multiple);
+        var selected = Array.prototype.slice.call(files, 0, multiple ? files.length : 1);
+        if (input) {
+            // Allow selecting the same file again
+            input.value = "";
+        }
+        // dcc.Upload puts its id on the element wrapping the drop zone
+        uploadFiles(zone, zone.parentElement.id, selected, multiple);
+    }
+
+    window.addEventListener("change", function (event) {
+        intercept(event, event.target.files);
+    }, true);
+
+    window.addEventListener("drop", function (event) {
+        intercept(event, event.dataTransfer && event.dataTransfer.files);
+    }, true);
+})();
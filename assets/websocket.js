@@ -42,6 +42,23 @@ window.onload = function() {
         window.location.href = "/timeout";
     });
 
+    socket.on("download_progress", function(data) {
+        var el = document.getElementById("download-progress-text");
+        if (!el) {
+            return;
+        }
+        if (data.status !== "running") {
+            el.textContent = "";
+            return;
+        }
+        var text = "Received " + (data.bytes / 1024).toFixed(1) + " KiB at " +
+            (data.rate / 1024).toFixed(1) + " KiB/s";
+        if (data.eta !== null) {
+            text += ", about " + Math.ceil(data.eta) + " s remaining";
+        }
+        el.textContent = text;
+    });
+
     socket.on("disconnect", () => {
         logMessage("Socket disconnected");
         clearInterval(heartbeatInterval);
@@ -0,0 +1,170 @@
+"""
+Headless batch export of cohort-wide summary metrics
+
+Summarizes every data file in a directory without the Dash interface. Files
+are grouped by participant, quarter and device (see data_io.parse_filename);
+the files of one group (e.g. a download split over several transfers) are
+merged, and each group gets one row with the analysis page's summary values
+and the comparison page's per-series metrics. Groups are processed in
+parallel worker processes and the rows are written to a single CSV.
+
+Usage: python batch_export.py DATA_DIR [-o OUTPUT] [-t THRESHOLD] [-j WORKERS] [-r]
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+from analytics import active_metrics, interval_minutes, series_metrics, summary_metrics
+from data_io import is_supported, parse_filename, read_bytes
+from dataset_merge import merge_datasets, merged_frame
+
+# Active step threshold used when none is given (the slider's default)
+DEFAULT_THRESHOLD = 1
+
+# Columns of the consolidated CSV, in order
+SUMMARY_COLUMNS = [
+    "Participant", "Quarter", "Device", "Files",
+    "Collected Period Start", "Collected Period End", "Overlapping Files",
+    "Span (days)", "Days with data", "Active Step Threshold",
+    "Total Steps", "Total Minutes", "Active Steps", "Active Minutes",
+    "Max Steps", "Max Steps Timestamp", "Mean Steps (per 5 min)",
+    "Steps/day", "Active min/day", "Error",
+]
+
+def find_files(directory, recursive=False):
+    """
+    Paths of the supported data files in directory, sorted
+
+    directory: folder holding the participant files
+    recursive: also search its sub-folders
+    """
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files if is_supported(name))
+        if not recursive:
+            break
+    return sorted(paths)
+
+def group_files(paths):
+    """
+    Group file paths by the (pid, quarter, device) parsed from their names
+
+    paths: data file paths
+    """
+    groups = {}
+    for path in paths:
+        groups.setdefault(parse_filename(os.path.basename(path)), []).append(path)
+    return groups
+
+def summarize_group(pid, quarter, device, paths, threshold):
+    """
+    Summary row of one participant/quarter/device group. Runs in a worker
+    process; failures are reported in the row's "Error" column.
+
+    pid, quarter, device: group key (see parse_filename)
+    paths: data files of the group
+    threshold: active step threshold
+    """
+    row = dict.fromkeys(SUMMARY_COLUMNS, "")
+    row.update({
+        "Participant": pid,
+        "Quarter": quarter if quarter is not None else "",
+        "Device": device if device is not None else "",
+        "Files": ";".join(os.path.basename(p) for p in paths),
+    })
+    try:
+        dfs = []
+        for path in paths:
+            with open(path, "rb") as f:
+                dfs.append(read_bytes(f.read(), path))
+        merge = merge_datasets(dfs)
+        df = merged_frame(merge)
+
+        minutes = interval_minutes(df).to_numpy()
+        summary = summary_metrics(df["timestamp"].to_numpy(), df["steps"].to_numpy(), minutes)
+        active = active_metrics(summary, threshold)
+        per_series = series_metrics(df, threshold, summary["threshold_index"])
+    except Exception as e:
+        row["Error"] = str(e) or type(e).__name__
+        return row
+
+    row.update({
+        "Collected Period Start": summary["start"].strftime("%Y-%m-%d %H:%M"),
+        "Collected Period End": summary["end"].strftime("%Y-%m-%d %H:%M"),
+        "Overlapping Files": "yes" if merge["has_overlap"] else "",
+        "Span (days)": per_series["span_days"],
+        "Days with data": per_series["days_with_data"],
+        "Active Step Threshold": threshold,
+        "Total Steps": summary["total_steps"],
+        "Total Minutes": int(round(summary["total_minutes"])),
+        "Active Steps": active["active_steps"],
+        "Active Minutes": int(round(active["active_minutes"])),
+        "Max Steps": summary["max_steps"],
+        "Max Steps Timestamp": summary["max_timestamp"].strftime("%Y-%m-%d %H:%M"),
+        "Mean Steps (per 5 min)": round(summary["mean_steps"], 2),
+        "Steps/day": per_series["steps_per_day"],
+        "Active min/day": per_series["active_min_per_day"],
+    })
+    return row
+
+def _sort_key(row):
+    """Participants in numeric order where possible, then quarter and device."""
+    pid = str(row["Participant"])
+    return (not pid.isdigit(), int(pid) if pid.isdigit() else 0, pid,
+            str(row["Quarter"]).zfill(4), str(row["Device"]).zfill(4))
+
+def export_summary(directory, output, threshold=DEFAULT_THRESHOLD, workers=None, recursive=False):
+    """
+    Summarize every file group in directory into the CSV at output and return
+    the summary table
+
+    directory: folder holding the participant files
+    output: path of the consolidated CSV
+    threshold: active step threshold
+    workers: number of worker processes (default: one per CPU)
+    recursive: also search sub-folders of directory
+    """
+    groups = group_files(find_files(directory, recursive))
+    logging.info(f"Summarizing {len(groups)} file groups from {directory}")
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(summarize_group, pid, quarter, device, paths, threshold)
+            for (pid, quarter, device), paths in groups.items()
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            row = future.result()
+            if row["Error"]:
+                logging.warning(f"{row['Files']}: {row['Error']}")
+            logging.info(f"[{done}/{len(futures)}] {row['Files']}")
+            rows.append(row)
+
+    table = pd.DataFrame(sorted(rows, key=_sort_key), columns=SUMMARY_COLUMNS)
+    table.to_csv(output, index=False)
+    logging.info(f"Wrote {len(table)} rows to {output}")
+    return table
+
+def main():
+    parser = argparse.ArgumentParser(description="Export cohort-wide summary metrics of a folder of data files.")
+    parser.add_argument("directory", help="folder holding the CSV, .npz or .RAW files")
+    parser.add_argument("-o", "--output",
+                        default=f"cohort_summary_{datetime.now().strftime('%Y%m%d%H%M%S')}.csv",
+                        help="path of the consolidated CSV")
+    parser.add_argument("-t", "--threshold", type=int, default=DEFAULT_THRESHOLD, help="active step threshold")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("-r", "--recursive", action="store_true", help="also search sub-folders")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    export_summary(args.directory, args.output, args.threshold, args.workers, args.recursive)
+
+if __name__ == "__main__":
+    # Needed for worker processes in the frozen Windows build
+    multiprocessing.freeze_support()
+    main()
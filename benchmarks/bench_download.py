@@ -0,0 +1,92 @@
+"""
+Benchmark of device downloads against the simulated logger
+
+Runs arduino.download_file against benchmarks/fake_device.py for several log
+sizes, write patterns and both file formats, checks that the saved file is
+exactly the log the device sent (no end marker bytes leaked or lost, also
+when the marker arrives split across reads) and reports the throughput and
+the CPU time the download took in this process.
+
+Run from the repository root: python benchmarks/bench_download.py
+(--quick skips the largest log)
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+
+import serial
+
+from common import time_call
+from fake_device import CHUNK_PATTERNS, start_device
+
+import arduino
+
+# Log sizes: (label, bytes)
+SIZES = [
+    ("64 KiB", 64 * 1024),
+    ("1 MiB", 1024 * 1024),
+    ("16 MiB", 16 * 1024 * 1024),
+]
+
+# Transfer cases: (label, chunk pattern, position of the end marker split)
+CASES = [(pattern, pattern, 0) for pattern in CHUNK_PATTERNS] + [
+    ("split/bulk", "bulk", 5),
+    ("split/lines", "lines", len(arduino.END_DATA_MARKER) - 1),
+]
+
+def bench_case(size_label, size, case, pattern, split_marker, readable, path):
+    """Download one simulated log several times; prints and returns the table line."""
+    port, process, logs = start_device(size, pattern, split_marker)
+    expected = logs[b"r" if readable else b"t"]
+    try:
+        with serial.Serial(port, arduino.BAUD_RATE, timeout=arduino.SERIAL_TIMEOUT) as ser:
+            cpu = []
+
+            def download():
+                start = time.process_time()
+                # download_file reports every transfer; keep the table readable
+                with contextlib.redirect_stdout(io.StringIO()):
+                    arduino.download_file(path, readable, ser=ser)
+                cpu.append(time.process_time() - start)
+
+            repeat = 3 if size > 1024 * 1024 else 5
+            best, mean = time_call(download, repeat)
+    finally:
+        process.terminate()
+        process.join()
+
+    with open(path, "rb") as f:
+        status = "ok" if f.read() == expected else "MISMATCH"
+    line = (f"{size_label:<8} {'csv' if readable else 'raw':<4} {case:<13} {len(expected):>10} "
+            f"{len(expected) / best / 1024 / 1024:>10.1f} {min(cpu) * 1000:>10.1f} "
+            f"{100 * min(cpu) / best:>6.0f}% {mean * 1000:>10.1f}  {status}")
+    print(line, flush=True)
+    return line
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="skip the largest log")
+    args = parser.parse_args()
+
+    sizes = SIZES[:-1] if args.quick else SIZES
+    print(f"{'size':<8} {'fmt':<4} {'case':<13} {'bytes':>10} {'MiB/s':>10} {'CPU (ms)':>10} {'CPU':>7} "
+          f"{'mean (ms)':>10}  check")
+    print("-" * 86)
+    folder = tempfile.mkdtemp(prefix="bji_bench_download_")
+    path = os.path.join(folder, "download.bin")
+    mismatches = 0
+    for size_label, size in sizes:
+        for readable in (True, False):
+            for case, pattern, split_marker in CASES:
+                line = bench_case(size_label, size, case, pattern, split_marker, readable, path)
+                mismatches += line.endswith("MISMATCH")
+    shutil.rmtree(folder)
+    if mismatches:
+        raise SystemExit(f"{mismatches} download(s) did not match the device's log")
+
+if __name__ == "__main__":
+    main()
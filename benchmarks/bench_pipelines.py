@@ -0,0 +1,223 @@
+"""
+Benchmark suite of the analysis and comparison pipelines
+
+Times every pure helper and each page callback end to end on synthetic
+5-minute datasets of 1 week, 3 months, 1 year and 5 years, and the comparison
+page on 2 to 20 series. Results are printed and written to bench_output.txt
+in the repository root so runs can be compared over time.
+
+Run from the repository root: python benchmarks/bench_pipelines.py
+(--quick skips the 5-year dataset and the 20-series comparison)
+"""
+import argparse
+import platform
+import time
+
+import numpy as np
+import pandas as pd
+
+from common import OUTPUT_PATH, csv_bytes, raw_bytes, synthetic_dataset, time_call, upload_contents
+
+import analytics
+import data_io
+import dataset_cache
+import dataset_library
+import raw_decoder
+from app_instance import app
+import pages.data_analysis_page as analysis
+import pages.data_comparison_page as comparison
+from pages.index_page import register_index_callbacks
+
+# Single-dataset sizes: (label, days, gaps)
+DATASETS = [
+    ("1 week", 7, 5),
+    ("3 months", 91, 60),
+    ("1 year", 365, 250),
+    ("5 years", 5 * 365, 1250),
+]
+
+# Number of 3-month series compared at once
+SERIES_COUNTS = [2, 5, 10, 20]
+SERIES_DAYS = 91
+
+class Results:
+    """Collects timings and renders them as a fixed-width table."""
+    def __init__(self):
+        self.rows = []
+
+    def add(self, group, name, case, rows, func, repeat=5, setup=None):
+        best, mean = time_call(func, repeat, setup)
+        self.rows.append((group, name, case, rows, best, mean))
+        print(f"{group:<12} {name:<32} {case:<12} {rows:>9} {best * 1000:>11.2f} {mean * 1000:>11.2f}", flush=True)
+
+    def header(self):
+        return (f"{'group':<12} {'benchmark':<32} {'case':<12} {'rows':>9} {'best (ms)':>11} {'mean (ms)':>11}\n"
+                + "-" * 92)
+
+    def table(self):
+        lines = [self.header()]
+        for group, name, case, rows, best, mean in self.rows:
+            lines.append(f"{group:<12} {name:<32} {case:<12} {rows:>9} {best * 1000:>11.2f} {mean * 1000:>11.2f}")
+        return "\n".join(lines)
+
+def bench_helpers(results, label, df):
+    """Pure helpers of analytics and data_io on one dataset."""
+    n = len(df)
+    steps = df["steps"].to_numpy(dtype=np.float64)
+    minutes = analytics.interval_minutes(df).to_numpy()
+    pyramid = analytics.build_rollups(df)
+    index = analytics.threshold_index(steps, minutes)
+    csv = csv_bytes(df)
+    binary = data_io.write_binary(df)
+    raw = raw_bytes(df)
+    repeat = 3 if n > 100_000 else 5
+
+    results.add("io", "read_csv_bytes", label, n, lambda: data_io.read_csv_bytes(csv), repeat)
+    results.add("io", "write_binary", label, n, lambda: data_io.write_binary(df), repeat)
+    results.add("io", "read_binary", label, n, lambda: data_io.read_binary(binary), repeat)
+    results.add("io", "decode_raw", label, n, lambda: raw_decoder.decode_raw(raw), repeat)
+
+    results.add("analytics", "interval_minutes", label, n, lambda: analytics.interval_minutes(df), repeat)
+    results.add("analytics", "build_rollups", label, n, lambda: analytics.build_rollups(df), repeat)
+    for level in analytics.ROLLUP_LEVELS:
+        results.add("analytics", f"rollup[{level}]", label, n,
+                    lambda level=level: analytics.rollup(pyramid, level, 0, n), repeat)
+    results.add("analytics", "threshold_index", label, n, lambda: analytics.threshold_index(steps, minutes), repeat)
+    results.add("analytics", "threshold_sweep", label, n, lambda: analytics.threshold_sweep(index, 30), repeat)
+    results.add("analytics", "summary_metrics", label, n,
+                lambda: analytics.summary_metrics(df["timestamp"].to_numpy(), steps, minutes), repeat)
+    results.add("analytics", "break_gaps", label, n, lambda: analytics.break_gaps(df), repeat)
+    results.add("analytics", "downsample_minmax", label, n, lambda: analytics.downsample_minmax(steps), repeat)
+
+    results.add("analytics", "series_metrics", label, n, lambda: analytics.series_metrics(df, 30), repeat)
+    results.add("analytics", "series_features", label, n, lambda: analytics.series_features(df), repeat)
+    features = analytics.series_features(df)
+    results.add("analytics", "features_trajectory", label, n,
+                lambda: analytics.features_trajectory(features, 30, "calendar"), repeat)
+
+def bench_analysis_page(results, label, df):
+    """Data analysis page callbacks, from upload to every chart."""
+    n = len(df)
+    filename = "S1_1.1.csv"
+    contents = upload_contents(csv_bytes(df))
+    repeat = 3 if n > 100_000 else 5
+
+    # A cold upload parses the file and fills the dataset cache
+    results.add("analysis", "read_data (cold)", label, n,
+                lambda: analysis.read_data(contents, filename), repeat, setup=dataset_cache.clear)
+    results.add("analysis", "read_data (cached)", label, n, lambda: analysis.read_data(contents, filename), repeat)
+
+    raw_data = analysis.read_data(contents, filename)[0]
+    # Reopening from the dataset library loads the stored archive and rollups
+    library = dataset_library.LIBRARY_PREFIX + raw_data["key"]
+    results.add("analysis", "read_data (library)", label, n,
+                lambda: analysis.read_data(library, filename), repeat, setup=dataset_cache.clear)
+    analysis.read_data(contents, filename)
+    start, end = df["timestamp"].iloc[0], df["timestamp"].iloc[-1]
+    date_range = (start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"), "00", "00", "23", "55")
+    results.add("analysis", "update_selected_data", label, n,
+                lambda: analysis.update_selected_data(*date_range, raw_data), repeat)
+    selected = analysis.update_selected_data(*date_range, raw_data)
+
+    for unit in ("hour", "day", "month"):
+        results.add("analysis", f"aggregate_data[{unit}]", label, n,
+                    lambda unit=unit: analysis.aggregate_data(selected, unit), repeat)
+    results.add("analysis", "update_total_steps", label, n, lambda: analysis.update_total_steps(selected, 30), repeat)
+    results.add("analysis", "update_active_minutes", label, n,
+                lambda: analysis.update_active_minutes(selected, 30), repeat)
+    for tab in ("scatter-raw", "scatter-hourly", "scatter-daily"):
+        results.add("analysis", f"update_scatter[{tab.split('-')[1]}]", label, n,
+                    lambda tab=tab: analysis.update_scatter(tab, selected), repeat)
+    results.add("analysis", "update_sunburst", label, n, lambda: analysis.update_sunburst(selected), repeat)
+    for tab in ("boxwhisker-hourly", "boxwhisker-daily", "boxwhisker-monthly"):
+        results.add("analysis", f"update_boxwhisker[{tab.split('-')[1]}]", label, n,
+                    lambda tab=tab: analysis.update_boxwhisker(tab, selected), repeat)
+    results.add("analysis", "download_csv", label, n,
+                lambda: analysis.download_csv(filename, 1, selected, "csv"), repeat)
+    results.add("analysis", "download_sweep", label, n,
+                lambda: analysis.download_sweep(1, selected, filename), repeat)
+
+def bench_comparison_page(results, n_series):
+    """Data comparison page callbacks on n_series consecutive 3-month series."""
+    start = pd.Timestamp("2020-01-01")
+    frames, contents, filenames = [], [], []
+    for i in range(n_series):
+        df = synthetic_dataset(SERIES_DAYS, 60, start=start + pd.Timedelta(days=i * SERIES_DAYS), seed=i)
+        frames.append(df)
+        contents.append(upload_contents(csv_bytes(df)))
+        filenames.append(f"S1_{i + 1}.1.csv")
+    case = f"{n_series} series"
+    n = sum(len(df) for df in frames)
+    repeat = 3 if n_series > 5 else 5
+
+    results.add("comparison", "store_series (cold)", case, n,
+                lambda: comparison.store_series(contents, filenames), repeat, setup=dataset_cache.clear)
+    series = comparison.store_series(contents, filenames)[0]
+    results.add("comparison", "update_banner", case, n, lambda: comparison.update_banner(series), repeat)
+    results.add("comparison", "update_metrics", case, n, lambda: comparison.update_metrics(series, 30), repeat)
+    for tab in ("direct-raw", "direct-hourly", "direct-daily"):
+        results.add("comparison", f"update_direct[{tab.split('-')[1]}]", case, n,
+                    lambda tab=tab: comparison.update_direct(series, tab), repeat)
+    for align in ("calendar", "elapsed"):
+        results.add("comparison", f"update_trend[{align}]", case, n,
+                    lambda align=align: comparison.update_trend(series, align, 30, "weekly"), repeat)
+    results.add("comparison", "update_tod", case, n, lambda: comparison.update_tod(series), repeat)
+    results.add("comparison", "update_dow", case, n, lambda: comparison.update_dow(series), repeat)
+    results.add("comparison", "update_dist", case, n, lambda: comparison.update_dist(series), repeat)
+    results.add("comparison", "update_activity", case, n, lambda: comparison.update_activity(series, 30), repeat)
+    results.add("comparison", "download_values", case, n,
+                lambda: comparison.download_values(1, series, 30, None), repeat)
+    results.add("comparison", "download_sweep", case, n, lambda: comparison.download_sweep(1, series), repeat)
+
+def bench_merge(results, n_series):
+    """Index page merge of n_series overlapping 3-month uploads."""
+    merge_data = next(
+        entry["callback"].__wrapped__ for output, entry in app.callback_map.items()
+        if "download-merge-df-csv.data" in output
+    )
+    contents, filenames = [], []
+    n = 0
+    for i in range(n_series):
+        # Consecutive downloads overlap by a week, as when the device is re-read
+        start = pd.Timestamp("2020-01-01") + pd.Timedelta(days=i * (SERIES_DAYS - 7))
+        df = synthetic_dataset(SERIES_DAYS, 60, start=start, seed=i)
+        n += len(df)
+        contents.append(upload_contents(csv_bytes(df)))
+        filenames.append(f"S1_{i + 1}.1.csv")
+    case = f"{n_series} files"
+    repeat = 3 if n_series > 5 else 5
+
+    for filetype in ("csv", "binary"):
+        results.add("index", f"merge_data[{filetype}]", case, n,
+                    lambda filetype=filetype: merge_data(contents, 1, filenames, filetype), repeat)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="skip the largest dataset and series count")
+    args = parser.parse_args()
+
+    datasets = DATASETS[:-1] if args.quick else DATASETS
+    series_counts = SERIES_COUNTS[:-1] if args.quick else SERIES_COUNTS
+
+    register_index_callbacks()
+    results = Results()
+    print(results.header())
+    started = time.time()
+
+    for label, days, gaps in datasets:
+        df = synthetic_dataset(days, gaps)
+        bench_helpers(results, label, df)
+        bench_analysis_page(results, label, df)
+    for n_series in series_counts:
+        bench_comparison_page(results, n_series)
+        bench_merge(results, n_series)
+
+    with open(OUTPUT_PATH, "w") as f:
+        f.write(f"Benchmark run {time.strftime('%Y-%m-%d %H:%M:%S')} "
+                f"(Python {platform.python_version()}, pandas {pd.__version__}, numpy {np.__version__}, "
+                f"{time.time() - started:.0f} s)\n\n")
+        f.write(results.table() + "\n")
+    print(f"\nResults written to {OUTPUT_PATH}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Shared helpers of the benchmark scripts: synthetic datasets and timing
+
+The scripts are run directly from the repository root, e.g.
+python benchmarks/bench_pipelines.py
+"""
+import base64
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Keep the datasets ingested by the benchmarks out of the user's dataset library
+os.environ.setdefault("BJI_LIBRARY_DIR", tempfile.mkdtemp(prefix="bji_bench_library_"))
+
+import raw_decoder
+
+# Results of the benchmark runs, kept out of version control
+OUTPUT_PATH = os.path.join(ROOT, "bench_output.txt")
+
+# Readings per day at the logger's 5-minute resolution
+READINGS_PER_DAY = 288
+
+def synthetic_dataset(days, n_gaps=0, start="2024-01-01", seed=0):
+    """
+    Sorted 5-minute timestamp/steps dataframe spanning days, with n_gaps
+    untracked periods of 15 minutes to 3 hours removed. Steps follow a daily
+    rhythm with idle nights so threshold-based metrics see realistic values.
+
+    days: length of the recording
+    n_gaps: number of gaps to cut out
+    start: first timestamp
+    seed: random seed
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range(start, periods=days * READINGS_PER_DAY, freq="5min")
+    awake = (timestamps.hour >= 7) & (timestamps.hour < 22)
+    steps = rng.poisson(np.where(awake, 25, 1)) * (rng.random(len(timestamps)) > 0.4)
+
+    keep = np.ones(len(timestamps), dtype=bool)
+    if n_gaps:
+        for gap_start in rng.choice(len(timestamps), n_gaps, replace=False):
+            keep[gap_start:gap_start + rng.integers(3, 36)] = False
+        keep[0] = True
+    return pd.DataFrame({"timestamp": timestamps[keep], "steps": steps[keep]})
+
+def upload_contents(data, mime="text/csv"):
+    """
+    dcc.Upload contents string for raw file content
+
+    data: file content (bytes)
+    mime: media type reported by the browser
+    """
+    return f"data:{mime};base64," + base64.b64encode(data).decode("ascii")
+
+def csv_bytes(df):
+    """The app's headerless CSV export of a timestamp/steps dataframe."""
+    return df.to_csv(index=False, header=False, date_format="%Y-%m-%d %H:%M:%S").encode("utf-8")
+
+def raw_bytes(df):
+    """Device .RAW content holding the readings of df."""
+    records = np.empty(len(df), dtype=raw_decoder.RAW_RECORD_DTYPE)
+    records["timestamp"] = df["timestamp"].to_numpy(dtype="datetime64[s]").view(np.int64)
+    records["steps"] = df["steps"].to_numpy()
+    return records.tobytes()
+
+def time_call(func, repeat=5, setup=None):
+    """
+    Best and mean wall time of func() in seconds over repeat runs
+
+    func: function to time, called without arguments
+    repeat: number of timed runs
+    setup: function called before every run, not timed
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = timeit.default_timer()
+        func()
+        times.append(timeit.default_timer() - start)
+    return min(times), sum(times) / len(times)
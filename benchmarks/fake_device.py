@@ -0,0 +1,166 @@
+"""
+Simulated BJI logger on a pseudo-terminal
+
+Serves the firmware's serial protocol so arduino.py can be exercised and
+timed without hardware:
+
+    "?"  replies HELLO_RESPONSE
+    "!"  replies the device status (FIRST_POWERON or DATA_FILE_EXISTS)
+    "i"  replies OK, then reads the 8-byte "<Q" start time
+    "r"  streams the readable (.CSV) log followed by END_DATA_MARKER
+    "t"  streams the binary (.RAW) log followed by END_DATA_MARKER
+
+The device runs in its own process behind a pty (Linux and macOS only), so
+the timings of the benchmark process only include the app's side of the
+transfer. Data is written in the sizes of a chunk pattern, optionally paced
+to a byte rate and with the end marker split across two writes.
+
+Run directly to get a device to try by hand (Ctrl+C stops it):
+python benchmarks/fake_device.py --size 1048576
+"""
+import argparse
+import multiprocessing
+import os
+import pty
+import time
+import tty
+
+import numpy as np
+import pandas as pd
+
+from common import csv_bytes, raw_bytes
+
+from arduino import END_DATA_MARKER, HELLO_RESPONSE
+
+# Write sizes of the transfer, cycled until the log is sent
+CHUNK_PATTERNS = {
+    # Large blocks, as from a firmware that buffers whole flash pages
+    "bulk": [64 * 1024],
+    # One short write per line, as from a firmware printing record by record
+    "lines": [24],
+    # Irregular sizes, down to single bytes
+    "uneven": [1, 4093, 17, 1500, 12000, 3, 700],
+}
+
+# Pause between the two halves of a split end marker, long enough for the
+# reader to receive the first half on its own
+SPLIT_MARKER_PAUSE = 0.05
+
+def device_log(size, readable=True, seed=0):
+    """
+    Synthetic log content of about size bytes: whole CSV lines (readable) or
+    whole .RAW records
+
+    size: target size in bytes
+    readable: CSV (True) or .RAW (False) content
+    seed: random seed of the step counts
+    """
+    rows = max(size // (22 if readable else 10), 1) + 1
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "timestamp": pd.date_range("2024-01-01", periods=rows, freq="5min"),
+        "steps": rng.poisson(20, rows),
+    })
+    if not readable:
+        data = raw_bytes(df)
+        return data[:max(size // 10, 1) * 10]
+    data = csv_bytes(df)
+    return data[:data.rfind(b"\n", 0, size + 1) + 1]
+
+def _write_all(fd, data):
+    """Write all of data to fd (a pty may accept less than asked)."""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def _read_exact(fd, n):
+    """Read exactly n bytes from fd."""
+    data = b""
+    while len(data) < n:
+        data += os.read(fd, n - len(data))
+    return data
+
+def _stream(fd, data, pattern, split_marker, rate):
+    """Send data and the end marker in the sizes of pattern, paced to rate bytes/second."""
+    sizes = CHUNK_PATTERNS[pattern]
+    message = data + END_DATA_MARKER[:split_marker] if split_marker else data + END_DATA_MARKER
+    start = time.perf_counter()
+    position = 0
+    i = 0
+    while position < len(message):
+        chunk = message[position:position + sizes[i % len(sizes)]]
+        _write_all(fd, chunk)
+        position += len(chunk)
+        i += 1
+        if rate:
+            delay = start + position / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    if split_marker:
+        time.sleep(SPLIT_MARKER_PAUSE)
+        _write_all(fd, END_DATA_MARKER[split_marker:])
+
+def _serve(fd, logs, status, pattern, split_marker, rate):
+    """Device process: answer commands on the pty master fd until it is closed."""
+    while True:
+        try:
+            command = os.read(fd, 1)
+        except OSError:
+            return
+        if not command:
+            return
+        if command == b"?":
+            _write_all(fd, HELLO_RESPONSE + b"\r\n")
+        elif command == b"!":
+            _write_all(fd, status + b"\r\n")
+        elif command == b"i":
+            _write_all(fd, b"OK\r\n")
+            _read_exact(fd, 8)
+        elif command in (b"r", b"t"):
+            _stream(fd, logs[command], pattern, split_marker, rate)
+
+def start_device(size, pattern="bulk", split_marker=0, rate=None, status=b"DATA_FILE_EXISTS", seed=0):
+    """
+    Start a simulated logger in its own process. Returns (port, process, logs):
+    the serial port to open, the process to terminate when done, and the
+    content the device sends for "r" and "t" ({b"r": bytes, b"t": bytes}).
+
+    size: approximate size of the log in bytes
+    pattern: name of the write size pattern (see CHUNK_PATTERNS)
+    split_marker: position at which the end marker is split across two writes
+                  with a pause between them (0 to send it whole)
+    rate: transfer speed in bytes per second (None for as fast as possible)
+    status: reply to the status command
+    seed: random seed of the log content
+    """
+    logs = {b"r": device_log(size, True, seed), b"t": device_log(size, False, seed)}
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    port = os.ttyname(slave)
+    # The device process keeps the slave end open so the pty survives between connections
+    process = multiprocessing.get_context("fork").Process(
+        target=_serve, args=(master, logs, status, pattern, split_marker, rate), daemon=True
+    )
+    process.start()
+    os.close(master)
+    os.close(slave)
+    return port, process, logs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=1024 * 1024, help="log size in bytes")
+    parser.add_argument("--pattern", choices=sorted(CHUNK_PATTERNS), default="bulk", help="write size pattern")
+    parser.add_argument("--split-marker", type=int, default=0, help="split the end marker at this position")
+    parser.add_argument("--rate", type=float, default=None, help="transfer speed in bytes per second")
+    parser.add_argument("--status", default="DATA_FILE_EXISTS", help="reply to the status command")
+    args = parser.parse_args()
+
+    port, process, _ = start_device(args.size, args.pattern, args.split_marker, args.rate, args.status.encode())
+    print(f"Simulated device on {port}", flush=True)
+    try:
+        process.join()
+    except KeyboardInterrupt:
+        process.terminate()
+
+if __name__ == "__main__":
+    main()
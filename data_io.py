@@ -0,0 +1,240 @@
+"""
+Reading and writing of step datasets
+
+Datasets are timestamp/steps tables. Besides the CSV exports the app has always
+produced, they can be stored in a compact columnar binary format: a NumPy .npz
+archive holding int64 epoch timestamps (nanoseconds) and the step counts
+(unsigned integers, or float64 with NaN when readings are missing).
+It is several times smaller than the CSV and loads without any text parsing, so
+repeated re-analysis of the same files skips the CSV parse cost entirely.
+Binary .RAW downloads from the device are read with raw_decoder. Files
+received through a chunked upload (see upload_store) are read straight from
+disk.
+"""
+import base64
+import io
+import logging
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from raw_decoder import RAW_EXTENSION, decode_raw
+from upload_store import completed_upload, is_chunked
+
+CSV_EXTENSION = ".csv"
+BINARY_EXTENSION = ".npz"
+
+# Columns of a CSV dataset, their types as parsed, and the timestamp format the
+# app writes them in
+CSV_COLUMNS = ["timestamp", "steps"]
+CSV_DTYPES = {"timestamp": str, "steps": np.float64}
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Bumped whenever the layout of the binary archive changes
+BINARY_FORMAT_VERSION = 1
+
+def file_extension(filename):
+    """Lower-case extension of filename (e.g. ".csv"), or "" when there is none."""
+    return os.path.splitext(filename or "")[1].lower()
+
+def csv_has_header(first_line):
+    """
+    Whether a CSV starts with the "timestamp,steps" header row
+
+    first_line: first line of the file (bytes or str)
+    """
+    if isinstance(first_line, bytes):
+        first_line = first_line.decode("utf-8", errors="replace")
+    return [c.strip() for c in first_line.split(",")[:2]] == ["timestamp", "steps"]
+
+def parse_timestamps(values):
+    """
+    Convert timestamp strings to datetimes, using the app's fixed format and
+    falling back to format inference for files written differently
+
+    values: timestamp strings
+    """
+    try:
+        return pd.to_datetime(values, format=TIMESTAMP_FORMAT)
+    except (ValueError, TypeError):
+        return pd.to_datetime(values)
+
+def _parse_csv(source, has_header):
+    """
+    Parse a CSV into a timestamp/steps dataframe in a single read_csv pass
+
+    source: path or binary file object
+    has_header: whether the first line is the header row
+    """
+    df = pd.read_csv(source, header=0 if has_header else None, names=CSV_COLUMNS, usecols=[0, 1],
+                     dtype=CSV_DTYPES, engine="c")
+    df["timestamp"] = parse_timestamps(df["timestamp"])
+    # Keep integer step counts unless the file has missing, infinite or fractional values
+    steps = df["steps"].to_numpy()
+    if np.isfinite(steps).all() and np.array_equal(steps, np.floor(steps)):
+        df["steps"] = steps.astype(np.int64)
+    return df
+
+def read_csv_bytes(decoded):
+    """
+    Parse CSV bytes into a timestamp/steps dataframe. Files with or without a
+    header row are accepted (the app exports headerless CSVs); the header row
+    is detected from the first line, so the content is parsed only once.
+
+    decoded: raw CSV file content
+    """
+    newline = decoded.find(b"\n")
+    has_header = csv_has_header(decoded[:newline] if newline >= 0 else decoded)
+    return _parse_csv(io.BytesIO(decoded), has_header)
+
+def read_csv_file(path):
+    """
+    Parse a CSV file on disk into a timestamp/steps dataframe (see read_csv_bytes)
+
+    path: path of the CSV file
+    """
+    with open(path, "rb") as f:
+        has_header = csv_has_header(f.readline())
+    return _parse_csv(path, has_header)
+
+def binary_arrays(df):
+    """
+    Arrays of the columnar binary format for a timestamp/steps dataframe, as
+    passed to np.savez
+
+    df: dataframe with "timestamp" and "steps" columns
+    """
+    timestamps = df["timestamp"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    steps = df["steps"].to_numpy()
+    if steps.dtype.kind == "f" and not (np.isfinite(steps).all() and np.array_equal(steps, np.floor(steps))):
+        # Missing (NaN) or fractional readings have no integer encoding
+        steps = steps.astype(np.float64)
+    # Step counts per 5 minutes comfortably fit in 16 bits; keep a wider type
+    # only for data that does not (e.g. negative or very large values)
+    elif len(steps) == 0 or (steps.min() >= 0 and steps.max() <= np.iinfo(np.uint16).max):
+        steps = steps.astype(np.uint16)
+    else:
+        steps = steps.astype(np.int64)
+    return {"version": np.array([BINARY_FORMAT_VERSION]), "timestamp": timestamps, "steps": steps}
+
+def binary_frame(archive):
+    """
+    Timestamp/steps dataframe from the arrays of an opened binary archive
+
+    archive: np.load result of a file in the binary format
+    """
+    if "version" not in archive or int(archive["version"][0]) != BINARY_FORMAT_VERSION:
+        raise ValueError("Unsupported binary dataset version")
+    timestamps = archive["timestamp"].view("datetime64[ns]")
+    steps = archive["steps"]
+    steps = steps.astype(np.float64 if steps.dtype.kind == "f" else np.int64)
+    return pd.DataFrame({"timestamp": timestamps, "steps": steps})
+
+def write_binary(df):
+    """
+    Serialize a timestamp/steps dataframe into the columnar binary format
+
+    df: dataframe with "timestamp" and "steps" columns
+    """
+    buffer = io.BytesIO()
+    np.savez(buffer, **binary_arrays(df))
+    return buffer.getvalue()
+
+def read_binary(data):
+    """
+    Load a dataframe from the columnar binary format
+
+    data: raw file content
+    """
+    with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+        return binary_frame(archive)
+
+def _log_parse(filename, df, started):
+    """Report how long parsing a file took."""
+    elapsed = (time.perf_counter() - started) * 1000
+    logging.info(f"Parsed {os.path.basename(filename or '')}: {len(df)} rows in {elapsed:.1f} ms")
+
+def _parse_bytes(decoded, filename):
+    """Parse file content into a timestamp/steps dataframe based on the filename's extension."""
+    extension = file_extension(filename)
+    if extension == BINARY_EXTENSION:
+        return read_binary(decoded)
+    if extension == RAW_EXTENSION:
+        return decode_raw(decoded)
+    return read_csv_bytes(decoded)
+
+def read_bytes(decoded, filename):
+    """
+    Parse a data file into a timestamp/steps dataframe based on its extension,
+    logging the parse time
+
+    decoded: raw file content
+    filename: name of the file (selects the format)
+    """
+    started = time.perf_counter()
+    df = _parse_bytes(decoded, filename)
+    _log_parse(filename, df, started)
+    return df
+
+def read_file(path, filename=None):
+    """
+    Read a data file on disk into a timestamp/steps dataframe based on its
+    extension, logging the parse time
+
+    path: path of the file
+    filename: name selecting the format (defaults to the path's)
+    """
+    started = time.perf_counter()
+    filename = filename or path
+    if file_extension(filename) in (BINARY_EXTENSION, RAW_EXTENSION):
+        with open(path, "rb") as f:
+            df = _parse_bytes(f.read(), filename)
+    else:
+        df = read_csv_file(path)
+    _log_parse(filename, df, started)
+    return df
+
+def read_upload(contents, filename):
+    """
+    Decode a dcc.Upload file (CSV, binary or .RAW) into a timestamp/steps dataframe
+
+    contents: base64 "data:...," string from a dcc.Upload, or the marker of a
+              chunked upload (see upload_store)
+    filename: name of the uploaded file
+    """
+    if is_chunked(contents):
+        path, _ = completed_upload(contents)
+        return read_file(path, filename)
+    _, content_string = contents.split(",")
+    return read_bytes(base64.b64decode(content_string), filename)
+
+def is_supported(filename):
+    """Whether filename has an extension the app can read."""
+    return file_extension(filename) in (CSV_EXTENSION, BINARY_EXTENSION, RAW_EXTENSION)
+
+def parse_filename(fname):
+    """
+    Extract (participant_id, quarter, device) from the naming convention
+    Subject{pid}_{quarter}.{device}.csv (e.g. Subject109_1.1.csv, or .npz /
+    .raw for binary files). Any part that does not match (e.g. a merged export) comes
+    back as None so callers degrade gracefully.
+    """
+    stem = fname or ""
+    if is_supported(stem):
+        stem = stem[:-len(file_extension(stem))]
+    parts = stem.split("_")
+    raw_id = parts[0] if parts and parts[0] else stem
+    match = re.search(r"(\d+)", raw_id)
+    pid = match.group(1) if match else (raw_id or "?")
+
+    quarter = device = None
+    if len(parts) > 1:
+        seg = parts[1].split(".")
+        if seg and seg[0].isdigit():
+            quarter = int(seg[0])
+        if len(seg) > 1 and seg[1].isdigit():
+            device = int(seg[1])
+    return pid, quarter, device
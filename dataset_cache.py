@@ -0,0 +1,198 @@
+"""
+Server-side dataset cache
+
+Uploaded datasets are parsed once and kept in memory here, keyed by a digest of
+their parsed content (see frame_key; upload_key identifies the upload itself,
+so a re-upload is recognized before parsing). Dash stores only carry the key (and the selected range),
+so every callback fetches the same in-memory DataFrame instead of re-parsing a
+JSON copy shipped back from the browser. The least recently used datasets are
+evicted once MAX_CACHE_BYTES is exceeded (pages reopen evicted datasets from the
+dataset library), and each dataset keeps at most MAX_DERIVED_VARIANTS values
+of each parametrized derived kind (e.g. the summaries of selected ranges).
+
+Cached frames are shared between callbacks: treat them as read-only.
+"""
+import hashlib
+from collections import OrderedDict
+from threading import RLock
+
+import numpy as np
+import pandas as pd
+
+from upload_store import completed_upload, is_chunked
+
+# Upper bound on the memory held by cached datasets and the values derived from them
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+# Values derived per dataset under tuple names sharing their first item
+# (e.g. ("summary", lo, hi) for every selected range); the oldest are dropped
+MAX_DERIVED_VARIANTS = 16
+
+_datasets = OrderedDict()
+_total_bytes = 0
+_lock = RLock()
+
+def content_key(data):
+    """
+    Digest identifying a dataset by its content
+
+    data: raw file content (bytes or str)
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def frame_key(df):
+    """
+    Digest identifying a timestamp/steps dataframe by its parsed content, so
+    the same data gets the same key whatever file or upload it came from
+
+    df: timestamp/steps dataframe
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(df["timestamp"].to_numpy(dtype="datetime64[ns]").view(np.int64)))
+    digest.update(np.ascontiguousarray(df["steps"].to_numpy(dtype=np.float64)))
+    return digest.hexdigest()
+
+def upload_key(contents):
+    """
+    Cache key for a dcc.Upload contents string ("data:...;base64,<payload>").
+    Hashing the base64 payload directly means a re-upload of the same file is
+    recognized before anything is decoded. Chunked uploads are keyed by the
+    digest taken while their pieces arrived.
+
+    contents: base64 string from a dcc.Upload, or a chunked upload marker
+    """
+    if is_chunked(contents):
+        return completed_upload(contents)[1]
+    return content_key(contents.split(",", 1)[-1])
+
+def _nbytes(value):
+    """Approximate memory footprint of a cached value."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(v) for v in value)
+    return 64
+
+def _evict():
+    """Drop least recently used datasets until the cache fits its budget."""
+    global _total_bytes
+    # Always keep the most recent dataset, even if it alone exceeds the budget
+    while _total_bytes > MAX_CACHE_BYTES and len(_datasets) > 1:
+        _, entry = _datasets.popitem(last=False)
+        _total_bytes -= entry["nbytes"]
+
+def _store_derived(entry, name, value):
+    """Add a derived value to a cache entry, dropping the oldest variants of its kind."""
+    global _total_bytes
+    if isinstance(name, tuple):
+        variants = [n for n in entry["derived"] if isinstance(n, tuple) and n[0] == name[0]]
+        for old_name in variants[:max(len(variants) - MAX_DERIVED_VARIANTS + 1, 0)]:
+            size = _nbytes(entry["derived"].pop(old_name))
+            entry["nbytes"] -= size
+            _total_bytes -= size
+    size = _nbytes(value)
+    entry["derived"][name] = value
+    entry["nbytes"] += size
+    _total_bytes += size
+    _evict()
+
+def has_dataset(key):
+    """Whether a dataset is currently cached under key."""
+    with _lock:
+        return key in _datasets
+
+def put_dataset(key, df):
+    """
+    Cache df under key, replacing any previous entry, and return the key
+
+    key: dataset key (see content_key / upload_key)
+    df: timestamp/steps dataframe
+    """
+    global _total_bytes
+    with _lock:
+        old = _datasets.pop(key, None)
+        if old is not None:
+            _total_bytes -= old["nbytes"]
+        entry = {"df": df, "derived": {}, "nbytes": _nbytes(df)}
+        _datasets[key] = entry
+        _total_bytes += entry["nbytes"]
+        _evict()
+    return key
+
+def get_dataset(key):
+    """
+    Cached dataframe for key, or None when the key is unknown or was evicted
+
+    key: dataset key
+    """
+    if not key:
+        return None
+    with _lock:
+        entry = _datasets.get(key)
+        if entry is None:
+            return None
+        _datasets.move_to_end(key)
+        return entry["df"]
+
+def has_derived(key, name):
+    """Whether the value `name` derived from the dataset under key is cached."""
+    with _lock:
+        entry = _datasets.get(key) if key else None
+        return entry is not None and name in entry["derived"]
+
+def get_derived(key, name, build):
+    """
+    Value derived from the dataset under key, computed once with build(df) and
+    kept alongside the dataset so it is evicted together with it. Returns None
+    when the dataset is not cached.
+
+    key: dataset key
+    name: hashable name of the derived value
+    build: function taking the cached dataframe and returning the value
+    """
+    with _lock:
+        entry = _datasets.get(key) if key else None
+        if entry is None:
+            return None
+        _datasets.move_to_end(key)
+        if name in entry["derived"]:
+            return entry["derived"][name]
+        df = entry["df"]
+
+    value = build(df)
+
+    with _lock:
+        # The dataset may have been evicted or replaced while building
+        if _datasets.get(key) is entry and name not in entry["derived"]:
+            _store_derived(entry, name, value)
+    return value
+
+def put_derived(key, name, value):
+    """
+    Cache a value derived from the dataset under key that is already known
+    (e.g. loaded from disk), as get_derived would after building it
+
+    key: dataset key
+    name: hashable name of the derived value
+    value: the derived value
+    """
+    with _lock:
+        entry = _datasets.get(key) if key else None
+        if entry is None or name in entry["derived"]:
+            return
+        _store_derived(entry, name, value)
+
+def clear():
+    """Remove every cached dataset."""
+    global _total_bytes
+    with _lock:
+        _datasets.clear()
+        _total_bytes = 0
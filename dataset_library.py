@@ -0,0 +1,310 @@
+"""
+Persistent on-disk dataset library
+
+Every dataset the app ingests is also stored in a local library folder, so it
+can be reopened after a restart without uploading and parsing the file again.
+Each dataset is one .npz archive named after the digest of its parsed content
+(see dataset_cache.frame_key), so the same data is stored once however it was
+uploaded; the index remembers the upload keys that led to it, so re-uploads
+open without parsing. The archive holds the columnar
+binary format of data_io (so the archive is itself a valid .npz data file)
+plus the rollup pyramid of analytics.build_rollups. The library's index.json
+lists the datasets with their metadata (file name, participant, quarter,
+device, collected period), so the pages can offer them without opening any
+archive.
+
+Library datasets are opened through the upload components: picking one sets
+the component's contents to a "library:<key>" marker, which load_upload
+resolves from the dataset cache or the library instead of parsing a file.
+The folder is LIBRARY_DIR, by default "BJI_IMU_Library" in the user's home
+folder (override with the BJI_LIBRARY_DIR environment variable; scripts and
+benchmarks should point it to a temporary folder). The oldest datasets are
+removed once the archives exceed MAX_LIBRARY_BYTES, and delete_dataset
+removes one on request.
+"""
+import json
+import os
+import time
+from threading import Lock
+
+import numpy as np
+
+from analytics import ROLLUP_LEVELS, build_rollups, span_days
+from data_io import BINARY_EXTENSION, binary_arrays, binary_frame, parse_filename, read_upload
+from dataset_cache import frame_key, get_dataset, get_derived, put_dataset, put_derived, upload_key
+
+LIBRARY_DIR = os.environ.get("BJI_LIBRARY_DIR") or os.path.join(os.path.expanduser("~"), "BJI_IMU_Library")
+INDEX_NAME = "index.json"
+
+# Bumped whenever stored datasets must be rebuilt; entries of other versions
+# are ignored and replaced on the next ingest (version 1 could hold missing
+# readings saved as INT64_MIN, version 2 was keyed by the upload digest)
+LIBRARY_FORMAT_VERSION = 3
+
+# Upper bound on the disk space of the stored archives; the least recently
+# added datasets are removed beyond it
+MAX_LIBRARY_BYTES = 2 * 1024 * 1024 * 1024
+
+# Prefix of the upload contents standing for a library dataset
+LIBRARY_PREFIX = "library:"
+
+_lock = Lock()
+
+# Dataset keys of the uploads seen by this process, by upload key (see load_upload)
+_upload_datasets = {}
+
+def _dataset_path(key):
+    """Path of the archive holding the dataset under key."""
+    return os.path.join(LIBRARY_DIR, f"{key}{BINARY_EXTENSION}")
+
+def _write_atomic(path, write):
+    """Write a file through a temporary copy so readers never see it half written."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+def load_index():
+    """Metadata of every library dataset, by key ({} when the library is empty)."""
+    try:
+        with open(os.path.join(LIBRARY_DIR, INDEX_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _is_current(entry):
+    """Whether an index entry was written in the current library format."""
+    return entry.get("version") == LIBRARY_FORMAT_VERSION
+
+def list_datasets():
+    """Library metadata entries ordered by participant, quarter and device."""
+    def sort_key(entry):
+        pid = str(entry["pid"])
+        return (not pid.isdigit(), int(pid) if pid.isdigit() else 0, pid,
+                entry["quarter"] or 0, entry["device"] or 0, entry["start"])
+    return sorted(filter(_is_current, load_index().values()), key=sort_key)
+
+def library_options():
+    """Dropdown options ({label, value}) for the library datasets."""
+    options = []
+    for entry in list_datasets():
+        label = f"P{entry['pid']}"
+        if entry["quarter"] is not None:
+            label += f" Q{entry['quarter']}"
+        if entry["device"] is not None:
+            label += f" D{entry['device']}"
+        start, end = entry["start"][:10], entry["end"][:10]
+        options.append({
+            "label": f"{label}: {entry['filename']} ({start} to {end}, {entry['span_days']} days)",
+            "value": entry["key"],
+        })
+    return options
+
+def _check_arrays(arrays):
+    """Raise ValueError when the arrays of a dataset are not safe to store."""
+    steps = arrays["steps"]
+    if len(steps) != len(arrays["timestamp"]):
+        raise ValueError("Timestamps and steps differ in length")
+    if np.any(np.diff(arrays["timestamp"]) < 0):
+        raise ValueError("Timestamps are not sorted")
+    if steps.dtype.kind in "iu" and len(steps) and steps.min() == np.iinfo(np.int64).min:
+        raise ValueError("Steps hold missing readings cast to integers")
+    if not (np.isfinite(arrays["cum_steps"]).all() and np.isfinite(arrays["cum_minutes"]).all()):
+        raise ValueError("Rollup sums are not finite")
+
+def _write_index(index):
+    """Replace the library index."""
+    _write_atomic(os.path.join(LIBRARY_DIR, INDEX_NAME),
+                  lambda f: f.write(json.dumps(index, indent=1).encode("utf-8")))
+
+def _remove_entry(index, key):
+    """Remove a dataset's index entry and archive (the index is not written)."""
+    del index[key]
+    try:
+        os.remove(_dataset_path(key))
+    except OSError:
+        pass
+
+def _prune(index, keep):
+    """Remove the least recently added datasets (except keep) until the archives fit MAX_LIBRARY_BYTES."""
+    total = sum(entry.get("bytes", 0) for entry in index.values())
+    for key in sorted(index, key=lambda k: index[k]["added"]):
+        if total <= MAX_LIBRARY_BYTES:
+            break
+        if key != keep:
+            total -= index[key].get("bytes", 0)
+            _remove_entry(index, key)
+
+def save_dataset(key, df, filename, pyramid, upload=None):
+    """
+    Store a dataset and its rollup pyramid in the library under key, unless
+    it is already there, and remember the upload it came from
+
+    key: dataset key (see dataset_cache.frame_key)
+    df: timestamp/steps dataframe sorted by timestamp
+    filename: name of the file the dataset came from
+    pyramid: result of build_rollups for df
+    upload: upload key of the upload the dataset was parsed from
+    Raises ValueError when the dataset's arrays fail validation.
+    """
+    arrays = binary_arrays(df)
+    arrays["minutes"] = pyramid["minutes"]
+    arrays["cum_steps"] = pyramid["cum_steps"]
+    arrays["cum_minutes"] = pyramid["cum_minutes"]
+    for level, bins in pyramid["levels"].items():
+        arrays[f"{level}_timestamp"] = bins["timestamp"].view(np.int64)
+        arrays[f"{level}_edges"] = bins["edges"]
+    _check_arrays(arrays)
+
+    with _lock:
+        index = load_index()
+        if key in index and _is_current(index[key]) and os.path.exists(_dataset_path(key)):
+            if upload and upload not in index[key]["uploads"]:
+                index[key]["uploads"].append(upload)
+                _write_index(index)
+            return
+        os.makedirs(LIBRARY_DIR, exist_ok=True)
+
+        # Drop the entries of older formats along with their archives
+        for stale_key in [k for k, entry in index.items() if not _is_current(entry) and k != key]:
+            _remove_entry(index, stale_key)
+
+        _write_atomic(_dataset_path(key), lambda f: np.savez(f, **arrays))
+
+        pid, quarter, device = parse_filename(filename)
+        index[key] = {
+            "key": key,
+            "version": LIBRARY_FORMAT_VERSION,
+            "filename": filename,
+            "pid": pid,
+            "quarter": quarter,
+            "device": device,
+            "start": df["timestamp"].iloc[0].isoformat(),
+            "end": df["timestamp"].iloc[-1].isoformat(),
+            "span_days": span_days(df),
+            "rows": len(df),
+            "bytes": os.path.getsize(_dataset_path(key)),
+            "uploads": [upload] if upload else [],
+            "added": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        _prune(index, key)
+        _write_index(index)
+
+def delete_dataset(key):
+    """
+    Remove the dataset under key from the library; returns whether it was there.
+    A copy still held by the dataset cache stays usable until it is evicted.
+
+    key: dataset key
+    """
+    with _lock:
+        index = load_index()
+        if key not in index:
+            return False
+        _remove_entry(index, key)
+        _write_index(index)
+    return True
+
+def _upload_dataset(upload):
+    """Key of the dataset an upload was parsed into before, or None."""
+    key = _upload_datasets.get(upload)
+    if key is None:
+        for entry in load_index().values():
+            if _is_current(entry) and upload in entry["uploads"]:
+                return entry["key"]
+    return key
+
+def open_dataset(key):
+    """
+    (dataframe, rollup pyramid) of the library dataset under key. Raises
+    ValueError when it is not in the library.
+
+    key: dataset key
+    """
+    entry = load_index().get(key)
+    if entry is None or not _is_current(entry):
+        raise ValueError("Dataset is no longer in the library")
+    try:
+        archive = np.load(_dataset_path(key), allow_pickle=False)
+    except OSError:
+        raise ValueError("Dataset is no longer in the library")
+    with archive:
+        df = binary_frame(archive)
+        pyramid = {
+            "cum_steps": archive["cum_steps"],
+            "cum_minutes": archive["cum_minutes"],
+            "steps": df["steps"].to_numpy(dtype=np.float64),
+            "minutes": archive["minutes"],
+            "levels": {
+                level: {
+                    "timestamp": archive[f"{level}_timestamp"].view("datetime64[ns]"),
+                    "edges": archive[f"{level}_edges"],
+                }
+                for level in ROLLUP_LEVELS if f"{level}_edges" in archive
+            },
+        }
+    return df, pyramid
+
+def fetch_dataset(key):
+    """
+    Dataframe of the dataset under key from the dataset cache, reopened from
+    the library (with its rollups) when it was evicted. None when the dataset
+    is in neither.
+
+    key: dataset key
+    """
+    df = get_dataset(key)
+    if df is None and key:
+        try:
+            df, pyramid = open_dataset(key)
+        except ValueError:
+            return None
+        put_dataset(key, df)
+        put_derived(key, "rollups", pyramid)
+    return df
+
+def is_library(contents):
+    """Whether upload contents is a library dataset marker."""
+    return isinstance(contents, str) and contents.startswith(LIBRARY_PREFIX)
+
+def load_upload(contents, filename, parse=read_upload):
+    """
+    (key, dataframe) of an upload, taken from the dataset cache when it is
+    there. Library markers are opened from the library together with their
+    rollups; other uploads are looked up by their upload key and otherwise
+    parsed with parse(contents, filename), cached and added to the library.
+    The key is the dataset key (see dataset_cache.frame_key).
+
+    contents: dcc.Upload contents (or a chunked upload / library marker)
+    filename: name of the uploaded file
+    parse: function returning the timestamp/steps dataframe of an upload,
+           sorted by timestamp
+    """
+    if is_library(contents):
+        key = contents[len(LIBRARY_PREFIX):]
+        df = fetch_dataset(key)
+        if df is None:
+            raise ValueError("Dataset is no longer in the library")
+        return key, df
+
+    upload = upload_key(contents)
+    key = _upload_dataset(upload)
+    df = fetch_dataset(key) if key else None
+    if df is None:
+        df = parse(contents, filename)
+        key = frame_key(df)
+        _upload_datasets[upload] = key
+        # The same data may already be cached from another upload
+        cached = get_dataset(key)
+        if cached is not None:
+            df = cached
+        else:
+            put_dataset(key, df)
+        if not df.empty:
+            # The rollups are needed for viewing anyway; build them once for both
+            pyramid = get_derived(key, "rollups", build_rollups)
+            try:
+                save_dataset(key, df, filename, pyramid if pyramid is not None else build_rollups(df), upload)
+            except (OSError, ValueError) as e:
+                print(f"Could not add {filename} to the dataset library: {e}")
+    return key, df
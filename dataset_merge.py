@@ -0,0 +1,104 @@
+"""
+Merging of several step datasets into one
+
+Every device download covers one contiguous period, so the merge is a k-way
+merge of already-sorted inputs: the datasets are ordered by start time and
+the earlier dataset owns its whole time range, each later one contributing
+only the readings after all previous data ends. This resolves overlaps
+without relying on exact-matching timestamps (the 5-minute grids may be
+phase-shifted between datasets) and never double-counts an overlapping
+period. The contributed parts are disjoint and already in order, so they are
+found with one binary search per input and never concatenated or re-sorted;
+the merged CSV is written out chunk by chunk from them.
+"""
+import numpy as np
+import pandas as pd
+
+# Rows formatted per CSV chunk when writing a merge
+CSV_CHUNK_ROWS = 50_000
+
+def _sorted(df):
+    """df ordered by timestamp, sorting only when it is not already."""
+    if df["timestamp"].is_monotonic_increasing:
+        return df
+    return df.sort_values("timestamp", kind="stable")
+
+def merge_datasets(dfs):
+    """
+    Plan the merge of timestamp/steps dataframes. Returns a dict with the
+    ordered, non-overlapping pieces (views of the inputs), the number of
+    non-empty datasets merged, whether any of them overlapped in time, the
+    total number of rows and the first/last timestamp. Raises ValueError
+    when every dataset is empty.
+
+    dfs: timestamp/steps dataframes, in any order
+    """
+    dfs = [_sorted(d) for d in dfs if not d.empty]
+    if not dfs:
+        raise ValueError("No data to merge")
+    # Ordered by start time; datasets starting together keep their upload order
+    dfs.sort(key=lambda d: d["timestamp"].iloc[0])
+
+    has_overlap = False
+    pieces = []
+    running_end = None
+    for d in dfs:
+        if running_end is not None:
+            timestamps = d["timestamp"].to_numpy()
+            if timestamps[0] <= running_end:
+                has_overlap = True
+                d = d.iloc[np.searchsorted(timestamps, np.datetime64(running_end), side="right"):]
+        if d.empty:
+            continue
+        pieces.append(d)
+        end = d["timestamp"].iloc[-1]
+        running_end = end if running_end is None else max(running_end, end)
+
+    return {
+        "pieces": pieces,
+        "files": len(dfs),
+        "has_overlap": has_overlap,
+        "rows": sum(len(p) for p in pieces),
+        "start": pieces[0]["timestamp"].iloc[0],
+        "end": running_end,
+    }
+
+def iter_csv_chunks(merge, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Headless CSV of a merge (the app's export format) as a sequence of byte
+    chunks of at most chunk_rows rows, so the whole file is never held as text
+
+    merge: result of merge_datasets
+    chunk_rows: rows per chunk
+    """
+    # One steps dtype for the whole file, as for the concatenated frame: when
+    # any piece holds floats (e.g. missing readings), integers print as "1.0"
+    steps_dtype = np.result_type(*[p["steps"].dtype for p in merge["pieces"]]) if merge["pieces"] else None
+    for piece in merge["pieces"]:
+        for start in range(0, len(piece), chunk_rows):
+            chunk = piece.iloc[start:start + chunk_rows][["timestamp", "steps"]]
+            if chunk["steps"].dtype != steps_dtype:
+                chunk = chunk.astype({"steps": steps_dtype})
+            yield chunk.to_csv(index=False, header=False).encode("utf-8")
+
+def write_csv(merge, f, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Write the merged CSV to the binary file object f chunk by chunk
+
+    merge: result of merge_datasets
+    f: writable binary file object
+    chunk_rows: rows per chunk
+    """
+    for chunk in iter_csv_chunks(merge, chunk_rows):
+        f.write(chunk)
+
+def merged_frame(merge):
+    """
+    The merge as a single timestamp/steps dataframe (e.g. for the binary format)
+
+    merge: result of merge_datasets
+    """
+    return pd.DataFrame({
+        "timestamp": np.concatenate([p["timestamp"].to_numpy(dtype="datetime64[ns]") for p in merge["pieces"]]),
+        "steps": np.concatenate([p["steps"].to_numpy() for p in merge["pieces"]]),
+    })
@@ -0,0 +1,220 @@
+"""
+Multi-device station
+
+At the end of a quarter several loggers are docked at once. The station keeps
+one entry per docked device (its port, open connection, firmware status and
+the progress of the current operation) instead of the single module-level
+connection of arduino.py, finds all devices with one parallel scan (see
+arduino.find_devices) and runs initializations and downloads on many devices
+at the same time as Socket.IO background tasks. The device station page polls
+device_rows for its status table.
+
+Downloaded files are saved to DOWNLOAD_DIR, by default "BJI_IMU_Downloads" in
+the user's home folder (override with the BJI_DOWNLOAD_DIR environment
+variable).
+"""
+import os
+import time
+from threading import Lock
+
+from app_instance import socketio
+import arduino
+
+DOWNLOAD_DIR = os.environ.get("BJI_DOWNLOAD_DIR") or os.path.join(os.path.expanduser("~"), "BJI_IMU_Downloads")
+
+# States of a device entry during which its connection is in use
+BUSY_STATES = ("initializing", "downloading")
+
+_devices = {}
+_lock = Lock()
+
+def _new_device(port, ser, status):
+    """Entry of a newly found device."""
+    return {
+        "port": port,
+        "serial": ser,
+        "status": status,
+        "state": "ready",
+        "message": "",
+        "filename": None,
+        "path": None,
+        "bytes": 0,
+        "rate": 0.0,
+        "updated": time.time(),
+        "checking": False,
+    }
+
+def _close(device):
+    """Close a device's connection and release its port."""
+    if device["serial"] is not None:
+        try:
+            device["serial"].close()
+        except Exception:
+            pass
+        device["serial"] = None
+    arduino.busy_ports.discard(device["port"])
+
+def _set_state(device, state, message=""):
+    """Record the outcome of an operation on a device."""
+    device["state"] = state
+    device["message"] = message
+    device["updated"] = time.time()
+
+def _check(device):
+    """Whether an idle device still answers; refreshes its status."""
+    try:
+        if device["serial"] is None:
+            raise ConnectionError("Connection closed")
+        device["status"] = arduino.read_status(device["serial"]).decode(errors="replace")
+        return bool(device["status"])
+    except Exception:
+        return False
+
+def scan():
+    """
+    Find every docked logger and refresh the station's device list. Devices
+    that are busy keep their connection; idle ones are checked again, and
+    those that no longer answer are dropped. The ports are probed without
+    holding the station lock, so polls and other requests are not held up
+    for the length of the scan.
+    """
+    # Idle devices are marked as being checked so they cannot be claimed meanwhile
+    with _lock:
+        idle = [device for device in _devices.values() if device["state"] not in BUSY_STATES]
+        for device in idle:
+            device["checking"] = True
+    lost = [device for device in idle if not _check(device)]
+
+    found = {}
+    for port, ser in arduino.find_devices().items():
+        try:
+            found[port] = _new_device(port, ser, arduino.read_status(ser).decode(errors="replace"))
+        except Exception as e:
+            print(f"Could not read the status of the device on {port}: {e}")
+            ser.close()
+
+    with _lock:
+        for device in idle:
+            device["checking"] = False
+        for device in lost:
+            _close(device)
+            if _devices.get(device["port"]) is device:
+                del _devices[device["port"]]
+        for port, device in found.items():
+            if port in _devices:
+                _close(device)
+                continue
+            _devices[port] = device
+            arduino.busy_ports.add(port)
+    return device_rows()
+
+def device_rows():
+    """Status of every device as table rows, ordered by port."""
+    rows = []
+    for port in sorted(_devices):
+        device = _devices[port]
+        if device["state"] == "downloading":
+            progress = f"{device['bytes'] / 1024:.1f} KiB at {device['rate'] / 1024:.1f} KiB/s"
+        else:
+            progress = device["message"]
+        rows.append({
+            "port": port,
+            "status": device["status"],
+            "state": device["state"],
+            "filename": device["filename"] or "",
+            "progress": progress,
+        })
+    return rows
+
+def is_busy():
+    """Whether any device is being initialized or downloaded."""
+    return any(device["state"] in BUSY_STATES for device in _devices.values())
+
+def _claim(port, state):
+    """The idle, connected device on port, switched to the busy state, or None."""
+    with _lock:
+        device = _devices.get(port)
+        if device is None or device["serial"] is None or device["state"] in BUSY_STATES or device["checking"]:
+            return None
+        _set_state(device, state)
+        return device
+
+def _initialize(device, epoch_time):
+    """Background task: initialize one device. The logger powers down afterwards."""
+    try:
+        arduino.send_initialization(device["serial"], epoch_time)
+    except Exception as e:
+        _set_state(device, "error", str(e) or "Connection to the device was lost.")
+    else:
+        _set_state(device, "initialized", "Initialized and powered down")
+    _close(device)
+
+def initialize(ports, epoch_time):
+    """
+    Initialize the devices on ports at the same time; returns the ports started
+
+    ports: ports of the devices to initialize
+    epoch_time: start time in seconds since the epoch (UTC)
+    """
+    started = []
+    for port in ports:
+        device = _claim(port, "initializing")
+        if device is None:
+            continue
+        socketio.start_background_task(_initialize, device, epoch_time)
+        started.append(port)
+    return started
+
+def _download(device, get_readable):
+    """Background task: download one device's data to its file."""
+    def report(received, rate):
+        device["bytes"] = received
+        device["rate"] = rate
+        # Give the other transfers and requests a turn
+        socketio.sleep(0)
+
+    try:
+        result = arduino.download_file(device["path"], get_readable, progress=report, ser=device["serial"])
+    except Exception as e:
+        _set_state(device, "error", str(e) or "Connection to the device was lost.")
+    else:
+        _set_state(device, "downloaded",
+                   f"{result['bytes'] / 1024:.1f} KiB saved to {device['path']} (CRC32 {result['crc32']})")
+
+def is_valid_filename(name):
+    """Whether name is a plain file name, which cannot point outside DOWNLOAD_DIR."""
+    return (bool(name) and name not in (".", "..") and os.path.basename(name) == name
+            and "/" not in name and "\\" not in name)
+
+def download(files, get_readable):
+    """
+    Download the data of several devices at the same time into DOWNLOAD_DIR;
+    returns the ports started. Raises ValueError when a file name is not a
+    plain file name (see is_valid_filename), before any download starts.
+
+    files: {port: file name without extension} of the devices to download
+    get_readable: download .CSV (True) or .RAW (False) files
+    """
+    invalid = [name for name in files.values() if not is_valid_filename(name)]
+    if invalid:
+        raise ValueError(f"File names cannot contain folders: {', '.join(invalid)}")
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    extension = ".csv" if get_readable else ".raw"
+    started = []
+    for port, name in files.items():
+        device = _claim(port, "downloading")
+        if device is None:
+            continue
+        device["filename"] = name
+        device["path"] = os.path.join(DOWNLOAD_DIR, f"{name}{extension}")
+        device["bytes"], device["rate"] = 0, 0.0
+        socketio.start_background_task(_download, device, get_readable)
+        started.append(port)
+    return started
+
+def close_all():
+    """Close every station connection (e.g. when the app exits)."""
+    with _lock:
+        for device in _devices.values():
+            _close(device)
+        _devices.clear()
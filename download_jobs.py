@@ -0,0 +1,102 @@
+"""
+Background device downloads
+
+A serial transfer can take minutes, so it runs as a Socket.IO background task
+instead of blocking the callback that started it. Progress is pushed to the
+browser as "download_progress" events, and the index page polls the job until
+the finished file can be handed to dcc.Download.
+"""
+import time
+import uuid
+
+from app_instance import socketio
+import arduino
+
+# Finished jobs nobody collected (e.g. the page was closed) are forgotten after this many seconds
+JOB_EXPIRY_SECONDS = 60 * 60
+
+_jobs = {}
+
+def _event(job):
+    """Payload of a "download_progress" event for job."""
+    eta = None
+    if job["expected_bytes"] and job["rate"] > 0:
+        eta = max(job["expected_bytes"] - job["bytes"], 0) / job["rate"]
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "bytes": job["bytes"],
+        "rate": job["rate"],
+        "eta": eta,
+        "elapsed": time.time() - job["started"],
+        "error": job["error"],
+    }
+
+def _run(job, get_readable):
+    """Body of the background task: run the transfer and report progress."""
+    def report(received, rate):
+        job["bytes"] = received
+        job["rate"] = rate
+        socketio.emit("download_progress", _event(job))
+        # Give other requests a turn while the transfer is in progress
+        socketio.sleep(0)
+
+    def expect(expected_bytes):
+        job["expected_bytes"] = expected_bytes
+
+    try:
+        result = arduino.download_file(job["path"], get_readable, progress=report, size_hint=expect)
+    except Exception as e:
+        job["status"] = "error"
+        job["error"] = str(e) or "Connection to the device was lost."
+    else:
+        job["status"] = "done"
+        job["crc32"] = result["crc32"]
+    job["finished"] = time.time()
+    socketio.emit("download_progress", _event(job))
+
+def _prune():
+    """Forget finished jobs that were never collected."""
+    now = time.time()
+    for job_id, job in list(_jobs.items()):
+        if job["finished"] is not None and now - job["finished"] > JOB_EXPIRY_SECONDS:
+            del _jobs[job_id]
+
+def start_download(file_path, get_readable):
+    """
+    Start downloading the connected device's data in the background and
+    return the job id. The size of the transfer, for the ETA, is estimated
+    from its first bytes (see arduino.estimate_log_size).
+
+    file_path: location to store the data file
+    get_readable: download .RAW or .CSV format (boolean)
+    """
+    _prune()
+    job_id = uuid.uuid4().hex
+    job = {
+        "id": job_id,
+        "path": file_path,
+        "status": "running",
+        "bytes": 0,
+        "rate": 0.0,
+        "expected_bytes": None,
+        "started": time.time(),
+        "finished": None,
+        "error": None,
+        "crc32": None,
+    }
+    _jobs[job_id] = job
+    socketio.start_background_task(_run, job, get_readable)
+    return job_id
+
+def get_job(job_id):
+    """Job dict for job_id, or None if it is unknown."""
+    return _jobs.get(job_id)
+
+def finish_job(job_id):
+    """Forget a job once its result has been handed to the browser."""
+    _jobs.pop(job_id, None)
+
+def is_downloading():
+    """Whether any transfer is still in progress."""
+    return any(job["status"] == "running" for job in _jobs.values())
@@ -1,48 +1,116 @@
 """
 Import Libraries
 """
-import base64
-import io
 import os
 from datetime import datetime, timedelta
 
-from dash import dcc, html, Input, Output, State
+from dash import callback_context, dcc, html, Input, Output, State, Patch
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import numpy as np
 import pandas as pd
 import plotly.graph_objs as go
 import plotly.express as px
 
+from analytics import (SAMPLE_MINUTES, active_metrics, break_gaps, build_rollups, downsample_minmax,
+                       relayout_x_range, rollup, summary_metrics, threshold_sweep, window)
 from app_instance import app
+from data_io import BINARY_EXTENSION, is_supported, read_upload, write_binary
+from dataset_cache import get_derived
+from dataset_library import LIBRARY_PREFIX, delete_dataset, fetch_dataset, library_options, load_index, load_upload
 
-# Nominal sampling period of the logger, in minutes. Weighting each reading by
-# the time until the next one (capped at this value) keeps minute totals correct
-# when the spacing is not exactly 5 minutes — e.g. at the seam between two merged
-# datasets — and never counts an untracked gap as tracked time.
-SAMPLE_MINUTES = 5
+def read_sorted(contents, filename):
+    """
+    Parse an upload into a timestamp/steps dataframe sorted by timestamp, so
+    ranges and rollups can use row positions
+
+    contents: dcc.Upload contents
+    filename: name of the uploaded file
+    """
+    df = read_upload(contents, filename)
+    return df.sort_values("timestamp", kind="stable").reset_index(drop=True)
 
-def interval_minutes(df):
+def select_range(df, start_dt, end_dt):
     """
-    Minutes attributable to each reading: the time until the next reading,
-    capped at SAMPLE_MINUTES and aligned to df's index. Reduces to a flat
-    SAMPLE_MINUTES for evenly-sampled data.
+    Row positions [lo, hi) of the readings between start_dt and end_dt
+    (inclusive), found by binary search over the dataset's sorted timestamps
+
+    df: cached dataframe, sorted by timestamp
+    start_dt: start of the range (datetime)
+    end_dt: end of the range (datetime)
     """
-    ordered = df.sort_values("timestamp")
-    mins = ordered["timestamp"].diff().shift(-1).dt.total_seconds().div(60)
-    mins = mins.clip(upper=SAMPLE_MINUTES).fillna(SAMPLE_MINUTES)
-    return mins.reindex(df.index)
+    timestamps = df["timestamp"].to_numpy()
+    lo = int(np.searchsorted(timestamps, np.datetime64(start_dt), side="left"))
+    hi = int(np.searchsorted(timestamps, np.datetime64(end_dt), side="right"))
+    return lo, max(lo, hi)
+
+def selected_frame(selected_data):
+    """
+    View of the cached dataset for the range described by the "selected-data"
+    store, or None when nothing is loaded or the dataset is no longer available
+
+    selected_data: {"key", "lo", "hi"} describing the selected rows
+    """
+    if not selected_data:
+        return None
+    df = fetch_dataset(selected_data.get("key"))
+    if df is None:
+        return None
+    return df.iloc[selected_data["lo"]:selected_data["hi"]]
+
+def range_summary(selected_data):
+    """
+    Threshold-independent summary of the selected range, including its
+    threshold index (see analytics.summary_metrics), computed once per
+    dataset and range. None when nothing (or an empty range) is selected.
+
+    selected_data: {"key", "lo", "hi"} describing the selected rows
+    """
+    if not selected_data:
+        return None
+    key, lo, hi = selected_data["key"], selected_data["lo"], selected_data["hi"]
+    if fetch_dataset(key) is None:
+        return None
+
+    def build(df):
+        pyramid = get_derived(key, "rollups", build_rollups)
+        if pyramid is None or lo >= hi:
+            return None
+        # Tracked minutes are measured to the next reading; the last selected
+        # reading counts as a full sampling period, as for the selection alone
+        minutes = pyramid["minutes"][lo:hi].copy()
+        minutes[-1] = SAMPLE_MINUTES
+        return summary_metrics(df["timestamp"].to_numpy()[lo:hi], pyramid["steps"][lo:hi], minutes)
+
+    return get_derived(key, ("summary", lo, hi), build)
+
+def selection_metrics(selected_data, threshold):
+    """
+    Summary metrics of the selected range at the given active step threshold,
+    shared by every card and the values export. Moving the threshold only
+    looks the active totals up in the range's threshold index.
+
+    selected_data: {"key", "lo", "hi"} describing the selected rows
+    threshold: active step threshold
+    """
+    summary = range_summary(selected_data)
+    if summary is None:
+        return None
+    return dict(summary, **active_metrics(summary, threshold))
 
 # Define the layout of the app
 data_analysis_layout = html.Div([
     dbc.Container(
         [
-            # Act as a global variable for the data used for plotting
+            # Act as a global variable for the data used for plotting. The
+            # stores only hold the dataset's cache key and the selected range;
+            # the data itself stays on the server (see dataset_cache).
             html.Div(id="read-data", style={"display":"none"}),
             dcc.Store(id="raw-data"),
             dcc.Store(id="selected-data"),
             dbc.Row(
                 [
-                    dbc.Col(
+                    dbc.Col([
                         dcc.Upload(
                             id="upload-data",
                             children= html.Div(
@@ -52,13 +120,19 @@ data_analysis_layout = html.Div([
                                     html.Br(),
                                     "or",
                                     html.Br(),
-                                    html.A("Select CSV File to View Data")
+                                    html.A("Select CSV, NPZ or RAW File to View Data")
                                 ],
                                 className="upload-text"
                             ),
                             multiple=False,
-                            className="upload-box"
+                            className="upload-box chunked-upload"
                         ),
+                        dcc.Dropdown(
+                            id="library-picker",
+                            placeholder="Or open a dataset from the library...",
+                            clearable=False,
+                            style={"margin": "0px 10px"}
+                        )],
                         width=8,
                     ),
                     dbc.Col(
@@ -73,6 +147,14 @@ data_analysis_layout = html.Div([
                 dbc.Col(
                     html.Div(
                         [
+                            dbc.Button(
+                                [html.I(className="fas fa-trash"), " Remove from Library"],
+                                id="library-delete-btn",
+                                color="danger",
+                                outline=True,
+                                className="me-2",
+                                disabled=True,
+                            ),
                             dbc.Button(
                                 [html.I(className="fas fa-file-pdf"), " Download Page (PDF)"],
                                 id="download-pdf-btn",
@@ -86,9 +168,18 @@ data_analysis_layout = html.Div([
                                 id="download-values-btn",
                                 color="primary",
                                 outline=True,
+                                className="me-2",
+                                disabled=True,
+                            ),
+                            dbc.Button(
+                                [html.I(className="fas fa-sliders"), " Download Threshold Sweep (CSV)"],
+                                id="download-sweep-btn",
+                                color="primary",
+                                outline=True,
                                 disabled=True,
                             ),
                             dcc.Download(id="download-values-csv"),
+                            dcc.Download(id="download-sweep-csv"),
                             html.Div(id="pdf-print-dummy", style={"display": "none"}),
                         ],
                         className="export-bar",
@@ -145,6 +236,15 @@ data_analysis_layout = html.Div([
                                 ),
                                 dbc.Col(
                                     [
+                                        dbc.Select(
+                                            id="download-format",
+                                            options=[
+                                                {"label": ".CSV", "value": "csv"},
+                                                {"label": "Binary (.NPZ)", "value": "binary"}
+                                            ],
+                                            value="csv",
+                                            className="mb-1"
+                                        ),
                                         dbc.Button("Download", id="download-csv-btn"),
                                         dcc.Download(id="download-df-csv"),
                                         dcc.Loading(
@@ -299,10 +399,10 @@ data_analysis_layout = html.Div([
 )
 def read_data(contents, filename):
     """
-    Read the CSV file that was generated from the application
+    Read the CSV (or binary .npz / device .RAW) file that was generated from the application
 
     contents: data of interest
-    filename: name of the csv file
+    filename: name of the data file
     """
     if contents is None:
         # Create dummy data (For demo purposes)
@@ -318,18 +418,16 @@ def read_data(contents, filename):
         # df["steps"] = f(x)
         return None, None, None, None, None, None, None
     else:
-        _, content_string = contents.split(",")
-        decoded = base64.b64decode(content_string)
-        if "csv" in filename:
-            df = pd.read_csv(io.StringIO(decoded.decode("utf-8")))
-            if df.columns[0] == "timestamp" and df.columns[1] == "steps":
-                pass  # CSV has header row
-            else:
-                df = pd.read_csv(io.StringIO(decoded.decode("utf-8")), names=["timestamp", "steps"])
-        else:
+        if not is_supported(filename):
             return None, None, None, None, None, None, None
 
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        # Parse each distinct upload only once; re-uploads hit the cache and
+        # library datasets open without parsing
+        try:
+            key, df = load_upload(contents, filename, read_sorted)
+        except ValueError as e:
+            print(f"Could not read {filename}: {e}")
+            return None, None, None, None, None, None, None
     
     if df.empty: return None, None, None, None, None, None, None
 
@@ -341,9 +439,51 @@ def read_data(contents, filename):
     end_hour = df["timestamp"].max().strftime("%H")
     end_min = df["timestamp"].max().strftime("%M")
 
-    return (df.to_json(date_format="iso", orient="split"), start_date, end_date, 
+    return ({"key": key}, start_date, end_date,
             start_hour, start_min, end_hour, end_min)
 
+@app.callback(
+    Output("library-picker", "options"),
+    Output("library-delete-btn", "disabled"),
+    [Input("url", "pathname"),
+     Input("raw-data", "data"),
+     Input("library-delete-btn", "n_clicks")]
+)
+def update_library_options(pathname, raw_data, delete_clicks):
+    """
+    List the library datasets, refreshed when the page opens, after each upload
+    and after a removal, and enable removing the open dataset when it is in the
+    library. The open dataset stays viewable after its removal.
+
+    pathname: current page
+    raw_data: cache key of the full raw data
+    delete_clicks: clicks on the remove button
+    """
+    key = raw_data["key"] if raw_data else None
+    triggered_id = callback_context.triggered[0]["prop_id"].split(".")[0] if callback_context.triggered else None
+    if key and triggered_id == "library-delete-btn":
+        delete_dataset(key)
+    return library_options(), key not in load_index()
+
+@app.callback(
+    Output("upload-data", "contents"),
+    Output("upload-data", "filename"),
+    Output("library-picker", "value"),
+    Input("library-picker", "value"),
+    prevent_initial_call=True
+)
+def open_library_dataset(key):
+    """
+    Open a library dataset as if its file had been uploaded again; read_data
+    takes it from the library without parsing
+
+    key: key of the picked library dataset
+    """
+    entry = load_index().get(key) if key else None
+    if entry is None:
+        raise PreventUpdate
+    return LIBRARY_PREFIX + key, entry["filename"], None
+
 @app.callback(
     Output("start-hour-dropdown", "options"),
     Output("end-hour-dropdown", "options"),
@@ -396,12 +536,17 @@ def update_selected_data(start_date, end_date, start_hour, start_minute, end_hou
     start_minute: selected start minute for the data
     end_hour: selected end hour for the data
     end_minute: selected end minute for the data
-    raw_data: full raw json input
+    raw_data: cache key of the full raw data
+
+    Returns the selection as row positions within the cached dataset rather
+    than a copy of the rows.
     """
     if raw_data is None:
         return None
 
-    df = pd.read_json(io.StringIO(raw_data), orient="split")
+    df = fetch_dataset(raw_data["key"])
+    if df is None:
+        return None
 
     try:
         start_dt = f"{start_date} {start_hour}:{start_minute}:00"
@@ -409,11 +554,11 @@ def update_selected_data(start_date, end_date, start_hour, start_minute, end_hou
         start_dt = datetime.strptime(start_dt, "%Y-%m-%d %H:%M:%S")
         end_dt = datetime.strptime(end_dt, "%Y-%m-%d %H:%M:%S")
     except ValueError:
-        selected_df = df
-    else:
-        selected_df = df.loc[(df["timestamp"] >= start_dt) & (df["timestamp"] <= end_dt)]
+        # Fall back to the full dataset
+        return {"key": raw_data["key"], "lo": 0, "hi": len(df)}
 
-    return selected_df.to_json(date_format="iso", orient="split")
+    lo, hi = select_range(df, start_dt, end_dt)
+    return {"key": raw_data["key"], "lo": lo, "hi": hi}
 
 @app.callback(
         Output("download-csv-btn", "disabled"),
@@ -434,30 +579,40 @@ def toggle_download_button(upload_data):
     Output("download-status", "children"),
     [Input("upload-data", "filename"),
      Input("download-csv-btn", "n_clicks")],
-    State("selected-data", "data"),
+    [State("selected-data", "data"),
+     State("download-format", "value")],
     prevent_initial_call=True
 )
-def download_csv(filename, n_clicks, selected_data):
+def download_csv(filename, n_clicks, selected_data, file_format):
     """
-    Download the parsed data as a csv
+    Download the parsed data as a csv, or in the binary format
 
     filename: original filename
     n_clicks: click instance of download-csv-btn
     selected_data: parsed data
+    file_format: "csv" or "binary"
     """
     if selected_data is None: return None, None
 
     if filename and n_clicks:
         try:
-            df = pd.read_json(io.StringIO(selected_data), orient="split")
+            df = selected_frame(selected_data)
+            if df is None:
+                raise ValueError("Dataset is no longer loaded")
             file_status = html.Div("Complete", style={"color": "mediumseagreen", "margin-left": "15px"})
             base_uid = filename.split("_")[0]
         except Exception as e:
             print(f"Following exception triggered: {e}")
             return None, html.Div("Error", style={"color": "indianred", "margin-left": "15px"})
         else:
-            file_name = f"{base_uid}_parsed_{datetime.now().strftime('%Y%m%d%H%M%S')}.csv"
+            file_name = f"{base_uid}_parsed_{datetime.now().strftime('%Y%m%d%H%M%S')}"
             # Browser download only — the user chooses where it lands.
+            if file_format == "binary":
+                return (
+                    dcc.send_bytes(write_binary(df), file_name + BINARY_EXTENSION),
+                    file_status
+                )
+            file_name += ".csv"
             return (
                 dcc.send_data_frame(df.to_csv, file_name, index=False, header=False),
                 file_status
@@ -468,18 +623,19 @@ def download_csv(filename, n_clicks, selected_data):
 @app.callback(
     Output("download-pdf-btn", "disabled"),
     Output("download-values-btn", "disabled"),
+    Output("download-sweep-btn", "disabled"),
     Input("upload-data", "contents")
 )
 def toggle_export_buttons(upload_data):
     """
-    Enable the PDF and values-CSV download buttons only when data is uploaded
+    Enable the PDF, values-CSV and threshold sweep download buttons only when data is uploaded
 
     upload_data: data uploaded to the interface
     """
     if upload_data is None:
-        return True, True
+        return True, True, True
 
-    return False, False
+    return False, False, False
 
 # Trigger the browser's print dialog so the whole page can be saved as a PDF
 app.clientside_callback(
@@ -511,35 +667,32 @@ def download_values(n_clicks, selected_data, raw_data, active_steps_defn, filena
     Download all values shown in the interface as a summary CSV
 
     n_clicks: "Download Values (CSV)" button click instance
-    selected_data: json wrapped Arduino data (currently displayed range)
-    raw_data: full raw json input
+    selected_data: cache key and range of the currently displayed data
+    raw_data: cache key of the full raw data
     active_steps_defn: active step threshold set by the slider
     filename: original uploaded filename
     comment: text entered in the comment box
     """
-    if not n_clicks or selected_data is None:
+    if not n_clicks:
         return None
 
-    df = pd.read_json(io.StringIO(selected_data), orient="split")
-    if df.empty:
-        return None
-    df["timestamp"] = pd.to_datetime(df["timestamp"])
-
     # Metrics shown across the interface
-    mins = interval_minutes(df)
-    total_steps = int(df["steps"].sum())
-    total_min = int(round(mins.sum()))
     threshold = active_steps_defn
-    active_step = int(df[df["steps"] >= threshold]["steps"].sum())
-    active_min = int(round(mins[df["steps"] >= threshold].sum()))
+    metrics = selection_metrics(selected_data, threshold)
+    if metrics is None:
+        return None
 
-    max_idx = df["steps"].idxmax()
-    max_val = int(df["steps"].loc[max_idx])
-    max_ts = df["timestamp"].loc[max_idx].strftime("%Y-%m-%d %H:%M")
-    mean_val = round(float(df["steps"].mean()), 2)
+    total_steps = metrics["total_steps"]
+    total_min = int(round(metrics["total_minutes"]))
+    active_step = metrics["active_steps"]
+    active_min = int(round(metrics["active_minutes"]))
 
-    selected_start = df["timestamp"].iloc[0].strftime("%Y-%m-%d %H:%M")
-    selected_end = df["timestamp"].iloc[-1].strftime("%Y-%m-%d %H:%M")
+    max_val = metrics["max_steps"]
+    max_ts = metrics["max_timestamp"].strftime("%Y-%m-%d %H:%M")
+    mean_val = round(metrics["mean_steps"], 2)
+
+    selected_start = metrics["start"].strftime("%Y-%m-%d %H:%M")
+    selected_end = metrics["end"].strftime("%Y-%m-%d %H:%M")
 
     # UID / device version parsed from the filename
     uid, device = "", ""
@@ -552,9 +705,8 @@ def download_values(n_clicks, selected_data, raw_data, active_steps_defn, filena
     # Full collected period from the raw data
     collected_start, collected_end = "", ""
     if raw_data:
-        raw_df = pd.read_json(io.StringIO(raw_data), orient="split")
-        if not raw_df.empty:
-            raw_df["timestamp"] = pd.to_datetime(raw_df["timestamp"])
+        raw_df = fetch_dataset(raw_data["key"])
+        if raw_df is not None and not raw_df.empty:
             collected_start = raw_df["timestamp"].iloc[0].strftime("%Y-%m-%d %H:%M")
             collected_end = raw_df["timestamp"].iloc[-1].strftime("%Y-%m-%d %H:%M")
 
@@ -582,11 +734,46 @@ def download_values(n_clicks, selected_data, raw_data, active_steps_defn, filena
     export_name = f"{uid or 'data'}_summary_{datetime.now().strftime('%Y%m%d%H%M%S')}.csv"
     return dcc.send_data_frame(summary.to_csv, export_name, index=False)
 
-def aggregate_data(df, unit):
+@app.callback(
+    Output("download-sweep-csv", "data"),
+    Input("download-sweep-btn", "n_clicks"),
+    [State("selected-data", "data"),
+     State("upload-data", "filename")],
+    prevent_initial_call=True
+)
+def download_sweep(n_clicks, selected_data, filename):
+    """
+    Download the active steps and minutes of the selected range for every
+    active step threshold from 1 to 100
+
+    n_clicks: "Download Threshold Sweep (CSV)" button click instance
+    selected_data: cache key and range of the currently displayed data
+    filename: original uploaded filename
+    """
+    if not n_clicks:
+        return None
+
+    summary = range_summary(selected_data)
+    if summary is None:
+        return None
+
+    # Days with data in the selected range, for the per-day rate
+    n_days = int((aggregate_data(selected_data, "day")["steps"].notna()).sum())
+    sweep = threshold_sweep(summary["threshold_index"], n_days)
+    sweep["active_minutes"] = sweep["active_minutes"].round().astype(int)
+    sweep["active_min_per_day"] = sweep["active_min_per_day"].round(1)
+    sweep.columns = ["Active Step Threshold", "Active Steps", "Active Minutes", "Active Min/Day"]
+
+    uid = filename.split("_")[0] if filename else "data"
+    export_name = f"{uid}_threshold_sweep_{datetime.now().strftime('%Y%m%d%H%M%S')}.csv"
+    return dcc.send_data_frame(sweep.to_csv, export_name, index=False)
+
+def aggregate_data(selected_data, unit):
     """
-    Aggregate data for graphs
+    Aggregate data for graphs. Bins are sliced from the dataset's rollup
+    pyramid, which is built once per dataset and cached with it.
 
-    df: dataframe containing arduino data
+    selected_data: cache key and range of the selected Arduino data
     unit: specified unit of time for aggregation
     """
     # Abbreviation mappings for days and months
@@ -600,19 +787,16 @@ def aggregate_data(df, unit):
         "September": "Sep", "October": "Oct", "November": "Nov", "December": "Dec"
     }
 
+    lo, hi = selected_data["lo"], selected_data["hi"]
+    pyramid = get_derived(selected_data["key"], "rollups", build_rollups)
+
+    # Untracked bins (device off) are NaN, not 0, so they are never
+    # mistaken for a real zero-step reading.
     if unit == "hour":
-        grouped = df.resample("h", on="timestamp").steps
-        df_new = grouped.sum()
-        # Untracked bins (device off) become NaN, not 0, so they are never
-        # mistaken for a real zero-step reading.
-        df_new[grouped.count() == 0] = np.nan
-        df_new = df_new.to_frame().reset_index()
+        df_new = rollup(pyramid, "hour", lo, hi)[["timestamp", "steps"]]
         df_new["hour"] = df_new["timestamp"].dt.hour
     else:
-        grouped = df.resample("D", on="timestamp").steps
-        df_new = grouped.sum()
-        df_new[grouped.count() == 0] = np.nan
-        df_new = df_new.to_frame().reset_index()
+        df_new = rollup(pyramid, "day", lo, hi)[["timestamp", "steps"]]
         df_new["day"] = df_new["timestamp"].dt.day
         df_new["day_of_week"] = df_new["timestamp"].dt.weekday
         if unit == "month":
@@ -624,32 +808,6 @@ def aggregate_data(df, unit):
     return df_new
 
 
-# Any gap between consecutive readings longer than this is treated as an
-# untracked period: the line breaks across it instead of bridging two
-# tracked stretches (e.g. the seam between two merged datasets).
-GAP_THRESHOLD = pd.Timedelta("10min")
-
-def break_gaps(df):
-    """
-    Insert a single NaN-valued point in the middle of each untracked gap so a
-    line plot breaks across it rather than drawing a straight line between the
-    last reading before the gap and the first reading after it.
-    """
-    d = df.sort_values("timestamp").reset_index(drop=True)
-    diffs = d["timestamp"].diff()
-    gap_idx = [i for i in d.index if pd.notna(diffs.iloc[i]) and diffs.iloc[i] > GAP_THRESHOLD]
-    if not gap_idx:
-        return d
-
-    inserts = []
-    for i in gap_idx:
-        prev_t = d["timestamp"].iloc[i - 1]
-        curr_t = d["timestamp"].iloc[i]
-        inserts.append({"timestamp": prev_t + (curr_t - prev_t) / 2, "steps": np.nan})
-
-    out = pd.concat([d, pd.DataFrame(inserts)], ignore_index=True)
-    return out.sort_values("timestamp").reset_index(drop=True)
-
 # Display data information used in graphs
 @app.callback(
         Output("content-patientinfo", "children"),
@@ -661,11 +819,11 @@ def update_patient_info(filename, raw_data):
     Display the patient participant information as indicated on the filename
 
     filename: name of the provided csv file
-    raw_data: full raw json input
+    raw_data: cache key of the full raw data
     """
-    if raw_data is None: return None
+    df = fetch_dataset(raw_data["key"]) if raw_data else None
+    if df is None: return None
 
-    df = pd.read_json(io.StringIO(raw_data), orient="split")
     # Handle cases where input data is empty
     if df.empty:
         parts = filename.split("_")
@@ -716,11 +874,11 @@ def update_collected_period(raw_data):
     """
     Display the collected period of the full raw data
 
-    raw_data: full raw json input
+    raw_data: cache key of the full raw data
     """
-    if raw_data is None: return None
+    df = fetch_dataset(raw_data["key"]) if raw_data else None
+    if df is None: return None
 
-    df = pd.read_json(io.StringIO(raw_data), orient="split")
 
     # Handle cases where the input data is empty
     if df.empty:
@@ -738,26 +896,28 @@ def update_collected_period(raw_data):
 # Display total steps in the used data
 @app.callback(
         Output("content-total-steps", "children"),
-        [Input("selected-data", "data")]
+        [Input("selected-data", "data")],
+        [State("active-step-slider", "value")]
 )
-def update_total_steps(selected_data):
+def update_total_steps(selected_data, active_steps_defn):
     """
     Display total steps of the displaying data
 
-    selected_data: json wrapped Arduino data
+    selected_data: cache key and range of the selected Arduino data
+    active_steps_defn: active steps definition set by user (shares the metrics with the other cards)
     """
     if selected_data is None: return None
 
-    df = pd.read_json(io.StringIO(selected_data), orient="split")
+    metrics = selection_metrics(selected_data, active_steps_defn)
     # Handle cases where the input data is empty
-    if df.empty:
+    if metrics is None:
         return dbc.Row(
             dbc.Col(
                 html.Div("No Data Available", className="flex-container")
             )
         )
 
-    total_steps = df["steps"].sum()
+    total_steps = metrics["total_steps"]
 
     return [
         html.Span(total_steps, style={"font-weight":"bold", "font-size":"40px"}),
@@ -767,19 +927,21 @@ def update_total_steps(selected_data):
 # Display total minutes in the used data
 @app.callback(
         Output("content-total-minutes", "children"),
-        [Input("selected-data", "data")]
+        [Input("selected-data", "data")],
+        [State("active-step-slider", "value")]
 )
-def update_total_minutes(selected_data):
+def update_total_minutes(selected_data, active_steps_defn):
     """
     Display total minutes of the displaying data
 
-    selected_data: json wrapped Arduino data
+    selected_data: cache key and range of the selected Arduino data
+    active_steps_defn: active steps definition set by user (shares the metrics with the other cards)
     """
     if selected_data is None: return None
 
-    df = pd.read_json(io.StringIO(selected_data), orient="split")
+    metrics = selection_metrics(selected_data, active_steps_defn)
     # Handle cases where the input data is empty
-    if df.empty:
+    if metrics is None:
         return dbc.Row(
             dbc.Col(
                 html.Div("No Data Available", className="flex-container")
@@ -788,7 +950,7 @@ def update_total_minutes(selected_data):
 
     # Tracked minutes (gap-aware): sum of each reading's interval, so untracked
     # gaps between merged datasets are not counted as monitored time.
-    total_min = int(round(interval_minutes(df).sum()))
+    total_min = int(round(metrics["total_minutes"]))
 
     return [
         html.Span(total_min, style={"font-weight":"bold", "font-size":"40px"}),
@@ -805,23 +967,22 @@ def update_active_steps(selected_data, active_steps_defn):
     """
     Display active steps related to the displaying data
 
-    selected_data: json wrapped Arduino data
+    selected_data: cache key and range of the selected Arduino data
     active_steps_defn: active steps definition set by user
     """
     if selected_data is None: return None
 
-    df = pd.read_json(io.StringIO(selected_data), orient="split")
+    metrics = selection_metrics(selected_data, active_steps_defn)
     # Handle cases where the input data is empty
-    if df.empty:
+    if metrics is None:
         return dbc.Row(
             dbc.Col(
                 html.Div("No Data Available", className="flex-container")
             )
         )
 
-    unit_active_steps = active_steps_defn
-    active_step = df[df["steps"] >= unit_active_steps]["steps"].sum()
-    inactive_step = df[df["steps"] < unit_active_steps]["steps"].sum()
+    active_step = metrics["active_steps"]
+    inactive_step = metrics["inactive_steps"]
 
     fig_active_steps = go.Figure(go.Pie(
         labels=["Active Steps", "Inactive Steps"],
@@ -864,24 +1025,22 @@ def update_active_minutes(selected_data, active_steps_defn):
     """
     Display active minutes related to the displaying data
 
-    selected_data: json wrapped Arduino data
+    selected_data: cache key and range of the selected Arduino data
     active_steps_defn: active step definition set by the user
     """
     if selected_data is None: return None
 
-    df = pd.read_json(io.StringIO(selected_data), orient="split")
+    metrics = selection_metrics(selected_data, active_steps_defn)
     # Handle cases where the input data is empty
-    if df.empty:
+    if metrics is None:
         return dbc.Row(
             dbc.Col(
                 html.Div("No Data Available", className="flex-container")
             )
         )
 
-    unit_active_steps = active_steps_defn
-    mins = interval_minutes(df)
-    active_min = int(round(mins[df["steps"] >= unit_active_steps].sum()))
-    inactive_min = int(round(mins[df["steps"] < unit_active_steps].sum()))
+    active_min = int(round(metrics["active_minutes"]))
+    inactive_min = int(round(metrics["inactive_minutes"]))
 
     fig_active_mins = go.Figure(go.Pie(
             labels=["Active Mins", "Inactive Mins"],
@@ -927,14 +1086,14 @@ def update_scatter(selected_value, selected_data):
     selected_value = selected timeframe
     selected_data = json wrapped Arduino data
     """
-    if selected_data is None:
+    df = selected_frame(selected_data)
+    if df is None:
         return dbc.Row(
             dbc.Col(
                 html.Div("No Data Available", className="flex-container")
             )
         )
 
-    df = pd.read_json(io.StringIO(selected_data), orient="split")
     # Handle cases where the input data is empty
     if df.empty:
         return dbc.Row(
@@ -945,12 +1104,12 @@ def update_scatter(selected_value, selected_data):
 
     if selected_value =="scatter-hourly":
         # Aggregate data by hour
-        df_new = aggregate_data(df, "hour")
+        df_new = aggregate_data(selected_data, "hour")
         unit_of_time = "hour"
 
     elif selected_value == "scatter-daily":
         # Aggregate data by day
-        df_new = aggregate_data(df, "day")
+        df_new = aggregate_data(selected_data, "day")
         unit_of_time = "day"
 
     else:
@@ -965,10 +1124,16 @@ def update_scatter(selected_value, selected_data):
             )
         )
 
+    # Long raw ranges are decimated to each bucket's min/max (peaks and gap
+    # breaks are kept); update_scatter_zoom restores full resolution on zoom.
+    df_plot = df_new
+    if unit_of_time == "5 minutes":
+        df_plot = df_new.iloc[downsample_minmax(df_new["steps"].to_numpy(dtype=float))]
+
     # Plot the aggregated data. connectgaps=False keeps NaN (untracked) periods
     # as breaks in the line rather than joining across them.
     plot = go.Figure()
-    plot.add_trace(go.Scatter(x=df_new["timestamp"], y=df_new["steps"],
+    plot.add_trace(go.Scatter(x=df_plot["timestamp"], y=df_plot["steps"],
                               mode="lines+markers", connectgaps=False))
     plot.update_layout(xaxis_title="Date", yaxis_title="Steps", xaxis_tickangle=45)
 
@@ -977,6 +1142,9 @@ def update_scatter(selected_value, selected_data):
         df_new = df_new.reset_index()
         max_index = df_new["steps"].idxmax()
         max_val = df_new["steps"].iloc[max_index]
+        # Rollup totals are floats (NaN marks untracked bins); show whole counts as integers
+        if float(max_val).is_integer():
+            max_val = int(max_val)
         max_timestamp = df_new["timestamp"].iloc[max_index].strftime("%b. %d, %I:%M %p")
         mean_val = round(df_new["steps"].mean(), 2)
     except (IndexError, ValueError, KeyError) as e:
@@ -1000,7 +1168,7 @@ def update_scatter(selected_value, selected_data):
 
     return dbc.Row(
         [
-            dbc.Col(dcc.Graph(figure=plot), width=12),
+            dbc.Col(dcc.Graph(figure=plot, id="scatter-graph"), width=12),
             dbc.Col(
                 dbc.Card([
                     dbc.CardHeader("Graph Information", className="card-title"),
@@ -1028,6 +1196,39 @@ def update_scatter(selected_value, selected_data):
         className="flex-container"
     )
 
+@app.callback(
+        Output("scatter-graph", "figure"),
+        [Input("scatter-graph", "relayoutData")],
+        [State("graph-tab-scatter", "active_tab"),
+         State("selected-data", "data")],
+        prevent_initial_call=True
+)
+def update_scatter_zoom(relayout_data, selected_value, selected_data):
+    """
+    Re-query the raw scatter for the zoomed window, so zooming in reveals the
+    readings that were decimated away for the full range
+
+    relayout_data: zoom/pan event of the scatter graph
+    selected_value: selected timeframe
+    selected_data: cache key and range of the selected Arduino data
+    """
+    x_range = relayout_x_range(relayout_data)
+    if x_range is None or selected_value in ("scatter-hourly", "scatter-daily"):
+        raise PreventUpdate
+
+    df = selected_frame(selected_data)
+    if df is None or df.empty:
+        raise PreventUpdate
+
+    df_new = break_gaps(window(df, *x_range))
+    df_plot = df_new.iloc[downsample_minmax(df_new["steps"].to_numpy(dtype=float))]
+
+    # Only swap the trace's points so the current zoom is kept
+    patched = Patch()
+    patched["data"][0]["x"] = df_plot["timestamp"].to_numpy()
+    patched["data"][0]["y"] = df_plot["steps"].to_numpy()
+    return patched
+
 # Visualize the aggregated data with sunburst graph
 @app.callback(
         Output("content-sunburst", "children"),
@@ -1037,16 +1238,16 @@ def update_sunburst(selected_data):
     """
     Display a sunburst chart based on the selected_data
 
-    selected_data: json wrapped Arduino data
+    selected_data: cache key and range of the selected Arduino data
     """
-    if selected_data is None:
+    df = selected_frame(selected_data)
+    if df is None:
         return dbc.Row(
             dbc.Col(
                 html.Div("No Data Available", className="flex-container")
             )
         )
 
-    df = pd.read_json(io.StringIO(selected_data), orient="split")
     # Handle cases where the input data is empty
     if df.empty:
         return dbc.Row(
@@ -1054,7 +1255,7 @@ def update_sunburst(selected_data):
                 html.Div("No Data Available", className="flex-container")
             )
         )
-    df_new = aggregate_data(df, "month")
+    df_new = aggregate_data(selected_data, "month")
     df_sunburst = df_new.groupby(["month", "day_of_week"]).agg({"steps":"sum"}).reset_index()
     num_months = len(df_sunburst.month.unique())
 
@@ -1092,11 +1293,11 @@ def update_boxwhisker(selected_value, selected_data):
     Display a box & whisker chart based on the selected_data
 
     selected_value: selected timeframe to view
-    selected_data: json wrapped Arduino data
+    selected_data: cache key and range of the selected Arduino data
     """
-    if selected_data is None: return None
+    df = selected_frame(selected_data)
+    if df is None: return None
 
-    df = pd.read_json(io.StringIO(selected_data), orient="split")
     # Handle cases where the input data is empty
     if df.empty:
         return dbc.Row(
@@ -1108,7 +1309,7 @@ def update_boxwhisker(selected_value, selected_data):
 
     if selected_value == "boxwhisker-hourly":
         # Aggregate data by hour
-        df_new = aggregate_data(df, "hour")
+        df_new = aggregate_data(selected_data, "hour")
         num_categories = df_new["hour"].nunique()
         color_scale = px.colors.sequential.Agsunset # or Cividis
         colors = {
@@ -1138,7 +1339,7 @@ def update_boxwhisker(selected_value, selected_data):
         plot.update_layout(xaxis_title="Hour of the Day", yaxis_title="Steps", showlegend=False)
     elif selected_value == "boxwhisker-daily":
         # Aggregate data by day
-        df_new = aggregate_data(df, "day")
+        df_new = aggregate_data(selected_data, "day")
         num_categories = df_new["day_of_week"].nunique()
         color_scale = px.colors.sequential.Agsunset
         colors = {day: color_scale[int(np.floor(idx / num_categories * (len(color_scale) - 1)))]
@@ -1163,7 +1364,7 @@ def update_boxwhisker(selected_value, selected_data):
         plot.update_layout(xaxis_title="Day of the Week", yaxis_title="Steps", showlegend=False)
     else:
         # Aggregate data by month
-        df_new = aggregate_data(df, "month")
+        df_new = aggregate_data(selected_data, "month")
         num_categories = df_new["month"].nunique()
         color_scale = px.colors.sequential.Agsunset
         colors = {month: color_scale[int(np.floor(idx / num_categories * (len(color_scale) - 1)))]
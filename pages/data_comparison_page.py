@@ -7,23 +7,29 @@ uploaded file becomes a labelled "series" tagged with the participant UID and
 its own date span parsed from the data. Nothing assumes the files are equal
 length or line up as clean quarters.
 """
-import base64
-import io
-import re
 from datetime import datetime
 
-from dash import dcc, html, Input, Output, State
+from dash import dcc, html, Input, Output, State, Patch
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
-import numpy as np
 import pandas as pd
 import plotly.graph_objs as go
 import plotly.express as px
 
+from analytics import (decimated_trace, features_metrics, features_trajectory, relayout_x_range, series_features,
+                       span_days, threshold_sweep, window)
 from app_instance import app
+from data_io import parse_filename, read_upload
+from dataset_library import LIBRARY_PREFIX, fetch_dataset, library_options, load_index, load_upload
+from worker_pool import map_series
 
 # Distinct, stable colours so a series keeps the same colour across every chart.
 SERIES_COLORS = px.colors.qualitative.Dark24
 
+# Widths of the active-minutes trend bins, in days. "Monthly" bins are a fixed
+# 30 days so series stay comparable when aligned by elapsed time.
+TREND_BIN_DAYS = {"daily": 1, "weekly": 7, "monthly": 30}
+
 # Ratio of longest-to-shortest span above which a note reminds the reader to
 # lean on per-day rates rather than raw totals for a fair comparison.
 DISPARITY_THRESHOLD = 2.0
@@ -32,61 +38,31 @@ DISPARITY_THRESHOLD = 2.0
 # Pure helpers (no Dash dependencies) so they can be tested in isolation
 # ---------------------------------------------------------------------------
 
-def read_series_csv(contents):
+def read_series_csv(contents, filename=None):
     """
-    Decode one uploaded file into a timestamp/steps dataframe.
+    Decode one uploaded file (CSV, the binary .npz format or a device .RAW
+    download) into a timestamp/steps dataframe.
 
-    contents: base64 "data:...," string from a dcc.Upload
+    contents: base64 "data:...," string from a dcc.Upload, or a chunked upload marker
+    filename: uploaded filename, used to recognise the binary formats
     """
-    _, content_string = contents.split(",")
-    decoded = base64.b64decode(content_string)
-    df = pd.read_csv(io.StringIO(decoded.decode("utf-8")))
-    if df.columns[0] == "timestamp" and df.columns[1] == "steps":
-        pass  # CSV has a header row
-    else:
-        # Headerless (the app exports headerless CSVs); keep every row.
-        df = pd.read_csv(io.StringIO(decoded.decode("utf-8")), names=["timestamp", "steps"])
-    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    df = read_upload(contents, filename)
     df = df.sort_values("timestamp").reset_index(drop=True)
     return df
 
 
-def parse_filename(fname):
-    """
-    Extract (participant_id, quarter, device) from the naming convention
-    Subject{pid}_{quarter}.{device}.csv (e.g. Subject109_1.1.csv). Any part
-    that does not match (e.g. a merged export) comes back as None so callers
-    degrade gracefully.
-    """
-    stem = fname or ""
-    if stem.lower().endswith(".csv"):
-        stem = stem[:-4]
-    parts = stem.split("_")
-    raw_id = parts[0] if parts and parts[0] else stem
-    match = re.search(r"(\d+)", raw_id)
-    pid = match.group(1) if match else (raw_id or "?")
-
-    quarter = device = None
-    if len(parts) > 1:
-        seg = parts[1].split(".")
-        if seg and seg[0].isdigit():
-            quarter = int(seg[0])
-        if len(seg) > 1 and seg[1].isdigit():
-            device = int(seg[1])
-    return pid, quarter, device
-
-
 def parse_series(contents_list, filenames_list):
     """
     Turn the uploaded files into a chronologically ordered list of series dicts:
-    {pid, quarter, device, label, start, end, data(json)}. Labels are concise
-    and context-aware: just the quarter (Q1) when every file is the same
+    {pid, quarter, device, label, start, end, key}. The data itself is kept in
+    the server-side dataset cache under `key`. Labels are concise and
+    context-aware: just the quarter (Q1) when every file is the same
     participant, otherwise the participant too (P109 Q1).
     """
     raw = []
     for contents, fname in zip(contents_list or [], filenames_list or []):
         try:
-            df = read_series_csv(contents)
+            key, df = load_upload(contents, fname, read_series_csv)
         except Exception as e:
             print(f"Could not read {fname}: {e}")
             continue
@@ -94,7 +70,7 @@ def parse_series(contents_list, filenames_list):
             continue
         pid, quarter, device = parse_filename(fname)
         raw.append({
-            "pid": pid, "quarter": quarter, "device": device, "df": df,
+            "pid": pid, "quarter": quarter, "device": device, "df": df, "key": key,
             "start": df["timestamp"].min(), "end": df["timestamp"].max(),
         })
 
@@ -117,7 +93,7 @@ def parse_series(contents_list, filenames_list):
             "label": label,
             "start": r["start"].isoformat(),
             "end": r["end"].isoformat(),
-            "data": r["df"].to_json(orient="split", date_format="iso"),
+            "key": r["key"],
         })
 
     # Order chronologically by start.
@@ -137,12 +113,16 @@ def parse_series(contents_list, filenames_list):
 
 
 def load_series(series_list):
-    """Return [(series_dict, dataframe), ...] with parsed timestamps."""
+    """
+    Return [(series_dict, dataframe), ...] from the dataset cache, reopening
+    evicted datasets from the library. Series whose data is in neither are
+    skipped (update_banner reports them).
+    """
     out = []
     for s in series_list:
-        df = pd.read_json(io.StringIO(s["data"]), orient="split")
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-        out.append((s, df))
+        df = fetch_dataset(s["key"])
+        if df is not None:
+            out.append((s, df))
     return out
 
 
@@ -151,100 +131,16 @@ def series_color(index):
     return SERIES_COLORS[index % len(SERIES_COLORS)]
 
 
-def days_with_data(df):
-    """Number of distinct calendar days that actually have readings."""
-    return int(df["timestamp"].dt.floor("D").nunique())
-
-
-def span_days(df):
-    """Calendar span of a series, inclusive, in days."""
-    return int((df["timestamp"].max() - df["timestamp"].min()).days) + 1
-
-
-def resample_with_gaps(df, freq):
-    """
-    Resample steps at `freq` (e.g. "D", "h"). Bins with no underlying rows
-    become NaN (device off / not worn) rather than 0, so a genuine 0-step
-    reading and "no data" are never conflated.
-    """
-    grouped = df.set_index("timestamp").resample(freq)["steps"]
-    totals = grouped.sum()
-    counts = grouped.count()
-    totals[counts == 0] = np.nan
-    return totals
-
-
-def trajectory(df, align, freq_days=7):
-    """
-    Per-day average of the `steps` column within fixed-width bins.
-
-    align: "calendar" -> x is the absolute date of each bin start
-           "elapsed"  -> x is days since this series' own start
-    Returns (x_values, y_values).
-    """
-    d = df[["timestamp", "steps"]].copy()
-    start = d["timestamp"].min()
-    d["bin"] = ((d["timestamp"] - start).dt.days // freq_days)
-
-    grp = d.groupby("bin")
-    total = grp["steps"].sum()
-    ndays = grp["timestamp"].apply(lambda s: s.dt.floor("D").nunique())
-    rate = total / ndays.replace(0, np.nan)
-
-    if align == "elapsed":
-        x = [int(b) * freq_days for b in rate.index]
-    else:
-        x = [start + pd.Timedelta(days=int(b) * freq_days) for b in rate.index]
-    return x, list(rate.values)
-
-
-def hour_of_day_profile(df):
-    """Average steps during each hour of day on a typical recorded day."""
-    d = df[["timestamp", "steps"]].copy()
-    n_days = days_with_data(df) or 1
-    total = d.groupby(d["timestamp"].dt.hour)["steps"].sum()
-    return total / n_days
-
-
-def day_of_week_profile(df):
-    """Average total steps on each weekday (0=Mon .. 6=Sun)."""
-    d = df[["timestamp", "steps"]].copy()
-    weekday = d["timestamp"].dt.weekday
-    date = d["timestamp"].dt.floor("D")
-    total = d.groupby(weekday)["steps"].sum()
-    ndays = date.groupby(weekday).nunique()
-    return total / ndays.replace(0, np.nan)
-
-
-# Nominal sampling period of the logger, in minutes (see interval_minutes).
-SAMPLE_MINUTES = 5
-
-def interval_minutes(df):
+def load_features(loaded):
     """
-    Minutes attributable to each reading: the time until the next reading,
-    capped at SAMPLE_MINUTES and aligned to df's index. Stays correct when the
-    spacing is not exactly 5 minutes (merge seams) and never counts an untracked
-    gap as tracked time; reduces to a flat SAMPLE_MINUTES for even sampling.
+    Per-series features (see analytics.series_features) of the loaded
+    (series_dict, dataframe) pairs. They are computed once per upload, in the
+    worker pool, and cached with each dataset; every comparison view renders
+    from them. Hourly and daily totals are NaN for bins with no underlying
+    rows (device off / not worn) rather than 0, so a genuine 0-step reading
+    and "no data" are never conflated.
     """
-    ordered = df.sort_values("timestamp")
-    mins = ordered["timestamp"].diff().shift(-1).dt.total_seconds().div(60)
-    mins = mins.clip(upper=SAMPLE_MINUTES).fillna(SAMPLE_MINUTES)
-    return mins.reindex(df.index)
-
-
-def series_metrics(df, threshold):
-    """Per-series summary metrics (rate-normalised where relevant)."""
-    n_days = days_with_data(df) or 1
-    total_steps = int(df["steps"].sum())
-    active_intervals = int((df["steps"] >= threshold).sum())
-    active_min_total = float(interval_minutes(df)[df["steps"] >= threshold].sum())
-    return {
-        "span_days": span_days(df),
-        "days_with_data": days_with_data(df),
-        "total_steps": total_steps,
-        "steps_per_day": round(total_steps / n_days, 1),
-        "active_min_per_day": round(active_min_total / n_days, 1)
-    }
+    return map_series([(s["key"], df) for s, df in loaded], "features", series_features)
 
 
 def disparity_ratio(loaded):
@@ -282,7 +178,13 @@ data_comparison_layout = html.Div([
                     html.A("Select Files"),
                 ]),
                 multiple=True,
-                className="upload-box mb-2",
+                className="upload-box chunked-upload mb-2",
+            ),
+            dcc.Dropdown(
+                id="comparison-library-picker",
+                placeholder="Or add a dataset from the library...",
+                clearable=False,
+                className="mb-2",
             ),
             html.Div(id="comparison-file-status", className="mb-2"),
             html.Div(id="comparison-banner", className="mb-2"),
@@ -321,7 +223,7 @@ data_comparison_layout = html.Div([
                 className="row", style={"margin-bottom": "10px"},
             ),
 
-            # Trend / trajectory (weekly-binned active minutes per day)
+            # Trend / trajectory (binned active minutes per day)
             dbc.Row(
                 dbc.Col([
                     html.H4("Active Minutes Trend Over Time", className="color-main"),
@@ -338,6 +240,18 @@ data_comparison_layout = html.Div([
                                 labelStyle={"display": "inline-block", "margin-right": "15px"},
                                 inputStyle={"margin-right": "4px"},
                             ),
+                            html.Label("Bin by:", style={"margin-right": "10px"}),
+                            dcc.RadioItems(
+                                id="comparison-trend-bin",
+                                options=[
+                                    {"label": " Day", "value": "daily"},
+                                    {"label": " Week", "value": "weekly"},
+                                    {"label": " Month (30 days)", "value": "monthly"},
+                                ],
+                                value="weekly",
+                                labelStyle={"display": "inline-block", "margin-right": "15px"},
+                                inputStyle={"margin-right": "4px"},
+                            ),
                         ], width=12),
                         className="row",
                         style={"margin-bottom": "5px"},
@@ -397,9 +311,15 @@ data_comparison_layout = html.Div([
                             dbc.Button(
                                 [html.I(className="fas fa-file-csv"), " Download Values (CSV)"],
                                 id="comparison-values-btn", color="primary", outline=True,
+                                className="me-2", disabled=True,
+                            ),
+                            dbc.Button(
+                                [html.I(className="fas fa-sliders"), " Download Threshold Sweep (CSV)"],
+                                id="comparison-sweep-btn", color="primary", outline=True,
                                 disabled=True,
                             ),
                             dcc.Download(id="comparison-values-csv"),
+                            dcc.Download(id="comparison-sweep-csv"),
                             html.Div(id="comparison-pdf-dummy", style={"display": "none"}),
                         ],
                         style={"margin-top": "10px", "text-align": "right"},
@@ -428,6 +348,34 @@ def _prepared(series):
     return load_series(series)
 
 
+@app.callback(
+    Output("comparison-library-picker", "options"),
+    Input("url", "pathname"),
+    Input("comparison-series", "data"),
+)
+def update_library_options(pathname, series):
+    """List the library datasets, refreshed when the page opens and after each upload."""
+    return library_options()
+
+
+@app.callback(
+    Output("comparison-upload", "contents"),
+    Output("comparison-upload", "filename"),
+    Output("comparison-library-picker", "value"),
+    Input("comparison-library-picker", "value"),
+    State("comparison-upload", "contents"),
+    State("comparison-upload", "filename"),
+    prevent_initial_call=True,
+)
+def add_library_dataset(key, contents, filenames):
+    """Add a library dataset to the compared files, as if it had been uploaded with them."""
+    entry = load_index().get(key) if key else None
+    if entry is None or LIBRARY_PREFIX + key in (contents or []):
+        raise PreventUpdate
+    return (list(contents or []) + [LIBRARY_PREFIX + key],
+            list(filenames or []) + [entry["filename"]], None)
+
+
 @app.callback(
     Output("comparison-series", "data"),
     Output("comparison-file-status", "children"),
@@ -445,6 +393,8 @@ def store_series(contents, filenames):
     if not series:
         return None, html.Div("No valid data files found.",
                               style={"color": "indianred", "margin-left": "15px"}), "calendar"
+    # Compute every series' features up front, in parallel, for all the views
+    load_features(load_series(series))
 
     items = []
     for i, s in enumerate(series):
@@ -483,16 +433,24 @@ def store_series(contents, filenames):
     Output("comparison-banner", "children"),
     Output("comparison-pdf-btn", "disabled"),
     Output("comparison-values-btn", "disabled"),
+    Output("comparison-sweep-btn", "disabled"),
     Input("comparison-series", "data"),
 )
 def update_banner(series):
     """Guardrail banners + enable exports once there is data."""
     if not series:
-        return None, True, True
+        return None, True, True, True
 
     loaded = load_series(series)
     msgs = []
 
+    loaded_keys = {s["key"] for s, _ in loaded}
+    missing = [s["label"] for s in series if s["key"] not in loaded_keys]
+    if missing:
+        msgs.append(html.Div(
+            f"No longer loaded: {', '.join(missing)}. Upload these files again to include them.",
+            style={"color": "indianred"}))
+
     pids = {s["pid"] for s in series}
     if len(pids) > 1:
         msgs.append(html.Div(
@@ -511,7 +469,7 @@ def update_banner(series):
                              style={"color": "indianred"}))
 
     disabled = len(series) < 1
-    return html.Div(msgs, style={"margin-left": "15px"}), disabled, disabled
+    return html.Div(msgs, style={"margin-left": "15px"}), disabled, disabled, disabled
 
 
 @app.callback(
@@ -525,12 +483,13 @@ def update_metrics(series, threshold):
         return _no_data()
 
     loaded = _prepared(series)
+    features = load_features(loaded)
 
     header = ["Series", "Total Days with Data", "Total Steps", "Avg Steps/Day", "Avg Active Min/Day"]
 
     rows = []
-    for i, (s, df) in enumerate(loaded):
-        m = series_metrics(df, threshold)
+    for i, ((s, df), f) in enumerate(zip(loaded, features)):
+        m = features_metrics(f, threshold)
         rows.append(html.Tr([
             html.Td([html.Span("● ", style={"color": series_color(i)}), s["label"]]),
             html.Td(m["days_with_data"]),
@@ -558,16 +517,19 @@ def update_direct(series, active_tab):
     loaded = _prepared(series)
     fig = go.Figure()
 
-    for i, (s, df) in enumerate(loaded):
+    for i, ((s, df), f) in enumerate(zip(loaded, load_features(loaded))):
         color = series_color(i)
         if active_tab == "direct-raw":
+            # Broken across untracked gaps and decimated per series;
+            # update_direct_zoom restores full resolution on zoom
+            trace = f["raw_trace"]
             fig.add_trace(go.Scatter(
-                x=df["timestamp"], y=df["steps"], mode="lines",
+                x=trace["timestamp"], y=trace["steps"], mode="lines",
                 name=s["label"], line={"color": color},
+                connectgaps=False,
             ))
         else:
-            freq = "h" if active_tab == "direct-hourly" else "D"
-            resampled = resample_with_gaps(df, freq)
+            resampled = f["hourly"] if active_tab == "direct-hourly" else f["daily"]
             fig.add_trace(go.Scatter(
                 x=resampled.index, y=resampled.values, mode="lines+markers",
                 name=s["label"], line={"color": color},
@@ -581,35 +543,51 @@ def update_direct(series, active_tab):
         hoverlabel={"bgcolor": "white", "font_size": 14, "font_family": "Roboto"},
         legend={"orientation": "h", "y": -0.2},
     )
-    return dcc.Graph(figure=fig)
+    return dcc.Graph(figure=fig, id="comparison-direct-graph")
+
+
+@app.callback(
+    Output("comparison-direct-graph", "figure"),
+    [Input("comparison-direct-graph", "relayoutData")],
+    [State("comparison-series", "data"),
+     State("comparison-direct-tab", "active_tab")],
+    prevent_initial_call=True,
+)
+def update_direct_zoom(relayout_data, series, active_tab):
+    """Re-query the raw overlay for the zoomed window at full resolution."""
+    x_range = relayout_x_range(relayout_data)
+    if x_range is None or active_tab != "direct-raw" or not series:
+        raise PreventUpdate
+
+    # Only swap each trace's points so the current zoom is kept
+    patched = Patch()
+    for i, (_, df) in enumerate(_prepared(series)):
+        visible = decimated_trace(window(df, *x_range))
+        patched["data"][i]["x"] = visible["timestamp"].to_numpy()
+        patched["data"][i]["y"] = visible["steps"].to_numpy()
+    return patched
 
 
 @app.callback(
     Output("comparison-trend", "children"),
     [Input("comparison-series", "data"),
      Input("comparison-align", "value"),
-     Input("comparison-active-slider", "value")],
+     Input("comparison-active-slider", "value"),
+     Input("comparison-trend-bin", "value")],
 )
-def update_trend(series, align, threshold):
-    """Weekly-binned active minutes per day over time, one line per series."""
+def update_trend(series, align, threshold, bin_width):
+    """Binned active minutes per day over time, one line per series."""
     if not series:
         return _no_data()
 
     loaded = _prepared(series)
     fig = go.Figure()
-    bin_days = 7  # weekly bins
-
-    for i, (s, df) in enumerate(loaded):
-        # Weight each interval by its actual duration in minutes (capped at the
-        # sampling period) when active, else 0, so the trajectory averages to
-        # active minutes per day within each week — correct even across merge
-        # seams where the spacing is not exactly 5 minutes.
-        work = df.copy()
-        work["steps"] = np.where(df["steps"] >= threshold, interval_minutes(df), 0.0)
-        x, y = trajectory(work, align, bin_days)
+    bin_days = TREND_BIN_DAYS.get(bin_width, 7)
 
+    for i, ((s, df), f) in enumerate(zip(loaded, load_features(loaded))):
+        x, y = features_trajectory(f, threshold, align, bin_days)
         fig.add_trace(go.Scatter(
-            x=x, y=list(y), mode="lines+markers", name=s["label"],
+            x=x, y=y, mode="lines+markers", name=s["label"],
             line={"color": series_color(i)}, connectgaps=False,
         ))
 
@@ -635,8 +613,8 @@ def update_tod(series):
 
     loaded = _prepared(series)
     fig = go.Figure()
-    for i, (s, df) in enumerate(loaded):
-        prof = hour_of_day_profile(df).reindex(range(24))
+    for i, ((s, df), f) in enumerate(zip(loaded, load_features(loaded))):
+        prof = f["hour_of_day"]
         fig.add_trace(go.Scatter(
             x=list(prof.index), y=list(prof.values), mode="lines",
             name=s["label"], line={"color": series_color(i)},
@@ -660,8 +638,8 @@ def update_dow(series):
 
     loaded = _prepared(series)
     fig = go.Figure()
-    for i, (s, df) in enumerate(loaded):
-        prof = day_of_week_profile(df).reindex(range(7))
+    for i, ((s, df), f) in enumerate(zip(loaded, load_features(loaded))):
+        prof = f["day_of_week"]
         fig.add_trace(go.Scatter(
             x=WEEKDAY_LABELS, y=list(prof.values), mode="lines",
             name=s["label"], line={"color": series_color(i)},
@@ -685,8 +663,8 @@ def update_dist(series):
 
     loaded = _prepared(series)
     fig = go.Figure()
-    for i, (s, df) in enumerate(loaded):
-        daily = resample_with_gaps(df, "D").dropna()
+    for i, ((s, df), f) in enumerate(zip(loaded, load_features(loaded))):
+        daily = f["daily"].dropna()
         fig.add_trace(go.Box(
             y=list(daily.values), name=s["label"],
             marker_color=series_color(i), boxpoints="outliers",
@@ -710,8 +688,8 @@ def update_activity(series, threshold):
 
     loaded = _prepared(series)
     labels, values, colors = [], [], []
-    for i, (s, df) in enumerate(loaded):
-        m = series_metrics(df, threshold)
+    for i, ((s, df), f) in enumerate(zip(loaded, load_features(loaded))):
+        m = features_metrics(f, threshold)
         labels.append(s["label"])
         values.append(m["active_min_per_day"])
         colors.append(series_color(i))
@@ -753,8 +731,8 @@ def download_values(n_clicks, series, threshold, comment):
 
     loaded = _prepared(series)
     records = []
-    for s, df in loaded:
-        m = series_metrics(df, threshold)
+    for (s, df), f in zip(loaded, load_features(loaded)):
+        m = features_metrics(f, threshold)
         records.append({
             "Series": s["label"],
             "Participant": s["pid"],
@@ -766,10 +744,35 @@ def download_values(n_clicks, series, threshold, comment):
             "Total steps": m["total_steps"],
             "Steps/day": m["steps_per_day"],
             "Active min/day": m["active_min_per_day"],
-            "Active step threshold": threshold,
+            "Active Step Threshold": threshold,
             "Comment": (comment or "").replace("\r", " ").replace("\n", " ").strip(),
         })
 
     out = pd.DataFrame(records)
     export_name = f"comparison_summary_{datetime.now().strftime('%Y%m%d%H%M%S')}.csv"
     return dcc.send_data_frame(out.to_csv, export_name, index=False)
+
+
+@app.callback(
+    Output("comparison-sweep-csv", "data"),
+    Input("comparison-sweep-btn", "n_clicks"),
+    State("comparison-series", "data"),
+    prevent_initial_call=True,
+)
+def download_sweep(n_clicks, series):
+    """Export active min/day of every series for each threshold 1-100 as a CSV."""
+    if not n_clicks or not series:
+        return None
+
+    loaded = _prepared(series)
+    out = None
+    for (s, df), f in zip(loaded, load_features(loaded)):
+        sweep = threshold_sweep(f["threshold_index"], f["days_with_data"])
+        if out is None:
+            out = pd.DataFrame({"Active Step Threshold": sweep["threshold"]})
+        out[f"{s['label']} active min/day"] = sweep["active_min_per_day"].round(1)
+
+    if out is None:
+        return None
+    export_name = f"comparison_threshold_sweep_{datetime.now().strftime('%Y%m%d%H%M%S')}.csv"
+    return dcc.send_data_frame(out.to_csv, export_name, index=False)
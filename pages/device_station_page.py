@@ -0,0 +1,204 @@
+"""
+Import Libraries
+"""
+import datetime
+
+import pytz
+from dash import dcc, html, dash_table, Input, Output, State, callback_context
+import dash
+import dash_bootstrap_components as dbc
+
+from app_instance import app
+import device_manager
+
+# Columns of the device status table; only the file name is edited by the user
+STATION_COLUMNS = [
+    {"name": "Port", "id": "port", "editable": False},
+    {"name": "Device Status", "id": "status", "editable": False},
+    {"name": "File Name", "id": "filename", "editable": True},
+    {"name": "State", "id": "state", "editable": False},
+    {"name": "Progress", "id": "progress", "editable": False},
+]
+
+curr_date = datetime.datetime.now()
+
+# Define the layout of the device station page
+device_station_layout = html.Div([
+    dbc.Container(
+        [
+            html.H3("Device Station", className="color-main"),
+            html.Div(
+                "Dock several devices, scan for them, then initialize or download the selected "
+                "devices all at once. Each device keeps its own connection and status.",
+                className="color-sub",
+                style={"margin-bottom": "15px"},
+            ),
+            dbc.Button([html.I(className="fas fa-search"), " Scan for Devices"],
+                       id="station-scan-btn", className="initialize-btn mb-3"),
+            dash_table.DataTable(
+                id="station-table",
+                columns=STATION_COLUMNS,
+                data=[],
+                row_selectable="multi",
+                selected_rows=[],
+                editable=True,
+                style_cell={"textAlign": "left", "padding": "6px"},
+                style_header={"fontWeight": "bold"},
+            ),
+            html.Div(id="station-status", className="mt-2 mb-4"),
+
+            html.H5("Initialize Selected Devices", className="color-sub"),
+            dbc.Row([
+                dbc.Col([
+                    html.Label("Date", className="dropdown-label"),
+                    dcc.DatePickerSingle(
+                        id="station-date",
+                        min_date_allowed=curr_date.date(),
+                        max_date_allowed=curr_date.date() + datetime.timedelta(days=60),
+                        initial_visible_month=curr_date.date(),
+                        date=curr_date.date(),
+                    ),
+                ], width="auto"),
+                dbc.Col([
+                    html.Label("Hour (24)", className="dropdown-label"),
+                    dcc.Dropdown(id="station-hour", options=[{"label": f"{i:02d}", "value": i} for i in range(24)],
+                                 value=curr_date.hour, clearable=False, style={"width": "100px"}),
+                ], width="auto"),
+                dbc.Col([
+                    html.Label("Minute", className="dropdown-label"),
+                    dcc.Dropdown(id="station-minute", options=[{"label": f"{i:02d}", "value": i} for i in range(60)],
+                                 value=curr_date.minute, clearable=False, style={"width": "100px"}),
+                ], width="auto"),
+                dbc.Col(
+                    dbc.Button("Initialize Selected", id="station-initialize-btn", className="initialize-btn"),
+                    width="auto", align="end"
+                ),
+            ], className="mb-4"),
+
+            html.H5("Download Selected Devices", className="color-sub"),
+            dbc.Row([
+                dbc.Col(
+                    dbc.Select(
+                        id="station-filetype",
+                        options=[
+                            {"label": ".RAW", "value": "1"},
+                            {"label": ".CSV", "value": "2"}
+                        ],
+                        value="2",
+                    ),
+                    width=2
+                ),
+                dbc.Col(
+                    dbc.Button([html.I(className="fas fa-file-download mr-2"), " Download Selected"],
+                               id="station-download-btn", className="download-btn"),
+                    width="auto"
+                ),
+            ]),
+            html.Div(f"Files are saved to {device_manager.DOWNLOAD_DIR}", className="color-sub mt-2"),
+            dcc.Interval(id="station-poll", interval=1000, disabled=True),
+        ],
+        fluid=True,
+        style={"padding": "40px"}
+    )
+])
+
+def merge_filenames(rows, table_data):
+    """
+    Keep the file names typed into the table for devices that have not been
+    downloaded yet
+
+    rows: fresh device rows (see device_manager.device_rows)
+    table_data: rows currently shown in the table
+    """
+    typed = {row["port"]: row.get("filename") for row in table_data or []}
+    for row in rows:
+        if not row["filename"] and typed.get(row["port"]):
+            row["filename"] = typed[row["port"]]
+    return rows
+
+def station_epoch(date, hour, minute):
+    """
+    Initialization time in seconds since the epoch, from the date and time pickers
+
+    date: selected date ("YYYY-MM-DD")
+    hour: selected hour
+    minute: selected minute
+    """
+    selected_datetime = datetime.datetime.strptime(date[:10], "%Y-%m-%d")
+    selected_datetime = selected_datetime.replace(hour=int(hour), minute=int(minute))
+    selected_datetime = pytz.timezone("UTC").localize(selected_datetime)
+    return int(selected_datetime.timestamp())
+
+@app.callback(
+    Output("station-table", "data"),
+    Output("station-status", "children"),
+    Output("station-poll", "disabled"),
+    [Input("station-scan-btn", "n_clicks"),
+     Input("station-initialize-btn", "n_clicks"),
+     Input("station-download-btn", "n_clicks"),
+     Input("station-poll", "n_intervals")],
+    [State("station-table", "data"),
+     State("station-table", "selected_rows"),
+     State("station-date", "date"),
+     State("station-hour", "value"),
+     State("station-minute", "value"),
+     State("station-filetype", "value")],
+)
+def update_station(scan_click, initialize_click, download_click, n_intervals,
+                   table_data, selected_rows, date, hour, minute, filetype):
+    """
+    Scan for devices, start initializing or downloading the selected ones, and
+    refresh the status table while any of them is busy
+
+    scan_click: "Scan for Devices" button click instance
+    initialize_click: "Initialize Selected" button click instance
+    download_click: "Download Selected" button click instance
+    n_intervals: poll interval instance
+    table_data: rows currently shown in the table
+    selected_rows: indices of the selected rows
+    date: initialization date
+    hour: initialization hour
+    minute: initialization minute
+    filetype: "1" for .RAW, "2" for .CSV
+    """
+    triggered_id = callback_context.triggered[0]["prop_id"].split(".")[0] if callback_context.triggered else None
+    selected = [table_data[i] for i in selected_rows or [] if i < len(table_data or [])]
+    # Polling only refreshes the table and leaves the last message alone
+    status = dash.no_update if triggered_id == "station-poll" else None
+
+    try:
+        if triggered_id == "station-scan-btn":
+            if device_manager.is_busy():
+                status = html.Div("Wait for the running operations to finish before scanning again.",
+                                  style={"color": "indianred"})
+            else:
+                rows = device_manager.scan()
+                status = html.Div(f"Found {len(rows)} device(s).", style={"color": "steelblue"})
+
+        elif triggered_id == "station-initialize-btn":
+            if not selected:
+                status = html.Div("Select the devices to initialize.", style={"color": "indianred"})
+            else:
+                epoch_time = station_epoch(date, hour, minute)
+                started = device_manager.initialize([row["port"] for row in selected], epoch_time)
+                status = html.Div(f"Initializing {len(started)} device(s).", style={"color": "steelblue"})
+
+        elif triggered_id == "station-download-btn":
+            missing = [row["port"] for row in selected if not (row.get("filename") or "").strip()]
+            if not selected:
+                status = html.Div("Select the devices to download.", style={"color": "indianred"})
+            elif missing:
+                status = html.Div(f"Enter a file name for {', '.join(missing)}.", style={"color": "indianred"})
+            elif not all(device_manager.is_valid_filename(row["filename"].strip()) for row in selected):
+                status = html.Div("File names cannot contain \"/\" or \"\\\" or name a folder.",
+                                  style={"color": "indianred"})
+            else:
+                files = {row["port"]: row["filename"].strip() for row in selected}
+                started = device_manager.download(files, str(filetype) == "2")
+                status = html.Div(f"Downloading {len(started)} device(s).", style={"color": "steelblue"})
+    except Exception as e:
+        print(f"Following exception triggered: {e}")
+        status = html.Div(f"Error: {e}", style={"color": "indianred"})
+
+    rows = merge_filenames(device_manager.device_rows(), table_data)
+    return rows, status, not device_manager.is_busy()
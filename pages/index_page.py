@@ -4,18 +4,18 @@ Import Libraries
 import datetime
 import json
 import os
-import base64
-import io
 import tempfile
 
 import pytz
 from dash import dcc, html, Input, Output, State, callback_context
 import dash
 import dash_bootstrap_components as dbc
-import pandas as pd
 
 from app_instance import app
+from data_io import BINARY_EXTENSION, read_upload, write_binary
+from dataset_merge import merge_datasets, merged_frame, write_csv
 import arduino
+import download_jobs
 
 def set_modal_content(initialize=False, selected_dt=None, download=False, merge=False, error=None, footer_view="None"):
     """
@@ -70,13 +70,9 @@ def set_modal_content(initialize=False, selected_dt=None, download=False, merge=
             ),
             html.Div("Enter your filename."),
             dbc.Input(id="download-filename", placeholder="Subject(UID)_(Quarter).(DeviceIteration)", value="Subject_", required=True, className="mb-2"),
-            dcc.Loading(
-                id="loading-download",
-                type="circle",
-                children=[
-                    html.Div(id="download-file-status")
-                ]
-            )
+            html.Div(id="download-file-status"),
+            # Filled in live from the "download_progress" Socket.IO events (assets/websocket.js)
+            html.Div(id="download-progress-text", className="color-sub")
         ]
     elif merge:
         status_msg= [
@@ -95,8 +91,18 @@ def set_modal_content(initialize=False, selected_dt=None, download=False, merge=
                     html.A("Select Files")
                 ]),
                 multiple=True,
-                className="upload-box mb-2"),
+                className="upload-box chunked-upload mb-2"),
             html.Div(id="upload-merge-file-status", className="mb-4"),
+            html.Div("Select the format of the merged file."),
+            dbc.Select(
+                id="merge-filetype",
+                options=[
+                    {"label": ".CSV", "value": "csv"},
+                    {"label": "Binary (.NPZ)", "value": "binary"}
+                ],
+                value="csv",
+                className="mb-4"
+            ),
             dbc.Button("Download Merged Data", id="download-data-merge-btn", className="merge-btn mb-2"),
             dcc.Loading(
                 id="loading-download",
@@ -199,7 +205,9 @@ def set_modal_content(initialize=False, selected_dt=None, download=False, merge=
             ],
             className="flex-container"
         ),
-        dcc.Download(id="download-data")
+        dcc.Download(id="download-data"),
+        dcc.Store(id="download-job"),
+        dcc.Interval(id="download-poll", interval=1000, disabled=True)
     ]
 
     # Generate modal footer content
@@ -280,6 +288,7 @@ def index_layout():
         3. Data Analysis (Single Dataset)
         4. Data Comparison (Multiple Datasets)
         5. Data Merge
+        6. Device Station (Multiple Devices)
     """
     return html.Div(
         [
@@ -328,6 +337,15 @@ def index_layout():
                 outline=True,
                 className="m-4 page-btn"
             ),
+            dbc.Button(
+                [
+                    html.I(className="fas fa-network-wired page-btn-icon"),
+                    "Device Station (Multiple Devices)"
+                ],
+                href="/device-station",
+                outline=True,
+                className="m-4 page-btn"
+            ),
             dbc.Modal(
                 [dbc.ModalHeader("Action")] + set_modal_content(),
                 id="action-modal",
@@ -473,7 +491,9 @@ def register_index_callbacks():
             [Output("download-data", "data"),
             Output("download-filename", "style"),
             Output("download-file-status", "children"),
-            Output("download-btn", "disabled", allow_duplicate=True)],
+            Output("download-btn", "disabled", allow_duplicate=True),
+            Output("download-job", "data"),
+            Output("download-poll", "disabled")],
             [Input("download-filetype", "value"),
             Input("download-filename", "value"),
             Input("download-btn", "n_clicks")],
@@ -481,7 +501,8 @@ def register_index_callbacks():
             prevent_initial_call=True)
     def download_data(filetype, filename, download_click, modal_open_state):
         """
-        Download the Arduino data in a specified format
+        Start downloading the Arduino data in a specified format. The transfer
+        runs in the background; poll_download hands over the finished file.
 
         filetype: input filetype (e.g., csv, raw)
         filename: input filename (e.g., Subject1234_1.1.csv)
@@ -498,23 +519,60 @@ def register_index_callbacks():
         if ctx.triggered and ctx.triggered[0]['prop_id'].endswith('.n_clicks'):
             if not filename or filename.strip() == "":
                 file_status = html.Div("Please enter a filename.", style={"color": "indianred"})
-                return (None, {"bordercolor": "red", "boxShadow": "0 0 0 0.25rem rgb(255 0 0 / 25%)"}, file_status, False)
+                return (None, {"bordercolor": "red", "boxShadow": "0 0 0 0.25rem rgb(255 0 0 / 25%)"}, file_status, False,
+                        None, True)
 
-            if filetype == 1:
+            # The select reports its value as a string once the user changes it
+            if str(filetype) == "1":
                 filename = f"{filename}.raw"
                 get_readable = False
-            elif filetype == 2:
+            else:
                 filename = f"{filename}.csv"
                 get_readable = True
 
             tmp_path = os.path.join(tempfile.gettempdir(), filename)
-            arduino.download_file(tmp_path, get_readable)
+            job_id = download_jobs.start_download(tmp_path, get_readable)
 
-            # Update the file download status
-            file_status = html.Div("Download Complete", style={"color": "mediumseagreen"})
-            return (dcc.send_file(tmp_path), {}, file_status, False)
+            # Keep the button disabled until the transfer finishes
+            file_status = html.Div("Downloading...", style={"color": "steelblue"})
+            return (None, {}, file_status, True, job_id, False)
 
-        return (None, {}, None, False)
+        # Leave a running transfer's status alone while the inputs are edited
+        if download_jobs.is_downloading():
+            raise dash.exceptions.PreventUpdate
+
+        return (None, {}, None, False, None, True)
+
+    @app.callback(
+            [Output("download-data", "data", allow_duplicate=True),
+            Output("download-file-status", "children", allow_duplicate=True),
+            Output("download-btn", "disabled", allow_duplicate=True),
+            Output("download-job", "data", allow_duplicate=True),
+            Output("download-poll", "disabled", allow_duplicate=True)],
+            [Input("download-poll", "n_intervals")],
+            [State("download-job", "data")],
+            prevent_initial_call=True)
+    def poll_download(n_intervals, job_id):
+        """
+        Hand the file to the browser once the background download has finished
+
+        n_intervals: poll interval instance
+        job_id: id of the running download job
+        """
+        job = download_jobs.get_job(job_id)
+        if job is None:
+            return (None, dash.no_update, False, None, True)
+        if job["status"] == "running":
+            raise dash.exceptions.PreventUpdate
+
+        download_jobs.finish_job(job_id)
+        if job["status"] == "error":
+            file_status = html.Div(f"Download Failed: {job['error']}", style={"color": "indianred"})
+            return (None, file_status, False, None, True)
+
+        # Update the file download status
+        file_status = html.Div(f"Download Complete (CRC32 {job['crc32']})", style={"color": "mediumseagreen"})
+        return (dcc.send_file(job["path"]), file_status, False, None, True)
 
 
     @app.callback(
@@ -579,71 +637,34 @@ def register_index_callbacks():
         Output("download-merge-df-status", "children"),
         [Input("merge-data", "contents"),
         Input("download-data-merge-btn", "n_clicks")],
-        [State("merge-data", "filename")],
+        [State("merge-data", "filename"),
+        State("merge-filetype", "value")],
         prevent_initial_call=True
     )
-    def merge_data(merge_contents, merge_btn, merge_filenames):
+    def merge_data(merge_contents, merge_btn, merge_filenames, merge_filetype):
         """
-        Merge two or more csv files with the same format into a single dataset.
+        Merge two or more csv (or binary .npz / .raw) files into a single dataset.
         The files may be uploaded in any order; the result is ordered by time.
 
         merge_contents: list of files that will be merged
         merge_btn: "Download Merged Data" button click instance
         merge_filenames: list of the uploaded filenames
+        merge_filetype: format of the merged file ("csv" or "binary")
         """
         # Ensure that at least two files are read
         if not merge_contents or len(merge_contents) < 2: return None, None
 
-        def read_csv(data):
-            _, content_string = data.split(",")
-            decoded = base64.b64decode(content_string)
-            df = pd.read_csv(io.StringIO(decoded.decode("utf-8")))
-            if df.columns[0] == "timestamp" and df.columns[1] == "steps":
-                pass  # CSV has header row
-            else:
-                # No header row: the app exports headerless CSVs, so the first
-                # line is genuine data. Re-read without skipping any rows.
-                df = pd.read_csv(io.StringIO(decoded.decode("utf-8")), names=["timestamp", "steps"])
-            # Convert datetime column into datetime type
-            df["timestamp"] = pd.to_datetime(df["timestamp"])
-            return df
-
         if merge_btn and merge_contents:
             try:
-                dfs = [read_csv(content) for content in merge_contents]
-                # Keep only non-empty datasets, ordered by start time.
-                dfs = [d for d in dfs if not d.empty]
-                dfs.sort(key=lambda d: d["timestamp"].min())
-
-                # Merge by interval: the earlier dataset owns its whole time
-                # range, and each later dataset contributes only the portion
-                # after the previous data ends. This resolves overlaps without
-                # relying on exact-matching timestamps (the 5-minute grids may
-                # be phase-shifted between datasets) and never double-counts an
-                # overlapping period.
-                has_overlap = False
-                pieces = []
-                running_end = None
-                for d in dfs:
-                    if running_end is not None:
-                        if d["timestamp"].min() <= running_end:
-                            has_overlap = True
-                        d = d[d["timestamp"] > running_end]
-                    if d.empty:
-                        continue
-                    pieces.append(d)
-                    end = d["timestamp"].max()
-                    running_end = end if running_end is None else max(running_end, end)
-
-                merge_df = pd.concat(pieces, ignore_index=True)
-                merge_df["timestamp"] = pd.to_datetime(merge_df["timestamp"])
-                merge_df = merge_df.sort_values("timestamp").reset_index(drop=True)
-
-                start_dt = merge_df["timestamp"].min().strftime("%Y-%m-%d")
-                end_dt = merge_df["timestamp"].max().strftime("%Y-%m-%d")
+                dfs = [read_upload(content, name) for content, name in zip(merge_contents, merge_filenames)]
+                # Earlier datasets own their time range; overlaps are dropped from later ones
+                merge = merge_datasets(dfs)
+
+                start_dt = merge["start"].strftime("%Y-%m-%d")
+                end_dt = merge["end"].strftime("%Y-%m-%d")
 
                 base_uid = merge_filenames[0].split("_")[0]
-                file_name = f"{base_uid}_merged_{start_dt}_{end_dt}.csv"
+                file_name = f"{base_uid}_merged_{start_dt}_{end_dt}"
 
             # Add error message when failure to download.
             except Exception as e:
@@ -655,20 +676,25 @@ def register_index_callbacks():
                 return None, error_status
 
             else:
-                if has_overlap:
+                if merge["has_overlap"]:
                     file_status = html.Div(
-                        f"Download Complete — merged {len(dfs)} files (note: some "
+                        f"Download Complete — merged {merge['files']} files (note: some "
                         "files overlap in time; duplicate timestamps were removed).",
                         style={"color": "darkorange", "margin-left": "15px"}
                     )
                 else:
                     file_status = html.Div(
-                        f"Download Complete — merged {len(dfs)} files.",
+                        f"Download Complete — merged {merge['files']} files.",
                         style={"color": "mediumseagreen", "margin-left": "15px"}
                     )
                 # Browser based download
+                if merge_filetype == "binary":
+                    return (
+                        dcc.send_bytes(write_binary(merged_frame(merge)), file_name + BINARY_EXTENSION),
+                        file_status
+                    )
                 return (
-                    dcc.send_data_frame(merge_df.to_csv, file_name, index=False, header=False),
+                    dcc.send_bytes(lambda f: write_csv(merge, f), file_name + ".csv"),
                     file_status
                 )
 
@@ -686,21 +712,3 @@ def register_index_callbacks():
         is_open: modal open state
         """
         return json.dumps({"is_open": is_open})
-
-    @app.callback(
-            Output("action-modal-status", "children"),
-            Input("action-modal-open-state", "data"),
-            prevent_initial_call=True
-    )
-    def manage_arduino_connection(json_data):
-        """
-        Terminate the Arduino connection if the modal is closed
-
-        json_data: json wrapping "is_open"
-        """
-        data = json.loads(json_data)
-
-        if data and not data["is_open"]:
-            arduino.disconnect_arduino()
-            print("Arduino serial connection disconnected")
-        return None
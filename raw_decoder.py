@@ -0,0 +1,65 @@
+"""
+Decoder for the device's binary (.RAW) download
+
+The "t" transfer sends the logger's data file as-is: a sequence of fixed-size
+little-endian records, one per 5-minute interval, each holding the interval's
+start as epoch seconds (the same "<Q" encoding the app sends when initializing
+the device) followed by the step count. Decoding is a single
+numpy.frombuffer over the whole file, so a .RAW download can be analysed
+without the device's slow text rendering.
+
+Files that do not look like a data file (a partial record, timestamps outside
+the device's plausible clock range or out of order, step counts no 5-minute
+interval can hold) are rejected with a ValueError rather than decoded into
+nonsense.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+RAW_EXTENSION = ".raw"
+
+# Layout of one record in the device's data file (packed, no padding)
+RAW_RECORD_DTYPE = np.dtype([("timestamp", "<u8"), ("steps", "<u2")])
+
+# Timestamps of records that were never written (erased flash reads as all ones)
+_BLANK_TIMESTAMPS = (0, np.iinfo(np.uint64).max)
+
+# Plausible record timestamps: from 2000-01-01 up to a day past the current
+# time (the device clock holds local wall-clock time as epoch seconds)
+MIN_RECORD_EPOCH = 946684800
+CLOCK_MARGIN_SECONDS = 24 * 60 * 60
+
+# Most steps one 5-minute record can hold (10 steps per second throughout)
+MAX_RECORD_STEPS = 3000
+
+def decode_raw(data):
+    """
+    Decode the content of a .RAW download into a timestamp/steps dataframe.
+    Raises ValueError when the content is not a valid data file.
+
+    data: raw file content (bytes)
+    """
+    if len(data) % RAW_RECORD_DTYPE.itemsize:
+        raise ValueError(f"File ends with {len(data) % RAW_RECORD_DTYPE.itemsize} bytes of a partial record "
+                         "(incomplete download?)")
+    records = np.frombuffer(data, dtype=RAW_RECORD_DTYPE)
+
+    valid = ~np.isin(records["timestamp"], _BLANK_TIMESTAMPS)
+    if not valid.all():
+        records = records[valid]
+
+    timestamps = records["timestamp"]
+    if len(timestamps):
+        latest = int(time.time()) + CLOCK_MARGIN_SECONDS
+        if timestamps.min() < MIN_RECORD_EPOCH or timestamps.max() > latest:
+            raise ValueError("Record timestamps are outside the device's clock range (not a .RAW data file?)")
+        if np.any(timestamps[1:] < timestamps[:-1]):
+            raise ValueError("Record timestamps are out of order (corrupt .RAW data file?)")
+        if records["steps"].max() > MAX_RECORD_STEPS:
+            raise ValueError(f"Record step counts exceed {MAX_RECORD_STEPS} per interval (corrupt .RAW data file?)")
+
+    # The device keeps wall-clock time as epoch seconds, so the result stays naive like the CSV export
+    timestamps = records["timestamp"].astype(np.int64).astype("datetime64[s]").astype("datetime64[ns]")
+    return pd.DataFrame({"timestamp": timestamps, "steps": records["steps"].astype(np.int64)})
@@ -0,0 +1,180 @@
+"""
+Chunked uploads received straight to disk
+
+dcc.Upload hands a callback the whole file as one base64 string, so a large
+file is held in memory several times over (base64, decoded bytes, text) before
+it is even parsed. Upload boxes marked "chunked-upload" instead send the file
+to the server in pieces (see assets/chunked_upload.js and the /upload routes
+in app.py). Each piece is appended to a temporary file and hashed as it
+arrives; once complete, the browser sets the upload's contents to a short
+marker ("chunked:<upload id>") and data_io reads the dataset directly from
+the file.
+
+An interrupted upload is resumed from the number of bytes the server already
+holds. Finished files are kept for re-reads (e.g. repeated merges) until the
+app exits or MAX_UPLOAD_BYTES is exceeded; abandoned partial uploads expire.
+"""
+import atexit
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from threading import Lock
+
+# Prefix of the dcc.Upload contents standing for a chunked upload
+UPLOAD_PREFIX = "chunked:"
+
+# Largest piece accepted in one request
+MAX_CHUNK_BYTES = 16 * 1024 * 1024
+
+# Upper bound on the disk space held by finished uploads
+MAX_UPLOAD_BYTES = 4 * 1024 * 1024 * 1024
+
+# Partial uploads untouched for this long are discarded
+UPLOAD_EXPIRY_SECONDS = 60 * 60
+
+# Size of the reads when copying a request body to disk
+_COPY_BYTES = 1024 * 1024
+
+_uploads = {}
+_lock = Lock()
+_upload_dir = None
+
+def _remove_upload_dir():
+    """Delete the received files when the app exits."""
+    if _upload_dir is not None:
+        shutil.rmtree(_upload_dir, ignore_errors=True)
+
+def _upload_path(upload_id):
+    """Path of an upload's file in the temporary folder, created on first use."""
+    global _upload_dir
+    if _upload_dir is None:
+        _upload_dir = tempfile.mkdtemp(prefix="bji_uploads_")
+        atexit.register(_remove_upload_dir)
+    return os.path.join(_upload_dir, f"{upload_id}.part")
+
+def _discard(upload_id):
+    """Forget an upload and delete its file. Call with _lock held."""
+    entry = _uploads.pop(upload_id, None)
+    if entry is not None:
+        try:
+            os.remove(entry["path"])
+        except OSError:
+            pass
+
+def _prune():
+    """Drop expired partial uploads, then the oldest finished ones over budget. Call with _lock held."""
+    now = time.time()
+    for upload_id, entry in list(_uploads.items()):
+        if not entry["complete"] and now - entry["touched"] > UPLOAD_EXPIRY_SECONDS:
+            _discard(upload_id)
+    finished = sorted((e["touched"], i) for i, e in _uploads.items() if e["complete"])
+    total = sum(_uploads[i]["size"] for _, i in finished)
+    for _, upload_id in finished:
+        if total <= MAX_UPLOAD_BYTES:
+            break
+        total -= _uploads[upload_id]["size"]
+        _discard(upload_id)
+
+def start_upload(filename, size):
+    """
+    Register a new upload and return its status (see upload_status)
+
+    filename: name of the file being uploaded
+    size: total size of the file in bytes
+    """
+    size = int(size)
+    if size < 0:
+        raise ValueError("Invalid upload size")
+    upload_id = uuid.uuid4().hex
+    with _lock:
+        _prune()
+        path = _upload_path(upload_id)
+        open(path, "wb").close()
+        _uploads[upload_id] = {
+            "id": upload_id,
+            "filename": filename,
+            "size": size,
+            "received": 0,
+            "path": path,
+            "hash": hashlib.blake2b(digest_size=16),
+            "key": None,
+            "complete": size == 0,
+            "touched": time.time(),
+            "lock": Lock(),
+        }
+        if size == 0:
+            _uploads[upload_id]["key"] = _uploads[upload_id]["hash"].hexdigest()
+        return upload_status(upload_id)
+
+def upload_status(upload_id):
+    """
+    Progress of an upload as {upload_id, received, size, complete, marker},
+    or None for an unknown (or expired) upload
+
+    upload_id: id returned by start_upload
+    """
+    entry = _uploads.get(upload_id)
+    if entry is None:
+        return None
+    return {
+        "upload_id": upload_id,
+        "received": entry["received"],
+        "size": entry["size"],
+        "complete": entry["complete"],
+        "marker": UPLOAD_PREFIX + upload_id,
+    }
+
+def append_chunk(upload_id, offset, stream):
+    """
+    Append the bytes read from stream to an upload and return its status
+    (None for an unknown upload). Pieces must arrive in order: a piece not
+    starting at the number of bytes already received is ignored, and the
+    returned status tells the sender where to resume. Bytes are written as they are read, so a piece cut off
+    by a dropped connection still counts as far as it got.
+
+    upload_id: id returned by start_upload
+    offset: position of the piece in the file
+    stream: file-like object holding the piece (e.g. the request body)
+    """
+    entry = _uploads.get(upload_id)
+    if entry is None:
+        return None
+    with entry["lock"]:
+        if entry["complete"] or int(offset) != entry["received"]:
+            return upload_status(upload_id)
+        remaining = min(MAX_CHUNK_BYTES, entry["size"] - entry["received"])
+        with open(entry["path"], "ab") as f:
+            while remaining > 0:
+                data = stream.read(min(_COPY_BYTES, remaining))
+                if not data:
+                    break
+                f.write(data)
+                f.flush()
+                entry["hash"].update(data)
+                entry["received"] += len(data)
+                remaining -= len(data)
+        entry["touched"] = time.time()
+        if entry["received"] == entry["size"]:
+            entry["key"] = entry["hash"].hexdigest()
+            entry["complete"] = True
+        return upload_status(upload_id)
+
+def is_chunked(contents):
+    """Whether dcc.Upload contents is a chunked upload marker."""
+    return isinstance(contents, str) and contents.startswith(UPLOAD_PREFIX)
+
+def completed_upload(contents):
+    """
+    (path, content key) of the finished upload a marker stands for. Raises
+    ValueError when the upload is unknown, expired or incomplete.
+
+    contents: "chunked:<upload id>" marker
+    """
+    entry = _uploads.get(contents[len(UPLOAD_PREFIX):])
+    if entry is None or not entry["complete"]:
+        raise ValueError("Upload is no longer available, please select the file again")
+    entry["touched"] = time.time()
+    return entry["path"], entry["key"]
@@ -0,0 +1,182 @@
+"""
+Worker processes for per-series computations
+
+The comparison page runs the same computation for every loaded series. Under
+gevent all callbacks share one core, so those computations are farmed out to
+a pool of worker processes instead, and each result is cached with its
+dataset (see dataset_cache.get_derived) so it is computed once per series
+digest and argument set. Only the series without a cached result are sent to
+the pool; functions run there must be importable without Dash (see
+analytics).
+
+Datasets and results are handed over as pickle files in a temporary folder
+rather than through the pool's pipes: under gevent the server has a single OS
+thread, and a blocking write of a large message to a worker that is itself
+blocked writing its result back would deadlock both. Every message on the
+pipes is therefore only a file path. Hand-over files live only as long as
+the call that wrote them, and at most MAX_SPILL_BYTES of datasets are
+handed over at a time; beyond that, series are computed in-process.
+"""
+import atexit
+import os
+import pickle
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+
+from dataset_cache import get_derived, has_derived
+
+# Number of worker processes
+MAX_WORKERS = os.cpu_count() or 1
+
+# Upper bound on the disk space held by datasets handed over to the workers
+MAX_SPILL_BYTES = 1024 * 1024 * 1024
+
+_pool = None
+_pool_lock = Lock()
+_spill_dir = None
+_spill_bytes = 0
+
+def get_pool():
+    """The shared process pool, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+        return _pool
+
+def _reset_pool():
+    """Drop a pool whose workers died so the next call starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def _remove_spill_dir():
+    """Delete the hand-over folder when the app exits."""
+    if _spill_dir is not None:
+        shutil.rmtree(_spill_dir, ignore_errors=True)
+
+def _spill_path(name):
+    """Path of a hand-over file in the temporary folder, created on first use."""
+    global _spill_dir
+    with _pool_lock:
+        if _spill_dir is None:
+            _spill_dir = tempfile.mkdtemp(prefix="bji_workers_")
+            atexit.register(_remove_spill_dir)
+    return os.path.join(_spill_dir, name)
+
+def _spill_dataset(key, df):
+    """
+    Write df for the workers and return (file path, size), or None when
+    the hand-over space is used up (see MAX_SPILL_BYTES)
+    """
+    global _spill_bytes
+    size = int(df.memory_usage(index=True).sum())
+    with _pool_lock:
+        if _spill_bytes + size > MAX_SPILL_BYTES:
+            return None
+        _spill_bytes += size
+    path = _spill_path(f"{key}.{uuid.uuid4().hex}.pkl")
+    try:
+        with open(path, "wb") as f:
+            pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        _remove_spill(path, size)
+        raise
+    return path, size
+
+def _remove_spill(path, size):
+    """Delete a hand-over file and release its share of MAX_SPILL_BYTES."""
+    global _spill_bytes
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    with _pool_lock:
+        _spill_bytes -= size
+
+def _discard_result(future):
+    """Delete the result file of a worker call whose result is not needed."""
+    if not future.cancelled() and future.exception() is None:
+        try:
+            os.remove(future.result())
+        except OSError:
+            pass
+
+def _run(func, data_path, result_path, args):
+    """Worker side: load the dataset, compute func(df, *args) and store the result."""
+    with open(data_path, "rb") as f:
+        df = pickle.load(f)
+    with open(result_path, "wb") as f:
+        pickle.dump(func(df, *args), f, protocol=pickle.HIGHEST_PROTOCOL)
+    return result_path
+
+def _collect(result_path):
+    """Load a worker's result and delete its hand-over file."""
+    try:
+        with open(result_path, "rb") as f:
+            return pickle.load(f)
+    finally:
+        os.remove(result_path)
+
+def map_series(items, name, func, *args):
+    """
+    [func(df, *args) for every (key, df) in items], computed in the worker
+    pool and cached with each dataset under (name, *args). Cached results are
+    returned directly; a single missing result is computed in-process, where
+    starting a worker would cost more than it saves.
+
+    items: (dataset key, dataframe) pairs
+    name: name of the computation, part of the cache key
+    func: module-level function taking a timestamp/steps dataframe
+    args: further arguments of func, part of the cache key
+    """
+    derived = (name,) + args if args else name
+    missing = [(key, df) for key, df in items if not has_derived(key, derived)]
+
+    futures = {}
+    spills = []
+    if len(missing) > 1:
+        try:
+            pool = get_pool()
+            for key, df in missing:
+                spill = _spill_dataset(key, df)
+                if spill is None:
+                    break
+                spills.append(spill)
+                result_path = _spill_path(f"{uuid.uuid4().hex}.result")
+                futures[key] = pool.submit(_run, func, spill[0], result_path, args)
+        except (BrokenProcessPool, OSError, RuntimeError) as e:
+            print(f"Worker pool unavailable, computing in-process: {e}")
+            _reset_pool()
+            futures = {}
+
+    def build(key, df):
+        future = futures.pop(key, None)
+        if future is not None:
+            try:
+                return _collect(future.result())
+            except (BrokenProcessPool, OSError) as e:
+                print(f"Worker pool failed, computing in-process: {e}")
+                _reset_pool()
+        return func(df, *args)
+
+    results = []
+    try:
+        for key, df in items:
+            value = get_derived(key, derived, lambda df, key=key: build(key, df))
+            # The dataset was evicted meanwhile: nothing to cache it with
+            results.append(build(key, df) if value is None else value)
+    finally:
+        # Results cached meanwhile by another call are not collected here
+        for future in futures.values():
+            if not future.cancel():
+                future.add_done_callback(_discard_result)
+        for path, size in spills:
+            _remove_spill(path, size)
+    return results